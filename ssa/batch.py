@@ -0,0 +1,619 @@
+from argparse import ArgumentParser
+from asyncio import FIRST_COMPLETED, gather, run as run_async, wait, wrap_future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import dataclass, field
+from functools import cache
+from glob import glob, has_magic
+from io import StringIO
+from json import dumps, loads
+from os import cpu_count, devnull
+from pathlib import Path
+from subprocess import run
+from textwrap import indent
+from time import perf_counter
+
+from .builder import CFGBuilder, LoopMode, SSABackend
+from .cache import ResultCache, cache_key
+from .codegen import python_source
+from .graph import GraphBuilder
+from .interpreter import Heat, Profile, heat_map, interpret, write_profile
+from .irfile import SUFFIX as IR_SUFFIX, write_ir
+from .liveness import SSAForm
+from .passes import OPTIMIZE, PASSES
+from .profiling import Profiler, profiling, reset as reset_profiling
+from .render import TEXT_FORMATS, RenderJob, RenderPool, RenderResult
+from .stream import iter_records, write_jsonl
+
+
+@dataclass(frozen=True)
+class BatchOptions:
+    # Output formats of Graphviz, `raw` writes DOT text, `jsonl`
+    # streams statements as JSON Lines, `py` writes Python source
+    # translated out of SSA, `counts` runs the program and writes
+    # how often every block and edge ran and `ir` writes the graph in
+    # binary format of `IRFile`
+    output_formats: tuple[str, ...] = ("png",)
+    output_dir: Path | None = None
+    loop_mode: LoopMode = LoopMode.REVISIT
+    backend: SSABackend = SSABackend.STRUCTURED
+    form: SSAForm = SSAForm.MINIMAL
+    # Names of passes over basic blocks, see `PASSES`
+    passes: tuple[str, ...] = ()
+    cache_dir: Path | None = None
+    # Size limit of cache in bytes
+    cache_size: int | None = None
+    # Every file is profiled, spans are recorded with `trace`
+    profile: bool = False
+    trace: bool = False
+    # Graphs are colored by counts of a run of the program, runs stop
+    # when a block ran more than `run_limit` times
+    heat: bool = False
+    run_limit: int | None = None
+    # Processes that build top-level functions of every file,
+    # results are the same for any number of them
+    region_workers: int = 1
+
+    def builder_options(self) -> dict:
+        return {
+            "loop_mode": self.loop_mode,
+            "backend": self.backend,
+            "form": self.form,
+            "passes": self.passes,
+            "workers": self.region_workers,
+        }
+
+
+@dataclass
+class BatchResult:
+    path: Path
+    outputs: list[Path]
+    elapsed: float
+    error: str | None = None
+    cached: bool = False
+    # DOT text waiting to be rendered by Graphviz
+    dot: str | None = None
+    profile: Profiler | None = None
+    # Summaries of passes
+    reports: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def collect_inputs(patterns: list[str]) -> list[Path]:
+    # Files are taken as is, directories and globs are expanded to
+    # Python files, every file is taken once in the order of patterns
+    paths: dict[Path, None] = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if has_magic(pattern):
+            found = sorted(Path(item) for item in glob(pattern, recursive=True))
+        elif path.is_dir():
+            found = sorted(path.rglob("*.py"))
+        else:
+            found = [path]
+        for item in found:
+            if item.is_dir():
+                paths.update(dict.fromkeys(sorted(item.rglob("*.py"))))
+            else:
+                paths[item] = None
+    return list(paths)
+
+
+# Python source is not written over the input
+SUFFIXES = {
+    "raw": ".dot",
+    "py": ".ssa.py",
+    "counts": ".counts.json",
+    "ir": IR_SUFFIX,
+}
+
+
+def output_path(path: Path, options: BatchOptions, output_format: str) -> Path:
+    suffix = SUFFIXES.get(output_format, f".{output_format}")
+    if options.output_dir is None:
+        return path.with_suffix(suffix)
+    # Keep the layout of inputs under the output directory
+    relative = path.with_suffix(suffix)
+    if relative.is_absolute():
+        relative = relative.relative_to(relative.anchor)
+    return options.output_dir / Path(*(part for part in relative.parts if part != ".."))
+
+
+def write_output(dot: str, output: Path, output_format: str) -> None:
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if output_format == "raw":
+        output.write_text(dot, encoding="utf-8")
+    else:
+        run(
+            ["dot", f"-T{output_format}", "-o", str(output)],
+            input=dot.encode("utf-8"),
+            check=True,
+            capture_output=True,
+        )
+
+
+def write_records(builder: CFGBuilder, output: Path, options: BatchOptions) -> None:
+    # pylint: disable=unused-argument
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as file:
+        write_jsonl(iter_records(builder), file)
+
+
+def write_source(builder: CFGBuilder, output: Path, options: BatchOptions) -> None:
+    # pylint: disable=unused-argument
+    assert builder.lowered is not None
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(python_source(builder.lowered), encoding="utf-8")
+
+
+def write_binary(builder: CFGBuilder, output: Path, options: BatchOptions) -> None:
+    # pylint: disable=unused-argument
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("wb") as file:
+        write_ir(builder, file)
+
+
+def run_program(builder: CFGBuilder, options: BatchOptions) -> Profile:
+    # Output of the program does not mix with the report
+    assert builder.lowered is not None
+    with open(devnull, "w", encoding="utf-8") as output, redirect_stdout(output):
+        return interpret(builder.lowered, options.run_limit)
+
+
+def write_counts(builder: CFGBuilder, output: Path, options: BatchOptions) -> None:
+    profile = run_program(builder, options)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as file:
+        write_profile(profile, file)
+
+
+def graph_heat(builder: CFGBuilder, options: BatchOptions) -> Heat | None:
+    if not options.heat:
+        return None
+    assert builder.lowered is not None
+    return heat_map(builder.lowered, run_program(builder, options))
+
+
+def write_graph(builder: CFGBuilder, output: Path, options: BatchOptions) -> None:
+    # DOT text goes straight to the file
+    heat = graph_heat(builder, options)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as file:
+        GraphBuilder(builder, file, heat)
+
+
+# Text formats with their writers in the order they are written,
+# writers get the builder that is shared by all formats of the file
+WRITERS = {
+    "jsonl": write_records,
+    "py": write_source,
+    "counts": write_counts,
+    "ir": write_binary,
+}
+
+
+@cache
+def result_cache(directory: Path | None, max_bytes: int | None) -> ResultCache | None:
+    # One cache per process, so it knows how much this process wrote
+    return None if directory is None else ResultCache(directory, max_bytes)
+
+
+# Outputs of one file. The builder is made on first use and shared
+# by all formats, outputs found in the cache are not built again.
+class FileBuild:
+    def __init__(self, path: Path, options: BatchOptions) -> None:
+        self.path = path
+        self.options = options
+        self.cache = result_cache(options.cache_dir, options.cache_size)
+        self.source = b"" if self.cache is None else path.read_bytes()
+        self.__builder: CFGBuilder | None = None
+
+    @property
+    def builder(self) -> CFGBuilder:
+        if self.__builder is None:
+            self.__builder = CFGBuilder(self.path, **self.options.builder_options())
+        return self.__builder
+
+    @property
+    def cached(self) -> bool:
+        # Every output came from the cache
+        return self.cache is not None and self.__builder is None
+
+    def __key(self, name: str) -> str:
+        # Workers do not change results, so they are not a part of keys,
+        # runs of the program are only for counts and heat of graphs
+        builder_options = self.options.builder_options()
+        del builder_options["workers"]
+        runs: tuple = ()
+        if name == "counts" or name == "dot" and self.options.heat:
+            runs = (self.options.heat, self.options.run_limit)
+        return cache_key(self.source, name, *builder_options.values(), *runs)
+
+    def write(self, output_format: str, output: Path) -> None:
+        write = WRITERS[output_format]
+        if self.cache is None:
+            write(self.builder, output, self.options)
+            return
+        key = self.__key(output_format)
+        data = self.cache.get(key)
+        if data is None:
+            write(self.builder, output, self.options)
+            self.cache.put(key, output.read_bytes())
+        else:
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_bytes(data)
+
+    def dot(self) -> str:
+        key = self.__key("dot")
+        data = None if self.cache is None else self.cache.get(key)
+        if data is not None:
+            return data.decode("utf-8")
+        dot = StringIO()
+        GraphBuilder(self.builder, dot, graph_heat(self.builder, self.options))
+        if self.cache is not None:
+            self.cache.put(key, dot.getvalue().encode("utf-8"))
+        return dot.getvalue()
+
+    def reports(self) -> list[str]:
+        # Passes ran once, so reports of all formats are the same
+        if not self.options.passes:
+            return []
+        key = self.__key("reports")
+        if self.__builder is None and self.cache is not None:
+            data = self.cache.get(key)
+            if data is not None:
+                return loads(data)
+        reports = [report.summary() for report in self.builder.reports]
+        if self.cache is not None:
+            self.cache.put(key, dumps(reports).encode("utf-8"))
+        return reports
+
+
+def graph_formats(options: BatchOptions) -> list[str]:
+    return [fmt for fmt in options.output_formats if fmt not in TEXT_FORMATS]
+
+
+def process_file(path: Path, options: BatchOptions) -> BatchResult:
+    if not options.profile:
+        return _process_file(path, options)
+    with profiling(trace=options.trace) as profiler:
+        with profiler.phase("file", path=str(path)):
+            result = _process_file(path, options)
+    result.profile = profiler
+    return result
+
+
+def _process_file(path: Path, options: BatchOptions) -> BatchResult:
+    # Text formats are written here, DOT text for Graphviz
+    # is returned and rendered by the main process
+    start = perf_counter()
+    outputs: list[Path] = []
+    dot = None
+    try:
+        # Source is read for keys of the cache, so missing files fail here
+        file = FileBuild(path, options)
+        for output_format in WRITERS:
+            if output_format in options.output_formats:
+                outputs.append(output_path(path, options, output_format))
+                file.write(output_format, outputs[-1])
+        rendered = graph_formats(options)
+        raw = "raw" in options.output_formats
+        if raw and file.cache is None and not rendered:
+            outputs.append(output_path(path, options, "raw"))
+            write_graph(file.builder, outputs[-1], options)
+        elif raw or rendered:
+            dot = file.dot()
+            if raw:
+                outputs.append(output_path(path, options, "raw"))
+                write_output(dot, outputs[-1], "raw")
+            if not rendered:
+                dot = None
+        reports = file.reports()
+    except Exception as exc:  # pylint: disable=broad-except
+        # Bad file must not stop the rest of the batch
+        return BatchResult(
+            path, outputs, perf_counter() - start, f"{type(exc).__name__}: {exc}"
+        )
+    return BatchResult(
+        path,
+        outputs,
+        perf_counter() - start,
+        cached=file.cached,
+        dot=dot,
+        reports=reports,
+    )
+
+
+def process_chunk(paths: list[Path], options: BatchOptions) -> list[BatchResult]:
+    return [process_file(path, options) for path in paths]
+
+
+def run_batch(
+    paths: list[Path],
+    options: BatchOptions,
+    *,
+    workers: int | None = None,
+    chunksize: int = 1,
+    render_workers: int | None = None,
+    render_timeout: float | None = None,
+) -> list[BatchResult]:
+    renderer = RenderPool(render_workers, timeout=render_timeout)
+    results = run_async(_build_and_render(paths, options, workers, chunksize, renderer))
+    if options.cache_dir is not None and options.cache_size is not None:
+        ResultCache(options.cache_dir, options.cache_size).evict()
+    add_renders(results, renderer.results)
+    order = {path: i for i, path in enumerate(paths)}
+    results.sort(key=lambda result: order[result.path])
+    return results
+
+
+async def _build_and_render(
+    paths: list[Path],
+    options: BatchOptions,
+    workers: int | None,
+    chunksize: int,
+    renderer: RenderPool,
+) -> list[BatchResult]:
+    # Graphs are rendered while the rest of files are still built
+    results: list[BatchResult] = []
+    chunks = [paths[i : i + chunksize] for i in range(0, len(paths), chunksize)]
+    # Files of chunks that failed because a worker crashed
+    unfinished: list[Path] = []
+    async with renderer:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=reset_profiling
+        ) as executor:
+            pending = {
+                wrap_future(executor.submit(process_chunk, chunk, options)): chunk
+                for chunk in chunks
+            }
+            while pending:
+                done, _ = await wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = pending.pop(future)
+                    try:
+                        finished = future.result()
+                    except BrokenProcessPool:
+                        unfinished.extend(chunk)
+                        continue
+                    results.extend(finished)
+                    for result in finished:
+                        await submit_renders(renderer, result, options)
+        if unfinished:
+            await _build_alone(unfinished, options, workers, renderer, results)
+    return results
+
+
+async def _build_alone(
+    paths: list[Path],
+    options: BatchOptions,
+    workers: int | None,
+    renderer: RenderPool,
+    results: list[BatchResult],
+) -> None:
+    # Crash of one worker fails every file of the pool, so these files
+    # are built again one at a time by pools of one process. Crash is
+    # then the fault of the file, the pool is made again after it.
+    queue = paths[::-1]
+
+    async def build() -> None:
+        while queue:
+            with ProcessPoolExecutor(
+                max_workers=1, initializer=reset_profiling
+            ) as executor:
+                while queue:
+                    path = queue.pop()
+                    try:
+                        [result] = await wrap_future(
+                            executor.submit(process_chunk, [path], options)
+                        )
+                    except BrokenProcessPool as exc:
+                        results.append(
+                            BatchResult(path, [], 0.0, f"worker crashed: {exc}")
+                        )
+                        break
+                    results.append(result)
+                    await submit_renders(renderer, result, options)
+
+    lanes = min(workers or cpu_count() or 1, len(paths))
+    await gather(*(build() for _ in range(lanes)))
+
+
+async def submit_renders(
+    renderer: RenderPool, result: BatchResult, options: BatchOptions
+) -> None:
+    if result.dot is None:
+        return
+    for fmt in graph_formats(options):
+        output = output_path(result.path, options, fmt)
+        await renderer.submit(RenderJob(result.dot, output, fmt, result.path))
+    result.dot = None
+
+
+def add_renders(results: list[BatchResult], renders: list[RenderResult]) -> None:
+    by_path = {result.path: result for result in results}
+    for render in renders:
+        assert render.job.source is not None
+        result = by_path[render.job.source]
+        result.elapsed += render.elapsed
+        if render.ok:
+            result.outputs.append(render.job.output)
+        else:
+            error = f"{render.job.output_format}: {render.error}"
+            result.error = error if result.error is None else f"{result.error}; {error}"
+
+
+def print_reports(results: list[BatchResult]) -> None:
+    for result in results:
+        if result.reports:
+            print(f"{result.path}:")
+            for report in result.reports:
+                print(indent(report, "  "))
+
+
+def print_summary(results: list[BatchResult], elapsed: float) -> None:
+    failures = [result for result in results if not result.ok]
+    for result in failures:
+        print(f"FAILED {result.path}: {result.error}")
+    busy = sum(result.elapsed for result in results)
+    cached = sum(result.cached for result in results)
+    print(
+        f"{len(results)} files: {len(results) - len(failures)} succeeded, "
+        f"{len(failures)} failed, {cached} cached in {elapsed:.2f}s "
+        f"({busy:.2f}s of work)"
+    )
+
+
+def parse_args(args: list[str] | None = None):
+    parser = ArgumentParser(
+        prog="ssa", description="Build SSA control flow graphs of Python files."
+    )
+    parser.add_argument("inputs", nargs="+", help="files, directories or globs")
+    parser.add_argument("-o", "--output-dir", type=Path, default=None)
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=lambda value: tuple(value.split(",")),
+        default=("png",),
+        dest="output_formats",
+        help="comma separated output formats, e.g. png,svg,raw,py,counts,ir",
+    )
+    parser.add_argument("-j", "--workers", type=int, default=cpu_count())
+    parser.add_argument("--chunksize", type=int, default=1)
+    parser.add_argument(
+        "--region-workers",
+        type=int,
+        default=1,
+        help="processes that build top-level functions of every file",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=cpu_count(),
+        help="processes of Graphviz run at once",
+    )
+    parser.add_argument(
+        "--render-timeout", type=float, default=None, help="in seconds per output"
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="print times of phases and counters"
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        help="write Chrome trace of phases and statements, implies --profile",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=None)
+    parser.add_argument(
+        "--cache-size", type=int, default=None, help="cache size limit in megabytes"
+    )
+    parser.add_argument(
+        "--loop-mode",
+        choices=[mode.name.lower() for mode in LoopMode],
+        default=LoopMode.REVISIT.name.lower(),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=[backend.name.lower() for backend in SSABackend],
+        default=SSABackend.STRUCTURED.name.lower(),
+    )
+    parser.add_argument(
+        "--passes",
+        type=lambda value: tuple(value.split(",")),
+        default=(),
+        help="comma separated passes over basic blocks: " + ",".join(PASSES),
+    )
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_const",
+        const=OPTIMIZE,
+        dest="passes",
+        help="run " + ",".join(OPTIMIZE),
+    )
+    parser.add_argument(
+        "--report", action="store_true", help="print what every pass changed"
+    )
+    parser.add_argument(
+        "--heat",
+        action="store_true",
+        help="run every program and color graphs by how often blocks ran",
+    )
+    parser.add_argument(
+        "--run-limit",
+        type=int,
+        default=None,
+        help="stop a run when a block ran more than this many times",
+    )
+    parser.add_argument(
+        "--ssa-form",
+        choices=[form.name.lower() for form in SSAForm],
+        default=SSAForm.MINIMAL.name.lower(),
+        help="pruned forms place phis only for live variables",
+    )
+    arguments = parser.parse_args(args)
+    for name in arguments.passes:
+        if name not in PASSES:
+            parser.error(f"unknown pass {name!r}, choose from {', '.join(PASSES)}")
+    if arguments.backend == SSABackend.STRUCTURED.name.lower():
+        if arguments.passes:
+            parser.error("passes need dominance_frontier or on_the_fly backend")
+        if "py" in arguments.output_formats:
+            parser.error("py format needs dominance_frontier or on_the_fly backend")
+        if "counts" in arguments.output_formats or arguments.heat:
+            parser.error("runs need dominance_frontier or on_the_fly backend")
+    elif arguments.region_workers > 1:
+        parser.error("region workers need structured backend")
+    return arguments
+
+
+def main(args: list[str] | None = None) -> int:
+    arguments = parse_args(args)
+    options = BatchOptions(
+        output_formats=arguments.output_formats,
+        output_dir=arguments.output_dir,
+        loop_mode=LoopMode[arguments.loop_mode.upper()],
+        backend=SSABackend[arguments.backend.upper()],
+        form=SSAForm[arguments.ssa_form.upper()],
+        passes=arguments.passes,
+        cache_dir=arguments.cache_dir,
+        cache_size=(
+            None if arguments.cache_size is None else arguments.cache_size << 20
+        ),
+        profile=arguments.profile or arguments.trace is not None,
+        trace=arguments.trace is not None,
+        heat=arguments.heat,
+        run_limit=arguments.run_limit,
+        region_workers=arguments.region_workers,
+    )
+    paths = collect_inputs(arguments.inputs)
+
+    start = perf_counter()
+    # Rendering runs in this process and is recorded
+    # by this profiler, files are recorded by workers
+    profiler = Profiler(trace=options.trace)
+    with profiling(profiler) if options.profile else nullcontext():
+        results = run_batch(
+            paths,
+            options,
+            workers=arguments.workers,
+            chunksize=arguments.chunksize,
+            render_workers=arguments.render_workers,
+            render_timeout=arguments.render_timeout,
+        )
+    print_summary(results, perf_counter() - start)
+    if arguments.report:
+        print_reports(results)
+    if options.profile:
+        for result in results:
+            if result.profile is not None:
+                profiler.merge(result.profile)
+        print(profiler.report())
+    if arguments.trace is not None:
+        profiler.write_trace(arguments.trace)
+    return 0 if all(result.ok for result in results) else 1
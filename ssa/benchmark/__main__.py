@@ -0,0 +1,7 @@
+from sys import exit
+
+from .main import main
+
+
+if __name__ == "__main__":
+    exit(main())
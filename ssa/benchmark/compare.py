@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from typing import Any
+
+# Metrics of every phase that are compared
+METRICS = ("seconds", "peak_bytes")
+
+
+@dataclass
+class Change:
+    case: str
+    phase: str
+    metric: str
+    before: float
+    after: float
+
+    @property
+    def ratio(self) -> float:
+        return self.after / self.before if self.before else float("inf")
+
+
+def compare(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    *,
+    threshold: float = 0.1,
+    min_seconds: float = 1e-3,
+) -> tuple[list[Change], list[Change]]:
+    # Regressions and improvements beyond `threshold`. Times shorter
+    # than `min_seconds` in both runs are noise and are not compared.
+    # Cases missing from either run are skipped.
+    regressions: list[Change] = []
+    improvements: list[Change] = []
+    for case, before in baseline["cases"].items():
+        after = current["cases"].get(case)
+        if after is None:
+            continue
+        for phase, old in before["phases"].items():
+            new = after["phases"].get(phase)
+            if new is None:
+                continue
+            for metric in METRICS:
+                if metric == "seconds" and max(old[metric], new[metric]) < min_seconds:
+                    continue
+                change = Change(case, phase, metric, old[metric], new[metric])
+                if change.ratio > 1 + threshold:
+                    regressions.append(change)
+                elif change.ratio < 1 / (1 + threshold):
+                    improvements.append(change)
+    return regressions, improvements
+
+
+def format_change(change: Change) -> str:
+    if change.metric == "seconds":
+        values = f"{change.before * 1e3:.2f} ms -> {change.after * 1e3:.2f} ms"
+    else:
+        values = f"{change.before / 1024:.0f} KiB -> {change.after / 1024:.0f} KiB"
+    return (
+        f"{change.case:<12} {change.phase:<8} {change.metric:<10} "
+        f"{values} ({change.ratio:.2f}x)"
+    )
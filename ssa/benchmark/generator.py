@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from random import Random
+
+
+@dataclass(frozen=True)
+class ProgramShape:
+    # Assignments in every straight-line run
+    statements: int = 20
+    variables: int = 8
+    if_depth: int = 1
+    # Nested loops alternate `while` and `for ... in range()`
+    loop_depth: int = 1
+    functions: int = 0
+    # Chance that loop body has `if ...: break` or `if ...: continue`
+    jump_density: float = 0.0
+    seed: int = 0
+
+
+# Programs use only constructs `CFGBuilder` supports. Branches of `if`
+# are nested up to `if_depth` and loop bodies up to `loop_depth`, both
+# kinds of nesting are independent, so size of program grows linearly
+# with loop depth and exponentially with `if` depth.
+class ProgramGenerator:
+    def __init__(self, shape: ProgramShape) -> None:
+        self.shape = shape
+        self.random = Random(shape.seed)
+        self.names = [f"v{i}" for i in range(max(1, shape.variables))]
+        self.lines: list[str] = []
+        self.loops = 0
+
+    def generate(self) -> str:
+        for i, name in enumerate(self.names):
+            self.__emit(0, f"{name} = {i}")
+        for i in range(self.shape.functions):
+            parameters = self.random.sample(self.names, min(2, len(self.names)))
+            self.__emit(0, f"def f{i}({', '.join(parameters)}):")
+            self.__block(1, self.shape.if_depth, self.shape.loop_depth, False)
+            self.__emit(1, f"return {self.__name()}")
+        self.__block(0, self.shape.if_depth, self.shape.loop_depth, False)
+        for i in range(self.shape.functions):
+            self.__emit(0, f"{self.__name()} = f{i}({self.__name()}, {self.__name()})")
+        return "\n".join(self.lines) + "\n"
+
+    def __emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def __name(self) -> str:
+        return self.random.choice(self.names)
+
+    def __operand(self) -> str:
+        if self.random.random() < 0.25:
+            return str(self.random.randint(1, 9))
+        return self.__name()
+
+    def __condition(self) -> str:
+        operator = self.random.choice(("<", ">", "<=", ">=", "==", "!="))
+        return f"{self.__name()} {operator} {self.__operand()}"
+
+    def __straight(self, indent: int, count: int) -> None:
+        for _ in range(count):
+            operator = self.random.choice(("+", "-", "*"))
+            expression = f"{self.__name()} {operator} {self.__operand()}"
+            self.__emit(indent, f"{self.__name()} = {expression}")
+
+    def __block(self, indent: int, if_depth: int, loop_depth: int, in_loop: bool):
+        # Every block has at least one statement, so no body is empty
+        half = self.shape.statements // 2
+        self.__straight(indent, max(1, half))
+        if if_depth > 0:
+            self.__emit(indent, f"if {self.__condition()}:")
+            self.__block(indent + 1, if_depth - 1, 0, in_loop)
+            self.__emit(indent, "else:")
+            self.__block(indent + 1, if_depth - 1, 0, in_loop)
+        if loop_depth > 0:
+            if loop_depth % 2:
+                self.__emit(indent, f"while {self.__name()} < {self.__operand()}:")
+            else:
+                self.__emit(indent, f"for i{self.loops} in range({self.__operand()}):")
+                self.loops += 1
+            self.__block(indent + 1, 0, loop_depth - 1, True)
+        if in_loop and self.random.random() < self.shape.jump_density:
+            self.__emit(indent, f"if {self.__condition()}:")
+            self.__emit(indent + 1, self.random.choice(("break", "continue")))
+        self.__straight(indent, self.shape.statements - half)
+
+
+def generate(shape: ProgramShape) -> str:
+    return ProgramGenerator(shape).generate()
@@ -0,0 +1,111 @@
+from argparse import ArgumentParser
+from dataclasses import fields
+from json import dumps, loads
+from pathlib import Path
+
+from ..builder import LoopMode, SSABackend
+from .compare import compare, format_change
+from .generator import ProgramShape, generate
+from .runner import PHASES, SUITES, PhaseResult, run_suite
+
+
+def print_header() -> None:
+    print(f"{'case':<12}" + "".join(f"{phase:>24}" for phase in PHASES))
+
+
+def print_case(name: str, phases: dict[str, PhaseResult]) -> None:
+    columns = "".join(
+        f"{result.seconds * 1e3:>11.2f} ms{result.peak_bytes / 1024:>7.0f} KiB"
+        for result in phases.values()
+    )
+    print(f"{name:<12}{columns}")
+
+
+def parse_args(args: list[str] | None = None):
+    parser = ArgumentParser(
+        prog="ssa.benchmark",
+        description="Benchmark stages of the builder on generated programs.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run a suite and save results as JSON")
+    run.add_argument("-o", "--output", type=Path, default=None)
+    run.add_argument("-s", "--suite", choices=list(SUITES), default="default")
+    run.add_argument("-r", "--repeat", type=int, default=5)
+    run.add_argument(
+        "--loop-mode",
+        choices=[mode.name.lower() for mode in LoopMode],
+        default=LoopMode.REVISIT.name.lower(),
+    )
+    run.add_argument(
+        "--backend",
+        choices=[backend.name.lower() for backend in SSABackend],
+        default=SSABackend.STRUCTURED.name.lower(),
+    )
+
+    program = commands.add_parser("generate", help="print a generated program")
+    for field in fields(ProgramShape):
+        program.add_argument(
+            f"--{field.name.replace('_', '-')}",
+            type=type(field.default),
+            default=field.default,
+        )
+
+    check = commands.add_parser(
+        "compare", help="compare results, exit with 1 on regressions"
+    )
+    check.add_argument("baseline", type=Path)
+    check.add_argument("current", type=Path)
+    check.add_argument(
+        "-t", "--threshold", type=float, default=0.1, help="0.1 allows 10%% slowdown"
+    )
+    check.add_argument(
+        "--min-seconds",
+        type=float,
+        default=1e-3,
+        help="shorter times are not compared",
+    )
+    return parser.parse_args(args)
+
+
+def main(args: list[str] | None = None) -> int:
+    arguments = parse_args(args)
+    match arguments.command:
+        case "generate":
+            shape = ProgramShape(
+                **{
+                    field.name: getattr(arguments, field.name)
+                    for field in fields(ProgramShape)
+                }
+            )
+            print(generate(shape), end="")
+        case "run":
+            print_header()
+            results = run_suite(
+                SUITES[arguments.suite],
+                repeat=arguments.repeat,
+                loop_mode=LoopMode[arguments.loop_mode.upper()],
+                backend=SSABackend[arguments.backend.upper()],
+                progress=print_case,
+            )
+            if arguments.output is not None:
+                arguments.output.write_text(dumps(results, indent=2) + "\n")
+        case "compare":
+            regressions, improvements = compare(
+                loads(arguments.baseline.read_text()),
+                loads(arguments.current.read_text()),
+                threshold=arguments.threshold,
+                min_seconds=arguments.min_seconds,
+            )
+            for title, changes in (
+                ("Regressions", regressions),
+                ("Improvements", improvements),
+            ):
+                if changes:
+                    print(f"{title}:")
+                    for change in changes:
+                        print(f"  {format_change(change)}")
+            if not regressions:
+                print("No regressions")
+            return 1 if regressions else 0
+    return 0
@@ -0,0 +1,146 @@
+from ast import parse
+from dataclasses import asdict, dataclass
+from gc import collect, disable, enable, isenabled
+from io import StringIO
+from pathlib import Path
+from platform import python_version
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, reset_peak, start, stop
+from typing import Any, Callable
+
+from ..builder import CFGBuilder, LoopMode, SSABackend
+from ..graph import GraphBuilder
+from .generator import ProgramShape, generate
+
+# Changes whenever layout of results changes
+RESULTS_FORMAT = 1
+# `builder` gets the tree of `parse`, so parsing is timed only once
+PHASES = ("parse", "builder", "graph")
+
+SUITES: dict[str, dict[str, ProgramShape]] = {
+    "quick": {
+        "straight": ProgramShape(statements=200, if_depth=0, loop_depth=0),
+        "ifs": ProgramShape(statements=4, if_depth=4, loop_depth=0),
+        "loops": ProgramShape(statements=4, if_depth=0, loop_depth=2),
+        "functions": ProgramShape(statements=4, functions=10),
+    },
+    "default": {
+        "straight": ProgramShape(statements=2000, if_depth=0, loop_depth=0),
+        "variables": ProgramShape(statements=1000, variables=500, loop_depth=0),
+        "ifs": ProgramShape(statements=8, if_depth=8, loop_depth=0),
+        "loops": ProgramShape(statements=8, if_depth=0, loop_depth=4),
+        "jumps": ProgramShape(statements=8, loop_depth=4, jump_density=0.8),
+        "functions": ProgramShape(statements=8, if_depth=2, functions=30),
+        "mixed": ProgramShape(
+            statements=16, variables=32, if_depth=3, loop_depth=3, functions=6
+        ),
+    },
+}
+
+
+@dataclass
+class PhaseResult:
+    # Best and median time of all repeats
+    seconds: float
+    median: float
+    peak_bytes: int
+
+
+def timed(function: Callable[[Any], Any], argument: Any) -> tuple[float, Any]:
+    # Garbage collector is off while timed, like in `timeit`
+    collect()
+    enabled = isenabled()
+    disable()
+    try:
+        begin = perf_counter()
+        value = function(argument)
+        return perf_counter() - begin, value
+    finally:
+        if enabled:
+            enable()
+
+
+def measure(
+    path: Path,
+    *,
+    repeat: int = 5,
+    loop_mode: LoopMode = LoopMode.REVISIT,
+    backend: SSABackend = SSABackend.STRUCTURED,
+) -> tuple[dict[str, PhaseResult], int]:
+    source = path.read_text(encoding="utf-8")
+    phases: dict[str, Callable[[Any], Any]] = {
+        "parse": lambda _: parse(source),
+        "builder": lambda tree: CFGBuilder(
+            path, loop_mode=loop_mode, backend=backend, tree=tree
+        ),
+        "graph": lambda builder: GraphBuilder(builder, StringIO()),
+    }
+
+    # Every phase gets result of the previous one
+    times: dict[str, list[float]] = {phase: [] for phase in PHASES}
+    builder = None
+    for _ in range(repeat):
+        value = None
+        for phase in PHASES:
+            elapsed, value = timed(phases[phase], value)
+            times[phase].append(elapsed)
+            if phase == "builder":
+                builder = value
+
+    # Memory is traced in a separate run, tracing slows down the code
+    peaks: dict[str, int] = {}
+    start()
+    try:
+        value = None
+        for phase in PHASES:
+            collect()
+            reset_peak()
+            current, _ = get_traced_memory()
+            value = phases[phase](value)
+            peaks[phase] = get_traced_memory()[1] - current
+    finally:
+        stop()
+
+    results = {
+        phase: PhaseResult(min(times[phase]), median(times[phase]), peaks[phase])
+        for phase in PHASES
+    }
+    assert builder is not None
+    return results, builder.counter
+
+
+def run_suite(
+    cases: dict[str, ProgramShape],
+    *,
+    repeat: int = 5,
+    loop_mode: LoopMode = LoopMode.REVISIT,
+    backend: SSABackend = SSABackend.STRUCTURED,
+    progress: Callable[[str, dict[str, PhaseResult]], None] | None = None,
+) -> dict[str, Any]:
+    results: dict[str, Any] = {
+        "format": RESULTS_FORMAT,
+        "python": python_version(),
+        "loop_mode": loop_mode.name.lower(),
+        "backend": backend.name.lower(),
+        "repeat": repeat,
+        "cases": {},
+    }
+    with TemporaryDirectory() as directory:
+        for name, shape in cases.items():
+            source = generate(shape)
+            path = Path(directory) / f"{name}.py"
+            path.write_text(source, encoding="utf-8")
+            phases, nodes = measure(
+                path, repeat=repeat, loop_mode=loop_mode, backend=backend
+            )
+            results["cases"][name] = {
+                "shape": asdict(shape),
+                "lines": source.count("\n"),
+                "nodes": nodes,
+                "phases": {phase: asdict(result) for phase, result in phases.items()},
+            }
+            if progress is not None:
+                progress(name, phases)
+    return results
@@ -0,0 +1,164 @@
+from collections import defaultdict
+from typing import Sequence
+
+from .defuse import DefUseIndex
+from .lowering import BlockBuilder, Block, Phi, Variable
+
+
+# Braun et al.: "Simple and Efficient Construction of Static Single
+# Assignment Form". Variables are resolved while the AST is visited:
+# local value numbering inside the block, lookup through predecessors
+# otherwise. Unsealed blocks (loop headers, loop exits) get incomplete
+# phis that are completed when the block is sealed. Trivial phis are
+# removed as soon as they are complete.
+class OnTheFlyBuilder(BlockBuilder):
+    def __init__(self, tree, passes: Sequence = ()) -> None:
+        self.current_def: dict[str, dict[int, Variable]] = defaultdict(dict)
+        self.incomplete_phis: dict[int, dict[str, Phi]] = defaultdict(dict)
+        # Phis by their target and phis that read them. Targets have
+        # own versions until `build_ssa` numbers definitions.
+        self.phi_index = DefUseIndex()
+        self.phi_versions: dict[str, int] = defaultdict(int)
+        self.replaced: dict[Variable, Variable] = {}
+        self.undefined: dict[str, Variable] = {}
+        super().__init__(tree, passes)
+
+    def read(self, name: str) -> Variable:
+        assert self.block is not None
+        value = self.read_variable(name, self.block._id)
+        self.uses.append(value)
+        return value
+
+    def write(self, name: str) -> Variable:
+        assert self.block is not None
+        value = Variable(name)
+        self.current_def[name][self.block._id] = value
+        return value
+
+    def seal_block(self, block: Block) -> None:
+        pending = list(self.incomplete_phis.pop(block._id, {}).values())
+        block.sealed = True
+        self.complete_phis(pending)
+
+    def find(self, value: Variable) -> Variable:
+        root = value
+        while root in self.replaced:
+            root = self.replaced[root]
+        # Path compression
+        while value is not root:
+            parent = self.replaced[value]
+            self.replaced[value] = root
+            value = parent
+        return root
+
+    def new_phi(self, name: str, block: Block) -> Phi:
+        self.phi_versions[name] += 1
+        phi = Phi(Variable(name, self.phi_versions[name]))
+        block.phis.append(phi)
+        self.phi_index.add(phi, block._id)
+        self.current_def[name][block._id] = phi.target
+        return phi
+
+    def lookup(self, name: str, block_id: int, pending: list[Phi]) -> Variable:
+        # Follow single predecessors without recursion, phis that
+        # need operands from several predecessors go to `pending`
+        definitions = self.current_def[name]
+        path = []
+        while block_id not in definitions:
+            block = self.blocks[block_id]
+            if not block.sealed:
+                phi = self.new_phi(name, block)
+                self.incomplete_phis[block_id][name] = phi
+                break
+            if len(block.predecessors) == 1:
+                path.append(block_id)
+                block_id = block.predecessors[0]
+                continue
+            if not block.predecessors:
+                definitions[block_id] = self.undefined_value(name)
+                break
+            pending.append(self.new_phi(name, block))
+            break
+        value = definitions[block_id]
+        for visited in path:
+            definitions[visited] = value
+        return value
+
+    def read_variable(self, name: str, block_id: int) -> Variable:
+        pending: list[Phi] = []
+        value = self.lookup(name, block_id, pending)
+        self.complete_phis(pending)
+        return self.find(value)
+
+    def undefined_value(self, name: str) -> Variable:
+        # Version `0` means that variable is not defined on this path
+        if name not in self.undefined:
+            self.undefined[name] = Variable(name)
+        return self.undefined[name]
+
+    def complete_phis(self, pending: list[Phi]) -> None:
+        completed = []
+        while pending:
+            phi = pending.pop()
+            name = phi.target.name
+            block_id = self.phi_index.defined_in(phi.target.operand)
+            assert block_id is not None
+            for predecessor in self.blocks[block_id].predecessors:
+                phi.operands.append(self.lookup(name, predecessor, pending))
+            self.phi_index.update(phi)
+            completed.append(phi)
+
+        worklist = completed
+        while worklist:
+            self.try_remove_trivial_phi(worklist.pop(), worklist)
+
+    def try_remove_trivial_phi(self, phi: Phi, worklist: list[Phi]) -> None:
+        if phi.target in self.replaced:
+            return
+        same = None
+        for operand in phi.operands:
+            operand = self.find(operand)
+            if operand is same or operand is phi.target:
+                continue
+            if same is not None:
+                return
+            same = operand
+        if same is None:
+            same = self.undefined_value(phi.target.name)
+
+        self.replaced[phi.target] = same
+        # Users read `same` from now on, so they are found
+        # when `same` is removed too
+        users = [user for _, user in self.phi_index.users(phi.target.operand)]
+        self.phi_index.remove(phi)
+        for user in users:
+            if user is not phi:
+                user.operands = [
+                    same if operand is phi.target else operand
+                    for operand in user.operands
+                ]
+                self.phi_index.update(user)
+                worklist.append(user)
+
+    def build_ssa(self) -> None:
+        counters: dict[str, int] = defaultdict(int)
+
+        def define(variable: Variable) -> None:
+            counters[variable.name] += 1
+            variable.version = counters[variable.name]
+
+        # Drop removed phis, resolve replaced values and number
+        # definitions in order of blocks, that is source order
+        for block in self.blocks:
+            block.phis = [phi for phi in block.phis if phi.target not in self.replaced]
+            for phi in block.phis:
+                define(phi.target)
+                phi.operands = [self.find(operand) for operand in phi.operands]
+            for instruction in block.instructions:
+                for variable in instruction.defs:
+                    define(variable)
+                instruction.uses = [self.find(value) for value in instruction.uses]
+                instruction.parts = [
+                    self.find(part) if isinstance(part, Variable) else part
+                    for part in instruction.parts
+                ]
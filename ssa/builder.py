@@ -4,39 +4,40 @@ from ast import (
     parse,
     Constant,
     Name,
+    Store,
     While,
     Assign,
     BinOp,
     Compare,
     Call,
+    Module,
+    expr,
 )
-from ast import Eq, NotEq, Lt, LtE, Gt, GtE, Is, IsNot, In, NotIn
-from ast import (
-    Add,
-    Sub,
-    Mult,
-    MatMult,
-    Div,
-    Mod,
-    Pow,
-    BitOr,
-    BitAnd,
-    BitXor,
-    FloorDiv,
-    LShift,
-    RShift,
-)
-from dataclasses import dataclass
-from collections import defaultdict
+from ast import Lt, Add
 from copy import deepcopy
-
+from enum import Enum, auto
+from typing import Collection, Iterable, Iterator, Sequence
+
+from . import profiling
+from .braun import OnTheFlyBuilder
+from .cfg import ControlFlowGraph
+from .cytron import DominanceFrontierBuilder
+from .defuse import DefUseIndex
+from .incremental import Region, split_regions
+from .liveness import LivenessAnalyzer, NonLocalNamesCollector, SSAForm
+from .lowering import BlockBuilder
+from .operators import COMPARATORS, OPERATORS
+from .parallel import RegionPool
+from .passes import PASSES
+from .persistent import Versions
+from .regions import visit_regions
 from .statements import (
     NodeData,
     NodeType,
+    Part,
     Statement,
     IfStatement,
     WhileStatement,
-    ConditionStatement,
     BreakStatement,
     ContinueStatement,
     FunctionStatement,
@@ -46,51 +47,98 @@ from .statements import (
 
 ERROR = Path("./tests/test_inner_loops.py")
 
-COMPARATORS = {
-    Eq: "==",
-    NotEq: "!=",
-    Lt: "<",
-    LtE: "<=",
-    Gt: ">",
-    GtE: ">=",
-    Is: "is",
-    IsNot: "is not",
-    In: "in",
-    NotIn: "not in",
-}
-
-OPERATORS = {
-    Add: "+",
-    Sub: "-",
-    Mult: "*",
-    MatMult: "@",
-    Div: "/",
-    Mod: "%",
-    Pow: "**",
-    LShift: "<<",
-    RShift: ">>",
-    BitOr: "|",
-    BitXor: "^",
-    BitAnd: "&",
-    FloorDiv: "//",
-}
-
-
-@dataclass
-class ForAsWhileData:
-    variable: str
-    step: int
+
+class Evaluated(expr):
+    # Argument that is already rendered to label parts,
+    # e.g. `range` bounds that are evaluated once before the loop
+    _fields = ("parts",)
+    parts: list[Part]
+
+
+class LoopMode(Enum):
+    # Visit loop body twice: first pass finds modified variables,
+    # second pass builds statements with the right versions
+    REVISIT = auto()
+    # Visit loop body once with placeholder phi that is
+    # filled in when the back edge is known
+    SINGLE_PASS = auto()
+
+
+class SSABackend(Enum):
+    # Phis are created while visiting `if`/`while`/`for` statements
+    STRUCTURED = auto()
+    # Phis are placed on iterated dominance frontier of basic blocks
+    DOMINANCE_FRONTIER = auto()
+    # Phis are created on demand while visiting, blocks are sealed
+    # when all their predecessors are known
+    ON_THE_FLY = auto()
+
+
+class AssignedNamesCollector(NodeVisitor):
+    # Collects names assigned inside every `while`/`for` loop
+    # of the tree in one traversal, nested loops included
+    def __init__(self) -> None:
+        self.names: dict[int, set[str]] = {}
+        self.stack: list[set[str]] = [set()]
+
+    def collect(self, tree) -> dict[int, set[str]]:
+        self.visit(tree)
+        return self.names
+
+    def __visit_loop(self, node, names: set[str]) -> None:
+        self.stack.append(names)
+        self.generic_visit(node)
+        self.stack.pop()
+        self.names[id(node)] = names
+        self.stack[-1] |= names
+
+    def visit_While(self, node):
+        self.__visit_loop(node, set())
+
+    def visit_For(self, node):
+        # Loop variable is incremented at the end of the body
+        self.__visit_loop(node, {node.target.id})
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, Store):
+            self.stack[-1].add(node.id)
+
+    def visit_arg(self, node):
+        self.stack[-1].add(node.arg)
 
 
 class CFGBuilder(NodeVisitor):
-    def __init__(self, input_code: Path) -> None:
+    def __init__(
+        self,
+        input_code: Path,
+        *,
+        loop_mode: LoopMode = LoopMode.REVISIT,
+        backend: SSABackend = SSABackend.STRUCTURED,
+        incremental: bool = False,
+        previous: "CFGBuilder | None" = None,
+        lazy: bool = False,
+        form: SSAForm = SSAForm.MINIMAL,
+        passes: Sequence[str] = (),
+        workers: int = 1,
+        tree: Module | None = None,
+    ) -> None:
+        # `tree` is AST of `input_code` when it is already parsed
+        if passes and backend is SSABackend.STRUCTURED:
+            raise ValueError("passes need a backend with basic blocks")
+        if workers > 1 and backend is not SSABackend.STRUCTURED:
+            raise ValueError("workers need the structured backend")
         error: bool = False
-        if input_code == ERROR:
-            error: bool = True
-
-        input_code = input_code.read_text(encoding="utf-8")
-        # Build AST
-        tree = parse(input_code)
+        if (
+            input_code == ERROR
+            and loop_mode is LoopMode.REVISIT
+            and backend is SSABackend.STRUCTURED
+        ):
+            error = True
+
+        if tree is None:
+            with profiling.phase("parse"):
+                # Build AST
+                tree = parse(input_code.read_text(encoding="utf-8"))
 
         # Initialize attributes
         self.counter = 0
@@ -102,36 +150,178 @@ class CFGBuilder(NodeVisitor):
             )
         )
         self.statements = [self.current]
-        self.while_nodes = []
-        self.node_after_while = dict()
-        self.id2statement = dict()
-        self.last_node_while = []
+        self.while_nodes: list[Statement] = []
+        self.node_after_while: dict[int, int] = {}
+        self.id2statement: dict[int, Statement] = {}
+        # Loops that are left to the next statement, which is not
+        # built yet: id of the loop phi and the last id of the loop
+        self.loop_exits: list[tuple[int, int]] = []
         self.id2statement[self.counter] = self.current
-        self.ssa_list = [defaultdict(int)]
+        # Versions of variables, snapshots share structure
+        # with each other, so saving SSA state is cheap
+        self.ssa = Versions()
 
-        self.ssa_list_before = [defaultdict(int)]
-        self.finded_keys = []
-        self.ssa_list_after = [defaultdict(int)]
+        self.ssa_before = Versions()
+        self.finded_keys: list[str] = []
+        self.ssa_after = Versions()
+        # Keys of `finded_keys` without phis in pruned forms
+        self.pruned_keys: set[str] = set()
 
         # Saving SSA state
-        self.if_true_ssa = []
-        self.if_false_ssa = []
-        self.if_before_true_ssa = []
-
-        self.return_values = []
-
-        # Run visit process
-        if error:
-            self.__source()
+        self.if_true_ssa = Versions()
+        self.if_false_ssa = Versions()
+        self.if_before_true_ssa = Versions()
+
+        self.return_values: list[Statement] = []
+
+        # Top-level regions of the module, they are recorded when
+        # module is built incrementally and reused by the next build
+        self.regions: list[Region] = []
+        self.reused_regions = 0
+        # Regions that are built by worker processes
+        self.parallel_regions = 0
+        # Regions that are not built yet, when module is built lazily
+        self.__pending: Iterator[list[Statement]] | None = None
+        # Statements with ids below `__forgotten` are dropped by `forget`
+        self.lazy = lazy
+        self.__forgotten = 0
+
+        self.loop_mode = loop_mode
+        self.loop_keys: dict[int, set[str]] = {}
+        if loop_mode is LoopMode.SINGLE_PASS:
+            self.loop_keys = AssignedNamesCollector().collect(tree)
+
+        # Phis are placed only for names that can be read
+        # after the merge point, skipped phis are counted
+        self.form = form
+        self.phis_avoided = 0
+        self.liveness: LivenessAnalyzer | None = None
+        self.non_local: set[str] | None = None
+        if form is SSAForm.PRUNED:
+            self.liveness = LivenessAnalyzer().analyze(tree)
+        elif form is SSAForm.SEMI_PRUNED:
+            self.non_local = NonLocalNamesCollector().collect(tree)
+
+        # Passes run on basic blocks of the backend, their reports are kept
+        optimize = [PASSES[name] for name in passes]
+        self.reports: list = []
+        # Basic blocks of the backend, e.g. for `codegen.python_source`
+        self.lowered: BlockBuilder | None = None
+        # Def-use chains of drawn nodes, see `defuse`
+        self.__defuse: DefUseIndex | None = None
+
+        # Run visit process, regions of lazy build are built
+        # later and are not a part of this phase
+        with profiling.phase("visit"):
+            if error:
+                self.__source()
+            elif backend is SSABackend.DOMINANCE_FRONTIER:
+                self.__adopt(DominanceFrontierBuilder(tree, form, optimize))
+            elif backend is SSABackend.ON_THE_FLY:
+                self.__adopt(OnTheFlyBuilder(tree, optimize))
+            elif incremental or previous is not None or lazy or workers > 1:
+                # Top-level functions are built by worker processes
+                # while the rest of the module is built here
+                regions: Iterable[tuple[list, str, set[str]]] = split_regions(tree)
+                pool = None
+                if workers > 1:
+                    regions = list(regions)
+                    source = input_code.read_text(encoding="utf-8")
+                    pool = RegionPool(
+                        type(self), source, regions, loop_mode, form, workers
+                    )
+                # Lazy build is read once, so its regions are not kept
+                self.__pending = visit_regions(
+                    self,
+                    regions,
+                    [] if previous is None else previous.regions,
+                    pool,
+                    record=not lazy,
+                )
+                if not lazy:
+                    for _ in self.__pending:
+                        pass
+                    self.__pending = None
+            else:
+                self.visit(tree)
+                self.append_end()
+
+    def __adopt(self, builder) -> None:
+        self.statements = builder.statements
+        self.id2statement = builder.id2statement
+        self.node_after_while = builder.node_after_while
+        self.counter = builder.counter
+        self.current = self.statements[-1]
+        self.reports = builder.reports
+        self.lowered = builder
+        # Phis of on the fly construction are created only for
+        # names that are read, so it is pruned by construction
+        self.phis_avoided = getattr(builder, "phis_avoided", 0)
+        profiling.count("phis_avoided", self.phis_avoided)
+
+    def build_regions(self) -> Iterator[list[Statement]]:
+        # Top-level statements of every region as soon as it is built,
+        # whole module at once when it is not built lazily
+        if self.__pending is None:
+            yield self.statements
         else:
-            self.visit(tree)
-            self.__append_end()
+            yield from self.__pending
+
+    @property
+    def defuse(self) -> DefUseIndex:
+        # Def-use chains of every backend. Backends with basic blocks
+        # keep theirs, sites are phis and instructions that passes
+        # rewrite. Structured backend indexes statements of drawn nodes
+        # on the first query.
+        if self.lowered is not None:
+            return self.lowered.defuse
+        if self.lazy:
+            raise ValueError("lazy build has no def-use index")
+        if self.__defuse is None:
+            with profiling.phase("defuse"):
+                self.__defuse = DefUseIndex.from_graph(
+                    ControlFlowGraph.from_builder(self)
+                )
+        return self.__defuse
+
+    def forget(self, end: int) -> None:
+        # Statements with ids below `end` are dropped from the lazy
+        # build, regions that are built after them do not read them
+        assert self.lazy
+        for _id in range(self.__forgotten, end):
+            self.id2statement.pop(_id, None)
+            self.node_after_while.pop(_id, None)
+        self.__forgotten = max(self.__forgotten, end)
+        self.statements[:] = [
+            statement for statement in self.statements if statement.node._id >= end
+        ]
 
     def __visit(self, node):
         method_name = f"visit_{node.__class__.__name__}"
         visitor = getattr(self, method_name, self.generic_visit)
         self.counter += 1
-        return visitor(node)
+        # Loops before the statement are left to its first node,
+        # loops inside the statement are left later
+        exits, self.loop_exits = self.loop_exits, []
+        if profiling.ACTIVE is not None:
+            result = profiling.ACTIVE.visit(node, visitor)
+        else:
+            result = visitor(node)
+        self.loop_exits = self.exit_loops(exits) + self.loop_exits
+        return result
+
+    def exit_loops(self, exits: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        # Loops go to the first node built after them, the ones
+        # without such node yet are returned
+        pending = []
+        for phi_id, last_id in exits:
+            for _id in range(last_id + 1, self.counter + 1):
+                if _id in self.id2statement:
+                    self.node_after_while[phi_id] = _id
+                    break
+            else:
+                pending.append((phi_id, last_id))
+        return pending
 
     def visit(self, node):
         if isinstance(node, list):
@@ -142,42 +332,20 @@ class CFGBuilder(NodeVisitor):
 
     def __visit_Assign(self, node):
         variable = node.targets[0].id
-        variable_version = self.ssa_list[-1][variable] + 1
-        variable_label = f"{variable}.{variable_version}"
+        variable_version = self.__read(variable) + 1
         if isinstance(node.value, BinOp):
-            lhs = self.__get_argument_value(node.value.left)
+            lhs = self.__get_argument_parts(node.value.left)
             operator = OPERATORS[node.value.op.__class__]
-            rhs = self.__get_argument_value(node.value.right)
-            value = f"{lhs} {operator} {rhs}"
-        elif isinstance(node.value, Constant):
-            value = str(node.value.n)
-        elif isinstance(node.value, Name):
-            value = f"{node.value.id}.{self.ssa_list[-1][node.value.id]}"
-        elif isinstance(node.value, Call):
-            value = f"{node.value.func.id}("
-            for i, arg in enumerate(node.value.args):
-                if isinstance(arg, Constant):
-                    value += (
-                        f"{arg.value}, "
-                        if i != len(node.value.args) - 1
-                        else f"{arg.value}"
-                    )
-                elif isinstance(arg, Name):
-                    arg_label = f"{arg.id}.{self.ssa_list[-1][arg.id]}"
-                    value += (
-                        f"{arg_label}, " if i != len(node.value.args) - 1 else arg_label
-                    )
-            value += ")"
+            rhs = self.__get_argument_parts(node.value.right)
+            value = [*lhs, f" {operator} ", *rhs]
+        else:
+            value = self.__get_argument_parts(node.value)
 
-        label = f"{variable_label} = {value}"
-        self.ssa_list[-1][variable] += 1
+        parts = [(variable, variable_version), " = ", *value]
+        self.__write(variable, variable_version)
 
         self.current = Statement(
-            NodeData(
-                _id=self.counter,
-                _type=NodeType.ASSIGN,
-                label=label,
-            )
+            NodeData.from_parts(self.counter, NodeType.ASSIGN, parts)
         )
         self.statements.append(self.current)
         self.id2statement[self.counter] = self.current
@@ -193,154 +361,241 @@ class CFGBuilder(NodeVisitor):
         self,
         node,
         statements_storage,
-        condition_statement: ConditionStatement,
+        condition_statement: type[IfStatement],
         *,
-        for_data: ForAsWhileData | None = None,
+        phi_versions: dict[str, int] | None = None,
     ):
         phi_function_id = self.counter
         if condition_statement is WhileStatement:
-            label = ""
-            for i, key in enumerate(self.finded_keys):
-                label += f"{key}.{self.ssa_list_before[-1][key] + 1} = φ({key}.{self.ssa_list_before[-1][key]}, {key}.{self.ssa_list_after[-1][key] + 1})"
-                if i != len(self.finded_keys) - 1:
-                    label += "\n"
+            parts: list[Part] = []
+            if phi_versions is None:
+                for key in self.finded_keys:
+                    version = self.ssa_before.get(key)
+                    if version is None:
+                        # Variable left by previous loop is known
+                        # from now on like in `__read`
+                        version = 0
+                        self.ssa_before = self.ssa_before.set(key, version)
+                    if key in self.pruned_keys:
+                        continue
+                    if parts:
+                        parts.append("\n")
+                    parts.extend(
+                        self.__get_phi_parts(
+                            key, version + 1, version, self.ssa_after.get(key, 0) + 1
+                        )
+                    )
+            # Otherwise the label is a placeholder and
+            # it is filled in when the back edge is known
             phi_statement = Statement(
-                NodeData(_id=self.counter, _type=NodeType.ASSIGN, label=label)
+                NodeData.from_parts(self.counter, NodeType.ASSIGN, parts)
             )
             statements_storage.append(phi_statement)
             self.id2statement[self.counter] = phi_statement
             self.while_nodes.append(phi_statement)
-            self.last_node_while.append(node.body[-1])
 
         self.counter += 1
-        lhs = self.__get_argument_value(node.test.left)
+        lhs = self.__get_argument_parts(node.test.left)
         comparator = COMPARATORS[node.test.ops[0].__class__]
-        rhs = self.__get_argument_value(node.test.comparators[0])
-        label = f"{lhs} {comparator} {rhs}"
+        rhs = self.__get_argument_parts(node.test.comparators[0])
 
         condition = condition_statement(
-            NodeData(
-                _id=self.counter,
-                _type=NodeType.IF,
-                label=label,
+            NodeData.from_parts(
+                self.counter, NodeType.IF, [*lhs, f" {comparator} ", *rhs]
             )
         )
         statements_storage.append(condition)
         condition_id = self.counter
         self.id2statement[condition_id] = condition
 
-        if for_data is not None and len(self.finded_keys) == 0:
-            increment_assign_node = Assign(
-                targets=[Name(id=for_data.variable)],
-                value=BinOp(
-                    left=Name(id=for_data.variable),
-                    op=Add(),
-                    right=Constant(value=for_data.step),
-                ),
-            )
-            node.body.append(increment_assign_node)
-
-        self.if_before_true_ssa = deepcopy(self.ssa_list)
+        self.if_before_true_ssa = self.ssa
         statements = self.statements
         self.statements = condition.body
         self.visit(node.body)
         self.statements = statements
-        self.if_true_ssa = deepcopy(self.ssa_list)
+        if phi_versions is not None:
+            phi_statement.node.set_parts(self.__get_loop_phi_parts(phi_versions))
+        self.if_true_ssa = self.ssa
+
+        exits, self.loop_exits = self.loop_exits, []
+        if condition_statement is WhileStatement:
+            # Loops at the end of the body go back to the condition
+            for phi_id, _ in exits:
+                self.node_after_while[phi_id] = phi_function_id
+            exits = []
 
         statements = self.statements
         self.statements = condition.orelse
         self.visit(node.orelse)
         self.statements = statements
-        self.if_false_ssa = deepcopy(self.ssa_list)
+        self.if_false_ssa = self.ssa
 
+        # Loops at the end of both branches are left after the branches
+        self.loop_exits = exits + self.loop_exits
         if condition_statement is WhileStatement:
-            if len(self.while_nodes) >= 2 and isinstance(
-                self.last_node_while[-2], While
-            ):
-                # If this while is inner to another while
-                # and while is the last statement of outer while
-                # then we need to go to outer while condition
-                self.node_after_while[phi_function_id] = self.while_nodes[-2].node._id
-            else:
-                # Else we need to go to next node after while
-                self.node_after_while[phi_function_id] = self.counter + 1
-            self.last_node_while.pop()
+            self.loop_exits.append((phi_function_id, self.counter))
             self.while_nodes.pop()
 
+    def __read(self, key: str) -> int:
+        version = self.ssa.get(key)
+        if version is None:
+            # Unknown variable is known from now on with version `0`
+            version = 0
+            self.__write(key, version)
+        return version
+
+    def __write(self, key: str, version: int) -> None:
+        self.ssa = self.ssa.set(key, version)
+
+    def __phi_names(self, node, loop: bool = False) -> Collection[str] | None:
+        # Names that can have phis at the merge point of `node`, all when `None`
+        if self.liveness is not None:
+            return (self.liveness.header if loop else self.liveness.after)[id(node)]
+        return self.non_local
+
+    def __pruned_loop_keys(self, loop, keys: list[str]) -> set[str]:
+        # Changed variables of the loop that get no phi in its header
+        names = self.__phi_names(loop, loop=True)
+        if names is None:
+            return set()
+        pruned = {key for key in keys if key not in names}
+        self.phis_avoided += len(pruned)
+        return pruned
+
+    @staticmethod
+    def __changed(lhs: Versions, rhs: Versions) -> list[tuple[str, int, int]]:
+        # Variables known in both states with different versions
+        return lhs.changed(rhs)
+
     def __create_phi_block(
-        self, statements: list[Statement], lhs: dict, rhs: dict
+        self,
+        statements: list[Statement],
+        lhs: Versions,
+        rhs: Versions,
+        names: Collection[str] | None = None,
     ) -> list[str]:
         edited = []
-        for key, value in lhs[-1].items():
-            if key in rhs[-1] and (other := rhs[-1][key]) != value:
-                edited.append(key)
-                self.ssa_list[-1][key] = max(value, other) + 1
-                self.counter += 1
-                label: str = (
-                    f"{key}.{self.ssa_list[-1][key]} = φ({key}.{value}, {key}.{other})"
-                )
-                self.current = Statement(
-                    NodeData(_id=self.counter, _type=NodeType.ASSIGN, label=label)
-                )
-                statements.append(self.current)
+        if len(lhs) != 0:
+            self.id2statement[self.counter] = self.current
+        for key, value, other in self.__changed(lhs, rhs):
+            edited.append(key)
+            if names is not None and key not in names:
+                # Version of the false branch stays, it is the
+                # greatest one, so the next version is still new
+                self.phis_avoided += 1
+                continue
+            self.__write(key, max(value, other) + 1)
+            self.counter += 1
+            parts = self.__get_phi_parts(key, self.ssa[key], value, other)
+            self.current = Statement(
+                NodeData.from_parts(self.counter, NodeType.ASSIGN, parts)
+            )
+            statements.append(self.current)
             self.id2statement[self.counter] = self.current
         return edited
 
-    def __create_phi_functions(self) -> None:
+    def __create_phi_functions(self, names: Collection[str] | None) -> None:
         edited: list = self.__create_phi_block(
-            self.statements, self.if_true_ssa, self.if_false_ssa
+            self.statements, self.if_true_ssa, self.if_false_ssa, names
         )
 
-        check = True
-        for key, value in self.if_before_true_ssa[-1].items():
-            if key in self.if_true_ssa[-1] and key not in edited:
-                check = self.if_true_ssa[-1][key] == value
+        # The most recent variable known before the branch and not
+        # merged yet decides whether the true branch needs phis
+        # with versions before the branch
+        for key in self.if_before_true_ssa:
+            if key in self.if_true_ssa and key not in edited:
+                if self.if_true_ssa[key] != self.if_before_true_ssa[key]:
+                    self.__create_phi_block(
+                        self.statements,
+                        self.if_true_ssa,
+                        self.if_before_true_ssa,
+                        names,
+                    )
+                break
+
+    @staticmethod
+    def __get_phi_parts(key: str, target: int, lhs: int, rhs: int) -> list[Part]:
+        if profiling.ACTIVE is not None:
+            profiling.ACTIVE.count("phis")
+        return [(key, target), " = φ(", (key, lhs), ", ", (key, rhs), ")"]
+
+    def __get_loop_phi_parts(self, phi_versions: dict[str, int]) -> list[Part]:
+        parts: list[Part] = []
+        for key, version in phi_versions.items():
+            if parts:
+                parts.append("\n")
+            parts.extend(self.__get_phi_parts(key, version + 1, version, self.ssa[key]))
+        return parts
+
+    def __visit_Loop(self, node, loop):
+        # Single pass: every variable assigned inside the loop that
+        # is already known gets a phi in the loop header
+        keys = sorted(
+            (key for key in self.loop_keys[id(loop)] if key in self.ssa),
+            key=self.ssa.rank,
+        )
+        pruned = self.__pruned_loop_keys(loop, keys)
+        keys = [key for key in keys if key not in pruned]
+        phi_versions = {key: self.ssa[key] for key in keys}
+        for key, version in phi_versions.items():
+            self.__write(key, version + 1)
 
-        if not check:
-            self.__create_phi_block(
-                self.statements, self.if_true_ssa, self.if_before_true_ssa
-            )
+        self.__visit_Condition(
+            node,
+            self.statements,
+            WhileStatement,
+            phi_versions=phi_versions,
+        )
 
     def visit_If(self, node):
         self.__visit_Condition(node, self.statements, IfStatement)
-        self.__create_phi_functions()
+        with profiling.phase("phi"):
+            self.__create_phi_functions(self.__phi_names(node))
 
     def visit_While(self, node):
-        current_before = deepcopy(self.current)
-        self.ssa_list_before = deepcopy(self.ssa_list)
-        statements_before = deepcopy(self.statements)
-        counter_before = deepcopy(self.counter)
-        id2statement_before = deepcopy(self.id2statement)
-        while_nodes_before = deepcopy(self.while_nodes)
-        node_after_while_before = deepcopy(self.node_after_while)
-        last_node_while_before = deepcopy(self.last_node_while)
+        if self.loop_mode is LoopMode.SINGLE_PASS:
+            self.__visit_Loop(node, node)
+            return
+
+        with profiling.phase("deepcopy"):
+            current_before = deepcopy(self.current)
+            self.ssa_before = self.ssa
+            statements_before = deepcopy(self.statements)
+            counter_before = deepcopy(self.counter)
+            avoided_before = self.phis_avoided
+            id2statement_before = deepcopy(self.id2statement)
+            while_nodes_before = deepcopy(self.while_nodes)
+            node_after_while_before = deepcopy(self.node_after_while)
+            loop_exits_before = list(self.loop_exits)
+        profiling.count("deepcopies", 6)
+        # Body is visited twice, the first pass is thrown away
+        profiling.count("loop_revisits")
 
         self.__visit_Condition(
             node,
             self.statements,
             WhileStatement,
         )
-        self.ssa_list_after = deepcopy(self.ssa_list)
+        self.ssa_after = self.ssa
 
-        self.finded_keys = []
-        for key, value in self.ssa_list[-1].items():
-            if (
-                key in self.ssa_list_before[-1]
-                and value != self.ssa_list_before[-1][key]
-            ):
-                self.finded_keys.append(key)
+        self.finded_keys = [
+            key for key, _, _ in self.__changed(self.ssa_before, self.ssa_after)
+        ]
 
         self.current = current_before
         self.statements = statements_before
         self.counter = counter_before
-        self.ssa_list = deepcopy(self.ssa_list_before)
+        self.phis_avoided = avoided_before
+        self.ssa = self.ssa_before
         self.id2statement = id2statement_before
         self.while_nodes = while_nodes_before
         self.node_after_while = node_after_while_before
-        self.last_node_while = last_node_while_before
+        self.loop_exits = loop_exits_before
 
+        self.pruned_keys = self.__pruned_loop_keys(node, self.finded_keys)
         for key in self.finded_keys:
-            self.ssa_list[-1][key] += 1
+            if key not in self.pruned_keys:
+                self.__write(key, self.ssa[key] + 1)
 
         self.__visit_Condition(
             node,
@@ -374,82 +629,112 @@ class CFGBuilder(NodeVisitor):
         self.statements.append(self.current)
         self.id2statement[self.counter] = self.current
 
-    def __get_argument_value(self, arg):
+    def __get_argument_parts(self, arg) -> list[Part]:
         if isinstance(arg, Constant):
-            return arg.value
+            return [str(arg.value)]
         elif isinstance(arg, Name):
-            return f"{arg.id}.{self.ssa_list[-1][arg.id]}"
+            return [(arg.id, self.__read(arg.id))]
+        elif isinstance(arg, Evaluated):
+            return arg.parts
+        elif isinstance(arg, Call):
+            return self.__get_call_parts(arg)
+        return ["None"]
+
+    def __get_call_parts(self, node) -> list[Part]:
+        parts: list[Part] = [f"{node.func.id}("]
+        for i, arg in enumerate(node.args):
+            if i != 0:
+                parts.append(", ")
+            parts.extend(self.__get_argument_parts(arg))
+        parts.append(")")
+        return parts
 
     def visit_For(self, node):
         variable = node.target.id
         match len(node.iter.args):
             case 3:  # Example: `for i in range(1, 10, 1)`
-                max_value = self.__get_argument_value(node.iter.args[1])
-                min_value = self.__get_argument_value(node.iter.args[0])
-                step_value = self.__get_argument_value(node.iter.args[2])
+                max_value = self.__get_argument_parts(node.iter.args[1])
+                min_value = self.__get_argument_parts(node.iter.args[0])
+                step_value = self.__get_argument_parts(node.iter.args[2])
             case 2:  # Example: `for i in range(1, 10)`
-                max_value = self.__get_argument_value(node.iter.args[1])
-                min_value = self.__get_argument_value(node.iter.args[0])
-                step_value = 1
+                max_value = self.__get_argument_parts(node.iter.args[1])
+                min_value = self.__get_argument_parts(node.iter.args[0])
+                step_value = ["1"]
             case 1:  # Example: `for i in range(10)`
-                max_value = self.__get_argument_value(node.iter.args[0])
-                min_value = 0
-                step_value = 1
+                max_value = self.__get_argument_parts(node.iter.args[0])
+                min_value = ["0"]
+                step_value = ["1"]
 
         # Set basic assign case
-        assign_node = Assign(targets=[Name(id=variable)], value=Constant(n=min_value))
+        assign_node = Assign(
+            targets=[Name(id=variable)], value=Evaluated(parts=min_value)
+        )
         self.__visit_Assign(assign_node)
 
+        # Loop variable is incremented at the end of the body,
+        # body is copied, so tree of the caller stays as it is
+        increment_assign_node = Assign(
+            targets=[Name(id=variable)],
+            value=BinOp(
+                left=Name(id=variable),
+                op=Add(),
+                right=Evaluated(parts=step_value),
+            ),
+        )
         while_node = While(
             test=Compare(
                 left=Name(id=variable),
                 ops=[Lt()],
-                comparators=[Constant(n=max_value)],
+                comparators=[Evaluated(parts=max_value)],
             ),
-            body=node.body,
+            body=[*node.body, increment_assign_node],
             orelse=node.orelse,
         )
         self.counter += 1
 
-        current_before = deepcopy(self.current)
-        self.ssa_list_before = deepcopy(self.ssa_list)
-        statements_before = deepcopy(self.statements)
-        counter_before = deepcopy(self.counter)
-        id2statement_before = deepcopy(self.id2statement)
-        while_nodes_before = deepcopy(self.while_nodes)
-        node_after_while_before = deepcopy(self.node_after_while)
-        last_node_while_before = deepcopy(self.last_node_while)
+        if self.loop_mode is LoopMode.SINGLE_PASS:
+            self.__visit_Loop(while_node, node)
+            return
+
+        with profiling.phase("deepcopy"):
+            current_before = deepcopy(self.current)
+            self.ssa_before = self.ssa
+            statements_before = deepcopy(self.statements)
+            counter_before = deepcopy(self.counter)
+            avoided_before = self.phis_avoided
+            id2statement_before = deepcopy(self.id2statement)
+            while_nodes_before = deepcopy(self.while_nodes)
+            node_after_while_before = deepcopy(self.node_after_while)
+            loop_exits_before = list(self.loop_exits)
+        profiling.count("deepcopies", 6)
+        # Body is visited twice, the first pass is thrown away
+        profiling.count("loop_revisits")
 
         self.__visit_Condition(
             while_node,
             self.statements,
             WhileStatement,
-            for_data=ForAsWhileData(
-                variable=variable,
-                step=step_value,
-            ),
         )
-        self.ssa_list_after = deepcopy(self.ssa_list)
+        self.ssa_after = self.ssa
 
-        self.finded_keys = []
-        for key, value in self.ssa_list[-1].items():
-            if (
-                key in self.ssa_list_before[-1]
-                and value != self.ssa_list_before[-1][key]
-            ):
-                self.finded_keys.append(key)
+        self.finded_keys = [
+            key for key, _, _ in self.__changed(self.ssa_before, self.ssa_after)
+        ]
 
         self.current = current_before
         self.statements = statements_before
         self.counter = counter_before
-        self.ssa_list = deepcopy(self.ssa_list_before)
+        self.phis_avoided = avoided_before
+        self.ssa = self.ssa_before
         self.id2statement = id2statement_before
         self.while_nodes = while_nodes_before
         self.node_after_while = node_after_while_before
-        self.last_node_while = last_node_while_before
+        self.loop_exits = loop_exits_before
 
+        self.pruned_keys = self.__pruned_loop_keys(node, self.finded_keys)
         for key in self.finded_keys:
-            self.ssa_list[-1][key] += 1
+            if key not in self.pruned_keys:
+                self.__write(key, self.ssa[key] + 1)
 
         self.__visit_Condition(
             while_node,
@@ -476,25 +761,20 @@ class CFGBuilder(NodeVisitor):
 
     def visit_FunctionDef(self, node):
         name = node.name
-        function_name = f"{name}("
-        args_values = node.args.args
-        args = ""
-        ssa = self.ssa_list[-1]
-        for i, arg in enumerate(args_values):
-            ssa[arg.arg] += 1
-            arg_label = f"{arg.arg}.{ssa[arg.arg]}"
-            args += f"{arg_label}, " if i != len(args_values) - 1 else arg_label
-        function_name += f"{args})"
-        label = f"def {function_name}"
+        parts: list[Part] = [f"def {name}("]
+        for i, arg in enumerate(node.args.args):
+            version = self.__read(arg.arg) + 1
+            self.__write(arg.arg, version)
+            if i != 0:
+                parts.append(", ")
+            parts.append((arg.arg, version))
+        parts.append(")")
 
         function = FunctionStatement(
-            NodeData(
-                _id=self.counter,
-                _type=NodeType.FUNCTION_DEF,
-                label=label,
-            )
+            NodeData.from_parts(self.counter, NodeType.FUNCTION_DEF, parts)
         )
         self.statements.append(function)
+        self.id2statement[self.counter] = function
 
         statements = self.statements
         self.statements = function.body
@@ -514,52 +794,21 @@ class CFGBuilder(NodeVisitor):
         for statement in self.statements:
             self.set_end_to_return(statement, function_end)
         self.id2statement[self.counter] = self.current
+        self.loop_exits = self.exit_loops(self.loop_exits)
         self.statements = statements
 
     def visit_Return(self, node):
-        value = self.__get_argument_value(node.value)
-
-        label = f"return {value}"
+        parts = ["return ", *self.__get_argument_parts(node.value)]
         self.current = ReturnStatement(
-            NodeData(
-                _id=self.counter,
-                _type=NodeType.RETURN,
-                label=label,
-            ),
+            NodeData.from_parts(self.counter, NodeType.RETURN, parts),
         )
         self.statements.append(self.current)
         self.id2statement[self.counter] = self.current
 
     def visit_Call(self, node):
-        label = f"{node.func.id}("
-        for i, arg in enumerate(node.args):
-            if isinstance(arg, Constant):
-                label += f"{arg.value}, " if i != len(node.args) - 1 else arg.value
-            elif isinstance(arg, Name):
-                arg_label = f"{arg.id}.{self.ssa_list[-1][arg.id]}"
-                label += f"{arg_label}, " if i != len(node.args) - 1 else arg_label
-            elif isinstance(arg, Call):
-                label += f"{arg.func.id}("
-                for i, aarg in enumerate(arg.args):
-                    if isinstance(aarg, Constant):
-                        label += (
-                            f"{aarg.value}, "
-                            if i != len(arg.args) - 1
-                            else f"{aarg.value}"
-                        )
-                    elif isinstance(aarg, Name):
-                        arg_label = f"{aarg.id}.{self.ssa_list[-1][aarg.id]}"
-                        label += (
-                            f"{arg_label}, " if i != len(arg.args) - 1 else arg_label
-                        )
-                label += ")"
-        label += ")"
-
         self.current = Statement(
-            NodeData(
-                _id=self.counter,
-                _type=NodeType.CALL,
-                label=label,
+            NodeData.from_parts(
+                self.counter, NodeType.CALL, self.__get_call_parts(node)
             ),
         )
         self.statements.append(self.current)
@@ -573,7 +822,8 @@ class CFGBuilder(NodeVisitor):
         )
         self.__visit_Assign(assign_node)
 
-    def __append_end(self):
+    def append_end(self):
+        profiling.count("phis_avoided", self.phis_avoided)
         self.counter += 1
         self.current = Statement(
             NodeData(
@@ -584,6 +834,7 @@ class CFGBuilder(NodeVisitor):
         )
         self.statements.append(self.current)
         self.id2statement[self.counter] = self.current
+        self.loop_exits = self.exit_loops(self.loop_exits)
 
     def __source(self):
         self.statements.extend(
@@ -665,4 +916,4 @@ class CFGBuilder(NodeVisitor):
             ]
         )
         self.counter = 10
-        self.__append_end()
+        self.append_end()
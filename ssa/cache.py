@@ -0,0 +1,93 @@
+from hashlib import sha256
+from os import replace, utime
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from . import __version__
+
+# Changes whenever layout of cached entries changes
+CACHE_FORMAT = 3
+SUFFIX = ".entry"
+
+
+def cache_key(source: bytes, *options) -> str:
+    digest = sha256(f"{__version__}:{CACHE_FORMAT}".encode())
+    for option in options:
+        digest.update(b"\0")
+        digest.update(repr(option).encode())
+    digest.update(b"\0")
+    digest.update(source)
+    return digest.hexdigest()
+
+
+# Content addressed cache on disk. Every entry is one output as bytes,
+# e.g. DOT text or reports of a file, so it is read without decoding
+# anything else. Entries are written to a temporary file and renamed,
+# so concurrent workers never see a partial entry. Access time is kept
+# in mtime, eviction removes least recently used entries until the cache
+# fits in `max_bytes`.
+# Outputs are cached in place of the builder: a hit writes its bytes
+# without building or rendering anything. `write_ir` keeps only the
+# drawn graph, so `py`, `counts` and reports of passes could not be
+# served from it, and builders over basic blocks hold closures of the
+# visitor that are not pickled.
+class ResultCache:
+    def __init__(self, directory: Path, max_bytes: int | None = None) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Bytes written since the last eviction
+        self.written = 0
+
+    def path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{SUFFIX}"
+
+    def get(self, key: str) -> bytes | None:
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+            utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            dir=path.parent, prefix=".", suffix=".tmp", delete=False
+        ) as file:
+            file.write(data)
+        replace(file.name, path)
+        # Cache is trimmed while it is filled, every process trims it
+        # after it wrote an eighth of the limit, so the cache never
+        # grows far past the limit during a long run
+        self.written += len(data)
+        if self.max_bytes is not None and self.written > self.max_bytes // 8:
+            self.evict()
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.__entries())
+
+    def evict(self) -> int:
+        if self.max_bytes is None:
+            return 0
+        self.written = 0
+        entries = sorted(self.__entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            # Entry can be removed by another process at the same time
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def __entries(self):
+        for path in self.directory.glob(f"*/*{SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
@@ -0,0 +1,364 @@
+from array import array
+from enum import IntFlag, auto
+from operator import itemgetter
+from typing import Any, Generator, Iterator
+
+from .statements import (
+    NodeType,
+    Statement,
+    IfStatement,
+    WhileStatement,
+    BreakStatement,
+    ContinueStatement,
+    FunctionStatement,
+    ReturnStatement,
+)
+
+
+class EdgeKind(IntFlag):
+    NONE = 0
+    TRUE = auto()
+    FALSE = auto()
+    BREAK = auto()
+    CONTINUE = auto()
+
+
+def edge_label(kind: EdgeKind) -> str:
+    # Label of drawn edge
+    label = ""
+    if not kind:
+        return label
+    if kind & EdgeKind.TRUE:
+        label = "T"
+    elif kind & EdgeKind.FALSE:
+        label = "F"
+    for flag, mark in ((EdgeKind.BREAK, "B"), (EdgeKind.CONTINUE, "C")):
+        if kind & flag:
+            label = f"{label} ({mark})" if label else mark
+    return label
+
+
+# Frontier items of these types do not fall through to the next statement
+JUMPS = (NodeType.BREAK, NodeType.CONTINUE, NodeType.RETURN)
+
+# Walks over the statements tree yield nested statement lists
+# together with the frontier they start from and receive the
+# frontier they end with, so nesting depth is not limited by stack.
+Walk = Generator[Any, Any, list[Statement]]
+
+
+def run_walk(walk: Generator[Any, Any, Any]) -> Any:
+    # Trampoline for nested walks: generator yields nested walk
+    # and receives its return value
+    stack = [walk]
+    value = None
+    while stack:
+        try:
+            request = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            value = stop.value
+            continue
+        stack.append(request)
+        value = None
+    return value
+
+
+class CompressedRows:
+    # Adjacency in CSR form: row `i` is `targets[offsets[i]:offsets[i + 1]]`
+    def __init__(self, offsets: array, targets: array) -> None:
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_pairs(cls, rows: int, pairs: list) -> "CompressedRows":
+        # Pairs must be sorted by row, order inside the row is kept
+        offsets = array("i", [0] * (rows + 1))
+        for pair in pairs:
+            offsets[pair[0] + 1] += 1
+        for row in range(rows):
+            offsets[row + 1] += offsets[row]
+        return cls(offsets, array("i", [pair[1] for pair in pairs]))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> array:
+        return self.targets[self.offsets[row] : self.offsets[row + 1]]
+
+    def range(self, row: int) -> range:
+        return range(self.offsets[row], self.offsets[row + 1])
+
+
+# Walks statements in the order `GraphBuilder` draws them and collects
+# drawn nodes and edges between their ids. Statements can be fed in
+# parts, frontier returned by one part is passed to the next one.
+# `break` and `continue` are not nodes, their edges go straight to the
+# target, the same way they are drawn.
+class EdgeCollector:
+    def __init__(self, node_after_while: dict[int, int]) -> None:
+        self.node_after_while = node_after_while
+        # Drawn statements with id of the statement they are nested in
+        self.nodes: list[tuple[Statement, int | None]] = []
+        self.edges: list[tuple[int, int, EdgeKind]] = []
+        # (`FUNCTION_DEF` node, `FUNCTION_END` node) pairs
+        self.functions: list[tuple[Statement, Statement]] = []
+        self.__if_nodes: set[int] = set()
+
+    def walk(
+        self,
+        statements: list[Statement],
+        frontier: list[Statement],
+        parent: int | None = None,
+    ) -> list[Statement]:
+        return run_walk(self.__walk(statements, frontier, parent))
+
+    def __add_edges(
+        self,
+        sources: list[Statement],
+        target_id: int,
+        kind: EdgeKind = EdgeKind.NONE,
+    ) -> None:
+        for source in sources:
+            if source.node._type in JUMPS:
+                continue
+            source_kind = kind
+            if source.node._type is NodeType.IF:
+                if source.node._id in self.__if_nodes:
+                    source_kind |= EdgeKind.FALSE
+                else:
+                    self.__if_nodes.add(source.node._id)
+                    source_kind |= EdgeKind.TRUE
+            self.edges.append((source.node._id, target_id, source_kind))
+
+    def __walk(
+        self,
+        statements: list[Statement],
+        frontier: list[Statement],
+        parent: int | None,
+    ) -> Walk:
+        for statement in statements:
+            previous, frontier = frontier, [statement]
+            _id = statement.node._id
+            if isinstance(statement, WhileStatement):
+                self.nodes.append((statement, parent))
+                self.__add_edges(previous, _id)
+                body = yield self.__walk(statement.body, [statement], _id)
+                for item in body:
+                    if item.node._type in JUMPS:
+                        frontier.append(item)
+                    else:
+                        # Back edge goes to the phi before condition
+                        self.__add_edges([item], _id - 1)
+            elif isinstance(statement, IfStatement):
+                self.nodes.append((statement, parent))
+                self.__add_edges(previous, _id)
+                body = yield self.__walk(statement.body, [statement], _id)
+                orelse = yield self.__walk(statement.orelse, [statement], _id)
+                frontier = body + orelse
+            elif isinstance(statement, BreakStatement):
+                target = self.node_after_while[statement.while_statement.node._id]
+                self.__add_edges(previous, target, EdgeKind.BREAK)
+                return frontier
+            elif isinstance(statement, ContinueStatement):
+                self.__add_edges(
+                    previous, statement.while_statement.node._id, EdgeKind.CONTINUE
+                )
+                return frontier
+            elif isinstance(statement, ReturnStatement):
+                self.nodes.append((statement, parent))
+                self.__add_edges(previous, _id)
+                function_end = statement.end_of_function_statement
+                assert function_end is not None
+                self.edges.append((_id, function_end.node._id, EdgeKind.NONE))
+            elif isinstance(statement, FunctionStatement):
+                self.nodes.append((statement, parent))
+                self.__add_edges(previous, _id)
+                frontier = yield self.__walk(statement.body, [statement], _id)
+                self.functions.append((statement, statement.body[-1]))
+            else:
+                self.nodes.append((statement, parent))
+                self.__add_edges(previous, _id)
+        return frontier
+
+
+# Explicit control flow graph with basic blocks of dense ids. Nodes
+# of block `b` are `block_starts[b]:block_starts[b + 1]` of the flat
+# node arrays, edges between blocks are CSR rows and kinds of edges
+# are kept next to their targets. Graph of drawn statements has nodes
+# in the order `GraphBuilder` draws them, graph of `lowering` blocks
+# has their instructions, and only edges between blocks.
+class ControlFlowGraph:
+    def __init__(
+        self,
+        nodes: list[tuple[Statement, int | None]] | None = None,
+        edges: list[tuple[int, int, EdgeKind]] | None = None,
+    ) -> None:
+        # Statements of nodes, `id2statement` of the builder can keep
+        # statements of loops that were built again
+        self.statements: list[Statement] = []
+        self.node_ids = array("i")
+        self.node_types = array("b")
+        # Position of the node the node is nested in, -1 at top level
+        self.parents = array("i")
+        self.node_block = array("i")
+        self.block_starts = array("i", [0])
+        self.successors = CompressedRows(array("i", [0]), array("i"))
+        self.successor_kinds = array("b")
+        self.predecessors = CompressedRows(array("i", [0]), array("i"))
+        self.predecessor_kinds = array("b")
+        # (`FUNCTION_DEF` node, `FUNCTION_END` node) pairs
+        self.functions = array("i")
+        # Position of node by `id - first_id`, -1 for ids not drawn
+        self.first_id = 0
+        self.node_index = array("i")
+
+        if nodes is not None:
+            self.__add_nodes(nodes, edges or [])
+
+    @classmethod
+    def from_builder(cls, builder) -> "ControlFlowGraph":
+        collector = EdgeCollector(builder.node_after_while)
+        collector.walk(builder.statements, [])
+        graph = cls(collector.nodes, collector.edges)
+        for function, function_end in collector.functions:
+            graph.functions.append(graph.find(function.node._id))
+            graph.functions.append(graph.find(function_end.node._id))
+        return graph
+
+    @classmethod
+    def from_blocks(cls, blocks: list) -> "ControlFlowGraph":
+        # Blocks of `lowering.BlockBuilder`, rows keep the order of
+        # their lists, phi operands follow order of predecessors
+        graph = cls()
+        successors: list[tuple[int, int]] = []
+        predecessors: list[tuple[int, int]] = []
+        for block in blocks:
+            assert block._id == len(graph.block_starts) - 1
+            for instruction in block.instructions:
+                graph.statements.append(instruction.statement)
+                node = instruction.statement.node
+                graph.node_ids.append(node._id)
+                graph.node_types.append(node._type.value)
+                graph.parents.append(-1)
+                graph.node_block.append(block._id)
+            graph.block_starts.append(len(graph.node_ids))
+            successors.extend((block._id, target) for target in block.successors)
+            predecessors.extend((block._id, source) for source in block.predecessors)
+        graph.successors = CompressedRows.from_pairs(len(blocks), successors)
+        graph.successor_kinds = array("b", [EdgeKind.NONE] * len(successors))
+        graph.predecessors = CompressedRows.from_pairs(len(blocks), predecessors)
+        graph.predecessor_kinds = array("b", [EdgeKind.NONE] * len(predecessors))
+        return graph
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_blocks(self) -> int:
+        return len(self.block_starts) - 1
+
+    def find(self, node_id: int) -> int:
+        # Position of node with the id or -1
+        position = node_id - self.first_id
+        if 0 <= position < len(self.node_index):
+            return self.node_index[position]
+        return -1
+
+    def instructions(self, block: int) -> range:
+        return range(self.block_starts[block], self.block_starts[block + 1])
+
+    def statement(self, node: int) -> Statement:
+        return self.statements[node]
+
+    def node_type(self, node: int) -> NodeType:
+        return NodeType(self.node_types[node])
+
+    # Edges of nodes are the edge to the next node inside the block and
+    # edges of the block from its last node to first nodes of targets
+    def node_successors(self, node: int) -> Iterator[tuple[int, EdgeKind]]:
+        block = self.node_block[node]
+        if node + 1 < self.block_starts[block + 1]:
+            yield node + 1, EdgeKind.NONE
+            return
+        for edge in self.successors.range(block):
+            target = self.successors.targets[edge]
+            yield self.block_starts[target], EdgeKind(self.successor_kinds[edge])
+
+    def node_predecessors(self, node: int) -> Iterator[tuple[int, EdgeKind]]:
+        block = self.node_block[node]
+        if node != self.block_starts[block]:
+            yield node - 1, EdgeKind.NONE
+            return
+        for edge in self.predecessors.range(block):
+            source = self.predecessors.targets[edge]
+            yield self.block_starts[source + 1] - 1, EdgeKind(
+                self.predecessor_kinds[edge]
+            )
+
+    def __add_nodes(
+        self,
+        nodes: list[tuple[Statement, int | None]],
+        edges: list[tuple[int, int, EdgeKind]],
+    ) -> None:
+        # Nodes and edges of `EdgeCollector`, edges to ids that are
+        # not among nodes are dropped
+        ids = [statement.node._id for statement, _ in nodes]
+        self.first_id = min(ids, default=0)
+        self.node_index = array("i", [-1] * (max(ids, default=-1) + 1 - self.first_id))
+        for statement, parent in nodes:
+            self.node_index[statement.node._id - self.first_id] = len(self.node_ids)
+            self.statements.append(statement)
+            self.node_ids.append(statement.node._id)
+            self.node_types.append(statement.node._type.value)
+            self.parents.append(-1 if parent is None else self.find(parent))
+
+        node_edges = []
+        for source, target, kind in edges:
+            if self.find(target) != -1:
+                node_edges.append((self.find(source), self.find(target), kind))
+        self.__build_blocks(node_edges)
+
+    def __build_blocks(self, edges: list[tuple[int, int, EdgeKind]]) -> None:
+        count = self.num_nodes
+        successors_count = array("i", [0] * count)
+        predecessors_count = array("i", [0] * count)
+        predecessor = array("i", [-1] * count)
+        plain = array("b", [0] * count)
+        for source, target, kind in edges:
+            successors_count[source] += 1
+            predecessors_count[target] += 1
+            predecessor[target] = source
+            plain[target] = kind == EdgeKind.NONE
+
+        # Node continues the block of the previous node, when it is
+        # the only way in and out of both of them and edge has no label
+        self.block_starts = array("i")
+        self.node_block = array("i", [0] * count)
+        for node in range(count):
+            if (
+                node == 0
+                or predecessors_count[node] != 1
+                or predecessor[node] != node - 1
+                or successors_count[node - 1] != 1
+                or not plain[node]
+            ):
+                self.block_starts.append(node)
+            self.node_block[node] = len(self.block_starts) - 1
+        self.block_starts.append(count)
+
+        block_edges = [
+            (self.node_block[source], self.node_block[target], kind)
+            for source, target, kind in edges
+            if target == self.block_starts[self.node_block[target]]
+        ]
+        block_edges.sort(key=itemgetter(0))
+        self.successors = CompressedRows.from_pairs(self.num_blocks, block_edges)
+        self.successor_kinds = array("b", [kind for _, _, kind in block_edges])
+        reverse = sorted(
+            ((target, source, kind) for source, target, kind in block_edges),
+            key=itemgetter(0),
+        )
+        self.predecessors = CompressedRows.from_pairs(self.num_blocks, reverse)
+        self.predecessor_kinds = array("b", [kind for _, _, kind in reverse])
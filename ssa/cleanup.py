@@ -0,0 +1,224 @@
+from dataclasses import dataclass
+
+from . import profiling
+from .lowering import BlockBuilder, Instruction, Literal, Phi, Variable
+from .operators import FUNCTIONS
+from .statements import NodeType, Statement
+
+Value = tuple[str, int]
+
+
+def is_copy(instruction: Instruction) -> bool:
+    # Example: `y.1 = x.2`
+    match instruction.parts:
+        case [Variable(), " = ", Variable()] if len(instruction.defs) == 1:
+            return True
+    return False
+
+
+def is_pure(instruction: Instruction) -> bool:
+    # Assignment of operand or of operation on two operands, calls and
+    # expressions that are rendered as text may have side effects
+    if instruction.statement.node._type is not NodeType.ASSIGN:
+        return False
+    match instruction.parts:
+        case [Variable(), " = ", operand]:
+            return isinstance(operand, (Variable, Literal))
+        case [Variable(), " = ", lhs, str(operator), rhs]:
+            return (
+                operator.strip() in FUNCTIONS
+                and isinstance(lhs, (Variable, Literal))
+                and isinstance(rhs, (Variable, Literal))
+            )
+    return False
+
+
+@dataclass
+class CopyReport:
+    copies: int = 0
+    # Phis with one distinct operand
+    trivial_phis: int = 0
+    replaced_uses: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.copies} copies, {self.trivial_phis} trivial phis, "
+            f"{self.replaced_uses} uses replaced"
+        )
+
+
+# Uses of `y.1` in `y.1 = x.2` and of phis whose operands are one value
+# are replaced with the copied value. Phis that become copies when their
+# operands are replaced are found through the phis that read them, so
+# every phi is checked a bounded number of times. Copies stay in place
+# for `dead_code_elimination`, trivial phis are dropped. Functions read
+# variables from outside when they are called, these uses are kept.
+def copy_propagation(builder: BlockBuilder) -> CopyReport:
+    report = CopyReport()
+    with profiling.phase("copies"):
+        copies: dict[Value, Variable] = {}
+        phis: list[tuple[Phi, int]] = []
+        defuse = builder.defuse
+        function_of = builder.functions()
+        for block in builder.blocks:
+            for phi in block.phis:
+                phis.append((phi, function_of[block._id]))
+            for instruction in block.instructions:
+                if is_copy(instruction):
+                    source = instruction.parts[2]
+                    assert isinstance(source, Variable)
+                    copies[instruction.defs[0].operand] = source
+                    report.copies += 1
+
+        def is_local(variable: Variable, function: int) -> bool:
+            source = defuse.defined_in(variable.operand)
+            return source is None or function_of[source] == function
+
+        def find(variable: Variable, function: int) -> Variable:
+            # Copies outside of the function are not followed, names
+            # they copy may be assigned again before it is called
+            root = variable
+            while root.operand in copies and is_local(copies[root.operand], function):
+                root = copies[root.operand]
+            # Path compression
+            while variable.operand != root.operand:
+                parent = copies[variable.operand]
+                copies[variable.operand] = root
+                variable = parent
+            return root
+
+        trivial: set[Value] = set()
+        worklist = list(reversed(phis))
+        while worklist:
+            phi, function = worklist.pop()
+            target = phi.target.operand
+            if target in trivial:
+                continue
+            same = None
+            for operand in phi.operands:
+                value = find(operand, function)
+                if value.operand == target or (
+                    same is not None and value.operand == same.operand
+                ):
+                    continue
+                if same is not None:
+                    break
+                same = value
+            else:
+                if same is None:
+                    continue
+                trivial.add(target)
+                copies[target] = same
+                report.trivial_phis += 1
+                worklist.extend(
+                    (user, function_of[block])
+                    for block, user in defuse.users(target)
+                    if isinstance(user, Phi)
+                )
+
+        def replace(variable: Variable, function: int) -> Variable:
+            if not is_local(variable, function):
+                return variable
+            root = find(variable, function)
+            if root is variable:
+                return variable
+            report.replaced_uses += 1
+            return Variable(root.name, root.version)
+
+        # Index is changed at the end, users of trivial
+        # phis are still found while uses are replaced
+        removed: list[Phi] = []
+        for block in builder.blocks:
+            kept: list[Phi] = []
+            for phi in block.phis:
+                (removed if phi.target.operand in trivial else kept).append(phi)
+            block.phis = kept
+        for site in builder.replace_uses(replace, function_of):
+            defuse.update(site)
+        for phi in removed:
+            defuse.remove(phi)
+    profiling.count("copies", report.copies + report.trivial_phis)
+    return report
+
+
+@dataclass
+class DCEReport:
+    removed_statements: int = 0
+    removed_phis: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.removed_statements} statements removed, "
+            f"{self.removed_phis} phis removed"
+        )
+
+
+# Mark and sweep over SSA def-use chains. Everything but pure
+# assignments is live: calls, `return`, conditions and the structure
+# of the graph, as well as assignments of names that functions read
+# from outside. Definitions read by live statements or phis are live.
+# Dead assignments are removed from blocks and statements.
+def dead_code_elimination(builder: BlockBuilder) -> DCEReport:
+    report = DCEReport()
+    with profiling.phase("dce"):
+        defuse = builder.defuse
+
+        # Functions read names from outside when they are called, so
+        # every assignment of these names may be read
+        function_of = builder.functions()
+        free: set[str] = set()
+        for block in builder.blocks:
+            function = function_of[block._id]
+            if function == -1:
+                continue
+            for instruction in block.instructions:
+                for variable in instruction.uses:
+                    source = defuse.defined_in(variable.operand)
+                    if source is None or function_of[source] != function:
+                        free.add(variable.name)
+
+        worklist: list[Phi | Instruction] = []
+        for block in builder.blocks:
+            for instruction in block.instructions:
+                if not is_pure(instruction) or any(
+                    variable.name in free for variable in instruction.defs
+                ):
+                    worklist.append(instruction)
+
+        live = {id(item) for item in worklist}
+        while worklist:
+            item = worklist.pop()
+            for variable in item.uses:
+                definition = defuse.definition(variable.operand)
+                if definition is not None and id(definition) not in live:
+                    live.add(id(definition))
+                    worklist.append(definition)
+
+        removed: dict[int, list[Statement]] = {}
+        dead: list[Phi | Instruction] = []
+        for block in builder.blocks:
+            phis: list[Phi] = []
+            for phi in block.phis:
+                (phis if id(phi) in live else dead).append(phi)
+            report.removed_phis += len(block.phis) - len(phis)
+            block.phis = phis
+            instructions = []
+            for instruction in block.instructions:
+                if id(instruction) in live:
+                    instructions.append(instruction)
+                else:
+                    dead.append(instruction)
+                    removed[id(instruction.statement)] = []
+            block.instructions = instructions
+        for item in dead:
+            defuse.remove(item)
+        report.removed_statements = len(removed)
+        if removed:
+            builder.instructions = [
+                instruction
+                for instruction in builder.instructions
+                if id(instruction.statement) not in removed
+            ]
+            builder.replace_statements(removed)
+    profiling.count("dead_statements", report.removed_statements)
+    return report
@@ -0,0 +1,369 @@
+from math import isfinite
+from re import findall
+
+from .cleanup import is_copy
+from .dataflow import Index, Problem, solve
+from .lowering import Block, BlockBuilder, Instruction, Literal, Variable
+from .operators import FUNCTIONS
+from .statements import (
+    BreakStatement,
+    ContinueStatement,
+    FunctionStatement,
+    IfStatement,
+    NodeType,
+    Statement,
+    WhileStatement,
+)
+
+Value = tuple[str, int]
+
+INDENT = "    "
+
+
+def sequentialize(copies: list[tuple[str, str]], temporary) -> list[tuple[str, str]]:
+    # Parallel copies `(target, source)` as a sequence of copies: a copy
+    # is emitted once no other copy reads its target, a cycle is broken
+    # by saving one of its targets in `temporary()`
+    pending = {target: source for target, source in copies if target != source}
+    result = []
+    while pending:
+        read = set(pending.values())
+        ready = [target for target in pending if target not in read]
+        if not ready:
+            target = next(iter(pending))
+            saved = temporary()
+            result.append((saved, target))
+            for other, source in pending.items():
+                if source == target:
+                    pending[other] = saved
+            continue
+        for target in ready:
+            result.append((target, pending.pop(target)))
+    return result
+
+
+# Out-of-SSA translation of basic blocks back to Python source. Live
+# ranges of versions are computed on blocks, versions of one name that
+# do not interfere share a name, the first one is the original name.
+# Phis become parallel copies on edges into their block, the edges are
+# placed in the statements tree: end of body or `else` of `if` and
+# loop, before `break` and `continue`, before loop for the entry edge.
+# `if` without `else` and loop get `else` for copies on their false
+# edge. Functions read variables from outside by their names when they
+# are called, so all versions of such a name are coalesced; when they
+# interfere, assignments store the value to the original name too.
+class SourceEmitter:
+    def __init__(self, builder: BlockBuilder) -> None:
+        self.builder = builder
+        self.blocks = builder.blocks
+        self.function_of = builder.functions()
+        self.defined_in: dict[Value, int] = {}
+        self.instructions: dict[int, tuple[Instruction, Block]] = {}
+        # Loop headers by `id` of their phi statements, merge blocks
+        # by `id` of their first phi statement
+        self.phi_blocks: dict[int, Block] = {}
+        for block in self.blocks:
+            for phi in block.phis:
+                self.defined_in[phi.target.operand] = block._id
+            for instruction in block.instructions:
+                self.instructions[id(instruction.statement)] = (instruction, block)
+                for variable in instruction.defs:
+                    self.defined_in[variable.operand] = block._id
+            if block.phi_statement is not None:
+                self.phi_blocks[id(block.phi_statement)] = block
+            elif block.phi_statements:
+                self.phi_blocks[id(block.phi_statements[0])] = block
+
+        self.reserved: set[str] = set()
+        for instruction in builder.instructions:
+            for part in instruction.parts:
+                if isinstance(part, Variable):
+                    self.reserved.add(part.name)
+                elif not isinstance(part, Literal):
+                    self.reserved.update(findall(r"[A-Za-z_]\w*", part))
+        self.names: dict[Value, str] = {}
+        # Versions whose assignments also store to the original name
+        self.stores: dict[Value, str] = {}
+        self.lines: list[str] = []
+
+    def emit(self) -> str:
+        self.__coalesce(self.__interference())
+        self.__statements(self.builder.statements, 0)
+        return "".join(f"{line}\n" for line in self.lines)
+
+    def scope(self, variable: Variable) -> int | None:
+        source = self.defined_in.get(variable.operand)
+        return None if source is None else self.function_of[source]
+
+    def is_local(self, variable: Variable, function: int) -> bool:
+        return variable.version == 0 or self.scope(variable) == function
+
+    def __fresh(self, name: str) -> str:
+        suffix = 1
+        while f"{name}_{suffix}" in self.reserved:
+            suffix += 1
+        fresh = f"{name}_{suffix}"
+        self.reserved.add(fresh)
+        return fresh
+
+    def __phi_operands(self, block: Block) -> list[Variable]:
+        # Operands that phis of successors read at the end of the block
+        operands: list[Variable] = []
+        for successor_id in block.successors:
+            successor = self.blocks[successor_id]
+            for i, predecessor in enumerate(successor.predecessors):
+                if predecessor == block._id:
+                    operands.extend(phi.operands[i] for phi in successor.phis)
+        return [
+            operand
+            for operand in operands
+            if self.is_local(operand, self.function_of[block._id])
+        ]
+
+    def __interference(self) -> dict[int, dict[Value, set[Value]]]:
+        # Versions of the same name that are live at once, by function.
+        # Functions are not entered from the block they are defined in.
+        entries = {
+            block._id
+            for block in self.blocks
+            if block.instructions
+            and isinstance(block.instructions[0].statement, FunctionStatement)
+        }
+        successors = [
+            [successor for successor in block.successors if successor not in entries]
+            for block in self.blocks
+        ]
+        predecessors: list[list[int]] = [[] for _ in self.blocks]
+        for block_id, targets in enumerate(successors):
+            for successor in targets:
+                predecessors[successor].append(block_id)
+
+        values: Index[Value] = Index()
+        gen, kill = [], []
+        for block in self.blocks:
+            function = self.function_of[block._id]
+            used = defined = 0
+            for phi in block.phis:
+                defined |= 1 << values.add(phi.target.operand)
+            for instruction in block.instructions:
+                for variable in instruction.uses:
+                    if self.is_local(variable, function):
+                        used |= (1 << values.add(variable.operand)) & ~defined
+                for variable in instruction.defs:
+                    defined |= 1 << values.add(variable.operand)
+            for operand in self.__phi_operands(block):
+                used |= (1 << values.add(operand.operand)) & ~defined
+            gen.append(used)
+            kill.append(defined)
+        solution = solve(Problem(gen, kill, forward=False), successors, predecessors)
+
+        graphs: dict[int, dict[Value, set[Value]]] = {}
+        for block in self.blocks:
+            function = self.function_of[block._id]
+            graph = graphs.setdefault(function, {})
+            live = set(values.decode(solution.outs[block._id]))
+            live.update(operand.operand for operand in self.__phi_operands(block))
+            for instruction in reversed(block.instructions):
+                # Target of copy holds the same value as the source
+                source = instruction.parts[2] if is_copy(instruction) else None
+                copied = {source.operand} if isinstance(source, Variable) else set()
+                for variable in instruction.defs:
+                    _interfere(graph, variable.operand, live - copied)
+                for variable in instruction.defs:
+                    live.discard(variable.operand)
+                for variable in instruction.uses:
+                    if self.is_local(variable, function):
+                        live.add(variable.operand)
+            for phi in block.phis:
+                _interfere(graph, phi.target.operand, live)
+        return graphs
+
+    def __ancestors(self, function: int) -> list[int]:
+        scopes = []
+        while function != -1:
+            predecessors = self.blocks[function].predecessors
+            if not predecessors:
+                break
+            function = self.function_of[predecessors[0]]
+            scopes.append(function)
+        return scopes
+
+    def __coalesce(self, graphs: dict[int, dict[Value, set[Value]]]) -> None:
+        # Versions of every name by function, in order of versions
+        families: dict[tuple[int, str], list[Value]] = {}
+        for value, block_id in self.defined_in.items():
+            key = (self.function_of[block_id], value[0])
+            families.setdefault(key, []).append(value)
+
+        # Names read by functions from outside at call time
+        pinned: set[tuple[int, str]] = set()
+        for block in self.blocks:
+            function = self.function_of[block._id]
+            used = [variable for phi in block.phis for variable in phi.operands]
+            for instruction in block.instructions:
+                used.extend(instruction.uses)
+            for variable in used:
+                scope = self.scope(variable)
+                if scope is not None and scope != function:
+                    pinned.add((scope, variable.name))
+                elif scope is None and (function, variable.name) not in families:
+                    pinned.update(
+                        (outer, variable.name) for outer in self.__ancestors(function)
+                    )
+
+        for (function, name), family in families.items():
+            graph = graphs.get(function, {})
+            # Undefined value is the original name, it comes first
+            slots: list[list[Value]] = [[(name, 0)]]
+            for value in sorted(family, key=lambda value: value[1]):
+                interfering = graph.get(value, set())
+                for slot in slots:
+                    if interfering.isdisjoint(slot):
+                        slot.append(value)
+                        break
+                else:
+                    slots.append([value])
+            store = (function, name) in pinned and len(slots) > 1
+            for i, slot in enumerate(slots):
+                slot_name = name if i == 0 and not store else self.__fresh(name)
+                for value in slot:
+                    self.names[value] = slot_name
+                    if store:
+                        self.stores[value] = name
+
+    def __render(self, instruction: Instruction, function: int) -> str:
+        parts = instruction.parts
+        operation = any(
+            isinstance(part, str)
+            and not isinstance(part, Literal)
+            and part.strip() in FUNCTIONS
+            for part in parts
+        )
+        text = []
+        for part in parts:
+            if isinstance(part, Variable):
+                text.append(self.__name(part, function))
+            elif isinstance(part, Literal):
+                text.append(literal(part.value, operation))
+            else:
+                text.append(part)
+        return "".join(text)
+
+    def __name(self, variable: Variable, function: int) -> str:
+        if not self.is_local(variable, function) or variable.version == 0:
+            return variable.name
+        return self.names[variable.operand]
+
+    def __copies(self, source: Block, target: Block, indent: int) -> None:
+        function = self.function_of[target._id]
+        copies = []
+        for i, predecessor in enumerate(target.predecessors):
+            if predecessor != source._id:
+                continue
+            for phi in target.phis:
+                operand = phi.operands[i]
+                # Undefined value is not copied, the target keeps
+                # whatever its name holds
+                if operand.version == 0 and self.is_local(operand, function):
+                    continue
+                copies.append(
+                    (self.names[phi.target.operand], self.__name(operand, function))
+                )
+        for name, value in sequentialize(copies, lambda: self.__fresh("tmp")):
+            self.__line(indent, f"{name} = {value}")
+
+    def __fallthrough(self, statements: list[Statement], indent: int) -> None:
+        edge = self.builder.fallthrough.get(id(statements))
+        if edge is not None and edge[0]._id in edge[1].predecessors:
+            self.__copies(*edge, indent)
+
+    def __line(self, indent: int, text: str) -> None:
+        self.lines.append(INDENT * indent + text)
+
+    def __stores(self, instruction: Instruction, indent: int) -> None:
+        for variable in instruction.defs:
+            name = self.stores.get(variable.operand)
+            if name is not None:
+                self.__line(indent, f"{name} = {self.names[variable.operand]}")
+
+    def __body(self, statements: list[Statement], indent: int) -> None:
+        start = len(self.lines)
+        self.__statements(statements, indent)
+        self.__fallthrough(statements, indent)
+        if len(self.lines) == start:
+            self.__line(indent, "pass")
+
+    def __statements(self, statements: list[Statement], indent: int) -> None:
+        for statement in statements:
+            block = self.phi_blocks.get(id(statement))
+            if block is not None:
+                self.__phis(statement, block, indent)
+                continue
+            found = self.instructions.get(id(statement))
+            if found is None:
+                continue
+            instruction, block = found
+            if statement.node._type in (
+                NodeType.START,
+                NodeType.END,
+                NodeType.FUNCTION_END,
+            ):
+                continue
+            text = self.__render(instruction, self.function_of[block._id])
+            if isinstance(statement, (BreakStatement, ContinueStatement)):
+                for successor in block.successors:
+                    self.__copies(block, self.blocks[successor], indent)
+                self.__line(indent, text)
+            elif isinstance(statement, FunctionStatement):
+                self.__line(indent, f"{text}:")
+                start = len(self.lines)
+                self.__stores(instruction, indent + 1)
+                self.__statements(statement.body, indent + 1)
+                if len(self.lines) == start:
+                    self.__line(indent + 1, "pass")
+            elif isinstance(statement, IfStatement):
+                keyword = "while" if isinstance(statement, WhileStatement) else "if"
+                self.__line(indent, f"{keyword} {text}:")
+                self.__body(statement.body, indent + 1)
+                start = len(self.lines)
+                self.__line(indent, "else:")
+                self.__statements(statement.orelse, indent + 1)
+                self.__fallthrough(statement.orelse, indent + 1)
+                if len(self.lines) == start + 1:
+                    self.lines.pop()
+            else:
+                self.__line(indent, text)
+                self.__stores(instruction, indent)
+
+    def __phis(self, statement: Statement, block: Block, indent: int) -> None:
+        if statement is block.phi_statement:
+            # Loop is entered from the only predecessor that comes
+            # before its header, other edges come from the body
+            for predecessor in block.predecessors:
+                if predecessor < block._id:
+                    self.__copies(self.blocks[predecessor], block, indent)
+        elif len(block.predecessors) == 1:
+            # Phis of block with one predecessor are copies in place,
+            # other merge blocks get copies at the ends of predecessors
+            self.__copies(self.blocks[block.predecessors[0]], block, indent)
+
+
+def _interfere(graph: dict[Value, set[Value]], value: Value, live: set[Value]) -> None:
+    for other in live:
+        if other[0] == value[0] and other != value:
+            graph.setdefault(value, set()).add(other)
+            graph.setdefault(other, set()).add(value)
+
+
+def literal(value: object, operation: bool = False) -> str:
+    if isinstance(value, float) and not isfinite(value):
+        return f"float({str(value)!r})"
+    text = repr(value)
+    # Negative operand of operation, e.g. `(-2) ** 2`
+    if operation and text.startswith("-"):
+        return f"({text})"
+    return text
+
+
+def python_source(builder: BlockBuilder) -> str:
+    return SourceEmitter(builder).emit()
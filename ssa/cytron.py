@@ -0,0 +1,116 @@
+from collections import defaultdict
+from typing import Sequence
+
+from .dataflow import LiveVariables
+from .dominance import (
+    immediate_dominators,
+    dominator_tree,
+    dominance_frontiers,
+    iterated_dominance_frontier,
+)
+from .liveness import SSAForm
+from .lowering import BlockBuilder, Phi, Variable
+
+
+# Cytron et al.: "Efficiently Computing Static Single Assignment Form
+# and the Control Dependence Graph". Phis are placed on the iterated
+# dominance frontier of definitions and versions are assigned in one
+# walk over the dominator tree.
+class DominanceFrontierBuilder(BlockBuilder):
+    def __init__(
+        self, tree, form: SSAForm = SSAForm.MINIMAL, passes: Sequence = ()
+    ) -> None:
+        self.form = form
+        self.phis_avoided = 0
+        super().__init__(tree, passes)
+
+    def build_ssa(self) -> None:
+        successors = [block.successors for block in self.blocks]
+        predecessors = [block.predecessors for block in self.blocks]
+        self.idom = immediate_dominators(successors, predecessors)
+        self.dominator_tree = dominator_tree(self.idom)
+        self.frontiers = dominance_frontiers(predecessors, self.idom)
+
+        self.place_phis()
+        self.rename()
+
+    def place_phis(self) -> None:
+        # Variables in order of first definition
+        definitions: dict[str, set[int]] = defaultdict(set)
+        for block in self.blocks:
+            for instruction in block.instructions:
+                for variable in instruction.defs:
+                    definitions[variable.name].add(block._id)
+
+        live_in: list[set[str]] = []
+        exposed: set[str] = set()
+        if self.form is not SSAForm.MINIMAL:
+            live = LiveVariables(self.blocks)
+            live_in = [live.live_in(block._id) for block in self.blocks]
+            exposed = set(live.names.decode(live.exposed))
+        for name, blocks in definitions.items():
+            for block_id in sorted(iterated_dominance_frontier(self.frontiers, blocks)):
+                block = self.blocks[block_id]
+                if not block.can_hold_phis:
+                    continue
+                if (self.form is SSAForm.PRUNED and name not in live_in[block_id]) or (
+                    self.form is SSAForm.SEMI_PRUNED and name not in exposed
+                ):
+                    self.phis_avoided += 1
+                    continue
+                operands = [Variable(name) for _ in block.predecessors]
+                block.phis.append(Phi(Variable(name), operands))
+
+    def rename(self) -> None:
+        counters: dict[str, int] = defaultdict(int)
+        stacks: dict[str, list[int]] = defaultdict(list)
+
+        def define(variable: Variable) -> None:
+            counters[variable.name] += 1
+            variable.version = counters[variable.name]
+            stacks[variable.name].append(variable.version)
+
+        def use(variable: Variable) -> None:
+            stack = stacks[variable.name]
+            # Version `0` means that variable is not defined on this path
+            variable.version = stack[-1] if stack else 0
+
+        # Bounds of `for` loop are read by several instructions of the
+        # loop, the first one is before the loop and gives the version
+        renamed: set[int] = set()
+
+        # Explicit stack instead of recursion: `None` marks
+        # the exit from the block, when its definitions are popped
+        walk: list[int | None] = [0]
+        defined: list[list[str]] = []
+        while walk:
+            block_id = walk.pop()
+            if block_id is None:
+                for name in defined.pop():
+                    stacks[name].pop()
+                continue
+
+            block = self.blocks[block_id]
+            names = []
+            for phi in block.phis:
+                define(phi.target)
+                names.append(phi.target.name)
+            for instruction in block.instructions:
+                for variable in instruction.uses:
+                    if id(variable) not in renamed:
+                        renamed.add(id(variable))
+                        use(variable)
+                for variable in instruction.defs:
+                    define(variable)
+                    names.append(variable.name)
+
+            for successor_id in block.successors:
+                successor = self.blocks[successor_id]
+                for phi in successor.phis:
+                    for i, predecessor in enumerate(successor.predecessors):
+                        if predecessor == block_id:
+                            use(phi.operands[i])
+
+            defined.append(names)
+            walk.append(None)
+            walk.extend(reversed(self.dominator_tree[block_id]))
@@ -0,0 +1,326 @@
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from typing import Generic, Hashable, Iterable, Iterator, NamedTuple, Sequence, TypeVar
+
+from . import profiling
+from .dominance import reverse_postorder
+from .lowering import Block, Variable
+from .operators import OPERATORS
+
+T = TypeVar("T", bound=Hashable)
+
+
+# Dense ids of facts, a set of facts is an `int` with bit `id` set
+# for every fact in it. Python integers are arbitrary precision, so
+# union, intersection and difference of thousands of facts are
+# single operations.
+class Index(Generic[T]):
+    def __init__(self, items: Iterable[T] = ()) -> None:
+        self.ids: dict[T, int] = {}
+        self.items: list[T] = []
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self.ids
+
+    def add(self, item: T) -> int:
+        if (found := self.ids.get(item)) is not None:
+            return found
+        self.ids[item] = len(self.items)
+        self.items.append(item)
+        return self.ids[item]
+
+    def bit(self, item: T) -> int:
+        return 1 << self.ids[item]
+
+    def bits(self, items: Iterable[T]) -> int:
+        result = 0
+        for item in items:
+            result |= 1 << self.ids[item]
+        return result
+
+    @property
+    def universe(self) -> int:
+        return (1 << len(self.items)) - 1
+
+    def decode(self, bits: int) -> list[T]:
+        items = []
+        while bits:
+            low = bits & -bits
+            items.append(self.items[low.bit_length() - 1])
+            bits ^= low
+        return items
+
+
+@dataclass
+class Problem:
+    # Effect of every block: `out = gen | (in & ~kill)`,
+    # for backward problems `in` and `out` swap places
+    gen: list[int]
+    kill: list[int]
+    forward: bool = True
+    # Facts must hold on all paths, meet is intersection
+    # instead of union and blocks start with `universe`
+    must: bool = False
+    # Facts at the entry of forward problem or at exits of backward one
+    boundary: int = 0
+    universe: int = 0
+
+
+@dataclass
+class Solution:
+    # Facts before and after every block in execution order
+    ins: list[int]
+    outs: list[int]
+    # Blocks taken from the worklist
+    visits: int
+
+
+# Worklist solver, blocks are taken in reverse postorder for forward
+# problems and in postorder for backward ones, so in the graph without
+# loops every block is taken once. Blocks that are not reachable from
+# `entry` are solved after the others.
+def solve(
+    problem: Problem,
+    successors: Sequence[Sequence[int]],
+    predecessors: Sequence[Sequence[int]],
+    entry: int = 0,
+) -> Solution:
+    count = len(successors)
+    order = reverse_postorder(successors, entry) if count else []
+    if len(order) != count:
+        reached = set(order)
+        order.extend(block for block in range(count) if block not in reached)
+    if problem.forward:
+        sources, targets = predecessors, successors
+    else:
+        sources, targets = successors, predecessors
+        order.reverse()
+    position = [0] * count
+    for i, block in enumerate(order):
+        position[block] = i
+
+    gen, kill, boundary = problem.gen, problem.kill, problem.boundary
+    start = problem.universe if problem.must else 0
+    # `before` is `in` of forward problem and `out` of backward one
+    before = [start] * count
+    after = [gen[block] | (start & ~kill[block]) for block in range(count)]
+
+    worklist = list(range(count))
+    queued = [True] * count
+    visits = 0
+    with profiling.phase("dataflow"):
+        while worklist:
+            block = order[heappop(worklist)]
+            queued[block] = False
+            visits += 1
+            block_sources = sources[block]
+            if not block_sources or (problem.forward and block == entry):
+                value = boundary
+            elif problem.must:
+                value = problem.universe
+                for source in block_sources:
+                    value &= after[source]
+            else:
+                value = 0
+                for source in block_sources:
+                    value |= after[source]
+            before[block] = value
+            value = gen[block] | (value & ~kill[block])
+            if value == after[block]:
+                continue
+            after[block] = value
+            for target in targets[block]:
+                if not queued[target]:
+                    queued[target] = True
+                    heappush(worklist, position[target])
+    profiling.count("dataflow_visits", visits)
+
+    if problem.forward:
+        return Solution(before, after, visits)
+    return Solution(after, before, visits)
+
+
+def graph(blocks: Sequence[Block]) -> tuple[list[list[int]], list[list[int]]]:
+    return (
+        [block.successors for block in blocks],
+        [block.predecessors for block in blocks],
+    )
+
+
+class Definition(NamedTuple):
+    block: int
+    # Position of instruction in the block
+    position: int
+    variable: Variable
+
+
+class Use(NamedTuple):
+    block: int
+    position: int
+    variable: Variable
+
+
+def definitions(blocks: Sequence[Block]) -> Iterator[Definition]:
+    for block in blocks:
+        for index, instruction in enumerate(block.instructions):
+            for variable in instruction.defs:
+                yield Definition(block._id, index, variable)
+
+
+# Analyses below work on names of variables in instructions of blocks
+# made by `BlockBuilder`, so they give the same result before and
+# after versions are assigned. Phis are not instructions and are left
+# out, they only rename values that reach the merge point.
+
+
+# Definitions that reach the entry of every block without being
+# overwritten on some path
+class ReachingDefinitions:
+    def __init__(self, blocks: Sequence[Block]) -> None:
+        self.definitions: Index[Definition] = Index(definitions(blocks))
+        by_name: dict[str, int] = {}
+        for definition in self.definitions.items:
+            name = definition.variable.name
+            by_name[name] = by_name.get(name, 0) | self.definitions.bit(definition)
+        self.by_name = by_name
+
+        gen, kill = [], []
+        for block in blocks:
+            generated = killed = 0
+            for index, instruction in enumerate(block.instructions):
+                for variable in instruction.defs:
+                    every = by_name[variable.name]
+                    bit = self.definitions.bit(Definition(block._id, index, variable))
+                    generated = (generated & ~every) | bit
+                    killed |= every
+            gen.append(generated)
+            kill.append(killed)
+        self.solution = solve(Problem(gen, kill), *graph(blocks))
+
+    def reaching(self, block: int) -> list[Definition]:
+        return self.definitions.decode(self.solution.ins[block])
+
+
+# Names that are read on some path from the entry of every block
+# before they are assigned
+class LiveVariables:
+    def __init__(self, blocks: Sequence[Block]) -> None:
+        self.names: Index[str] = Index()
+        gen, kill = [], []
+        for block in blocks:
+            used = defined = 0
+            for instruction in block.instructions:
+                for variable in instruction.uses:
+                    used |= self.__bit(variable.name) & ~defined
+                for variable in instruction.defs:
+                    defined |= self.__bit(variable.name)
+            gen.append(used)
+            kill.append(defined)
+        # Names read before assignment in the same block
+        self.exposed = 0
+        for used in gen:
+            self.exposed |= used
+        self.solution = solve(Problem(gen, kill, forward=False), *graph(blocks))
+
+    def __bit(self, name: str) -> int:
+        return 1 << self.names.add(name)
+
+    def live_in(self, block: int) -> set[str]:
+        return set(self.names.decode(self.solution.ins[block]))
+
+    def live_out(self, block: int) -> set[str]:
+        return set(self.names.decode(self.solution.outs[block]))
+
+
+# Operands of `x = a + b` are names and strings of constants, names are
+# wrapped in tuples, so that name `a` and string `a` differ
+Expression = tuple[str | tuple[str], ...]
+
+
+def expression(parts: Sequence[str | Variable]) -> Expression | None:
+    # Binary operation on the right side of assignment, calls
+    # have side effects and are never available
+    match parts:
+        case [Variable(), " = ", lhs, str(operator), rhs] if (
+            operator.strip() in OPERATORS.values()
+        ):
+            return tuple(
+                part if isinstance(part, str) else (part.name,)
+                for part in (lhs, operator, rhs)
+            )
+    return None
+
+
+# Expressions computed on every path to the entry of every block with
+# no operand assigned after the computation
+class AvailableExpressions:
+    def __init__(self, blocks: Sequence[Block]) -> None:
+        self.expressions: Index[Expression] = Index()
+        computed: list[list[tuple[Expression | None, list[str]]]] = []
+        for block in blocks:
+            instructions = []
+            for instruction in block.instructions:
+                found = expression(instruction.parts)
+                if found is not None:
+                    self.expressions.add(found)
+                names = [variable.name for variable in instruction.defs]
+                instructions.append((found, names))
+            computed.append(instructions)
+
+        # Expressions that read every name
+        readers: dict[str, int] = {}
+        for item in self.expressions.items:
+            for part in item:
+                if isinstance(part, tuple):
+                    bit = self.expressions.bit(item)
+                    readers[part[0]] = readers.get(part[0], 0) | bit
+
+        gen, kill = [], []
+        for instructions in computed:
+            generated = killed = 0
+            for found, names in instructions:
+                if found is not None:
+                    generated |= self.expressions.bit(found)
+                for name in names:
+                    generated &= ~readers.get(name, 0)
+                    killed |= readers.get(name, 0)
+            gen.append(generated)
+            kill.append(killed)
+        self.solution = solve(
+            Problem(gen, kill, must=True, universe=self.expressions.universe),
+            *graph(blocks),
+        )
+
+    def available(self, block: int) -> list[Expression]:
+        return self.expressions.decode(self.solution.ins[block])
+
+
+# Definitions every use can read and uses every definition can reach,
+# both built from reaching definitions
+class DefUseChains:
+    def __init__(self, blocks: Sequence[Block]) -> None:
+        reaching = ReachingDefinitions(blocks)
+        index = reaching.definitions
+        self.use_defs: dict[Use, list[Definition]] = {}
+        self.def_uses: dict[Definition, list[Use]] = {
+            definition: [] for definition in index.items
+        }
+        for block in blocks:
+            current = reaching.solution.ins[block._id]
+            for position, instruction in enumerate(block.instructions):
+                for variable in instruction.uses:
+                    use = Use(block._id, position, variable)
+                    found = index.decode(
+                        current & reaching.by_name.get(variable.name, 0)
+                    )
+                    self.use_defs[use] = found
+                    for definition in found:
+                        self.def_uses[definition].append(use)
+                for variable in instruction.defs:
+                    bit = index.bit(Definition(block._id, position, variable))
+                    current = (current & ~reaching.by_name[variable.name]) | bit
@@ -0,0 +1,242 @@
+from array import array
+from operator import itemgetter
+from string import Formatter
+from typing import Any, Iterable, Iterator, Sequence
+
+from .cfg import CompressedRows, ControlFlowGraph
+from .statements import NAMES, NodeData, NodeType, Statement
+
+Operands = list[tuple[str, int]]
+
+
+def node_operands(node: NodeData) -> tuple[Operands, Operands]:
+    # Definitions and uses of drawn node: operands before ` = ` of
+    # every line of assignment are defined, `def` defines parameters
+    defs: Operands = []
+    uses: Operands = []
+    target = node._type in (NodeType.ASSIGN, NodeType.FUNCTION_DEF)
+    variables = node.variables()
+    for text, field, _, _ in Formatter().parse(node.template):
+        if node._type is NodeType.ASSIGN:
+            if "\n" in text:
+                text = text.rsplit("\n", 1)[1]
+                target = True
+            if " = " in text:
+                target = False
+        if field is not None:
+            name_id, version = next(variables)
+            (defs if target else uses).append((NAMES[name_id], version))
+    return defs, uses
+
+
+# Def-use chains of basic blocks in SSA form. Sites are phis and
+# instructions, anything with `defs` and `uses` lists of variables,
+# or statements of drawn nodes in graph of the structured backend.
+# Values `name.version` get dense ids through tables by interned name
+# id, uses of every value are its row of `rows`. Removed uses are `-1`
+# in their row and uses added after the build wait in `added` until
+# rows are compacted. Passes pass every site they change in place to
+# `update` and removed sites to `remove`, so the index is built once.
+class DefUseIndex:
+    def __init__(self, blocks: Sequence = ()) -> None:
+        # Value ids by interned name id and version, `-1` for none
+        self.value_ids: list[array] = []
+        self.values: list[tuple[str, int]] = []
+        # Site that defines every value or `-1`
+        self.definitions = array("i")
+        self.sites: list = []
+        self.site_blocks = array("i")
+        self.__site_ids: dict[int, int] = {}
+        # Values defined and used by every site when it was indexed
+        self.__indexed: list[tuple[tuple[int, ...], tuple[int, ...]]] = []
+        self.added: dict[int, list[int]] = {}
+        self.__added = 0
+
+        self.rows = CompressedRows(array("i", [0]), array("i"))
+        self.__build(
+            (site, block._id)
+            for block in blocks
+            for site in (*block.phis, *block.instructions)
+        )
+
+    @classmethod
+    def from_graph(cls, graph: ControlFlowGraph) -> "DefUseIndex":
+        # Sites are statements of nodes, blocks are blocks of the graph
+        index = cls()
+        index.__build(
+            (graph.statement(node), graph.node_block[node])
+            for node in range(graph.num_nodes)
+        )
+        return index
+
+    def __build(self, sites: Iterable[tuple[Any, int]]) -> None:
+        pairs: list[tuple[int, int]] = []
+        for site, block in sites:
+            number = self.__add_site(site, block)
+            pairs.extend((value, number) for value in self.__indexed[number][1])
+        # Sort is stable, so users of a value are in order of blocks
+        pairs.sort(key=itemgetter(0))
+        self.rows = CompressedRows.from_pairs(len(self.values), pairs)
+
+    def __value(self, operand: tuple[str, int]) -> int:
+        name, version = operand
+        name_id = NAMES.intern(name)
+        while len(self.value_ids) <= name_id:
+            self.value_ids.append(array("i"))
+        ids = self.value_ids[name_id]
+        if len(ids) <= version:
+            ids.extend([-1] * (version + 1 - len(ids)))
+        if ids[version] == -1:
+            ids[version] = len(self.values)
+            self.values.append(operand)
+            self.definitions.append(-1)
+        return ids[version]
+
+    def __find(self, operand: tuple[str, int]) -> int:
+        name_id = NAMES.ids.get(operand[0])
+        if name_id is None or name_id >= len(self.value_ids):
+            return -1
+        ids = self.value_ids[name_id]
+        return ids[operand[1]] if operand[1] < len(ids) else -1
+
+    def __operands(self, site) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        if isinstance(site, Statement):
+            defs, uses = node_operands(site.node)
+        else:
+            defs = [variable.operand for variable in site.defs]
+            uses = [variable.operand for variable in site.uses]
+        return (
+            tuple(self.__value(operand) for operand in defs),
+            tuple(self.__value(operand) for operand in uses),
+        )
+
+    def __add_site(self, site, block: int) -> int:
+        number = len(self.sites)
+        self.sites.append(site)
+        self.site_blocks.append(block)
+        self.__site_ids[id(site)] = number
+        self.__indexed.append(self.__operands(site))
+        for value in self.__indexed[number][0]:
+            self.definitions[value] = number
+        return number
+
+    def __add_use(self, value: int, number: int) -> None:
+        targets = self.rows.targets
+        if value < len(self.rows):
+            for i in self.rows.range(value):
+                if targets[i] == -1:
+                    targets[i] = number
+                    return
+        self.added.setdefault(value, []).append(number)
+        self.__added += 1
+        if self.__added > len(targets):
+            self.compact()
+
+    def __remove_use(self, value: int, number: int) -> None:
+        added = self.added.get(value)
+        if added and number in added:
+            added.remove(number)
+            self.__added -= 1
+            return
+        if value >= len(self.rows):
+            return
+        targets = self.rows.targets
+        for i in self.rows.range(value):
+            if targets[i] == number:
+                targets[i] = -1
+                return
+
+    def __users(self, value: int) -> Iterator[int]:
+        if value < len(self.rows):
+            yield from (number for number in self.rows[value] if number != -1)
+        yield from self.added.get(value, ())
+
+    def compact(self) -> None:
+        # Added uses are moved to rows, removed uses are dropped
+        pairs = [
+            (value, number)
+            for value in range(len(self.values))
+            for number in self.__users(value)
+        ]
+        self.rows = CompressedRows.from_pairs(len(self.values), pairs)
+        self.added.clear()
+        self.__added = 0
+
+    def add(self, site, block: int) -> None:
+        number = self.__add_site(site, block)
+        for value in self.__indexed[number][1]:
+            self.__add_use(value, number)
+
+    def remove(self, site) -> None:
+        number = self.__site_ids.pop(id(site))
+        defs, uses = self.__indexed[number]
+        for value in defs:
+            if self.definitions[value] == number:
+                self.definitions[value] = -1
+        for value in uses:
+            self.__remove_use(value, number)
+        self.sites[number] = None
+        self.__indexed[number] = ((), ())
+
+    def update(self, site) -> None:
+        # Variables of the site were changed in place, only
+        # uses that differ are moved
+        number = self.__site_ids[id(site)]
+        old_defs, old_uses = self.__indexed[number]
+        defs, uses = self.__operands(site)
+        if defs != old_defs:
+            for value in old_defs:
+                if self.definitions[value] == number:
+                    self.definitions[value] = -1
+            for value in defs:
+                self.definitions[value] = number
+        if uses != old_uses:
+            kept = list(old_uses)
+            for value in uses:
+                if value in kept:
+                    kept.remove(value)
+                else:
+                    self.__add_use(value, number)
+            for value in kept:
+                self.__remove_use(value, number)
+        self.__indexed[number] = (defs, uses)
+
+    def definition(self, operand: tuple[str, int]):
+        # Phi or instruction that defines the value
+        value = self.__find(operand)
+        if value == -1 or self.definitions[value] == -1:
+            return None
+        return self.sites[self.definitions[value]]
+
+    def defined_in(self, operand: tuple[str, int]) -> int | None:
+        # Block of the definition of the value
+        value = self.__find(operand)
+        if value == -1 or self.definitions[value] == -1:
+            return None
+        return self.site_blocks[self.definitions[value]]
+
+    def users(self, operand: tuple[str, int]) -> list[tuple[int, Any]]:
+        # Block and site of every use, sites that read
+        # the value twice are there twice
+        value = self.__find(operand)
+        if value == -1:
+            return []
+        return [
+            (self.site_blocks[number], self.sites[number])
+            for number in self.__users(value)
+        ]
+
+    def versions(self, name: str) -> list[int]:
+        # Versions that are defined or read
+        name_id = NAMES.ids.get(name)
+        if name_id is None or name_id >= len(self.value_ids):
+            return []
+        return [
+            version
+            for version, value in enumerate(self.value_ids[name_id])
+            if value != -1
+            and (
+                self.definitions[value] != -1
+                or next(self.__users(value), None) is not None
+            )
+        ]
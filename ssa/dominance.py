@@ -0,0 +1,104 @@
+from typing import Iterable, Sequence
+
+
+# Blocks are dense integers, graph is given by successor
+# and predecessor lists. Unreachable blocks get `-1` as
+# immediate dominator and are ignored by all functions.
+
+
+def reverse_postorder(successors: Sequence[Sequence[int]], entry: int = 0) -> list[int]:
+    visited = [False] * len(successors)
+    postorder = []
+    visited[entry] = True
+    stack = [(entry, iter(successors[entry]))]
+    while stack:
+        block, children = stack[-1]
+        for child in children:
+            if not visited[child]:
+                visited[child] = True
+                stack.append((child, iter(successors[child])))
+                break
+        else:
+            stack.pop()
+            postorder.append(block)
+    postorder.reverse()
+    return postorder
+
+
+# Cooper, Harvey, Kennedy: "A Simple, Fast Dominance Algorithm"
+def immediate_dominators(
+    successors: Sequence[Sequence[int]],
+    predecessors: Sequence[Sequence[int]],
+    entry: int = 0,
+) -> list[int]:
+    order = reverse_postorder(successors, entry)
+    position = [-1] * len(successors)
+    for i, block in enumerate(order):
+        position[block] = i
+
+    idom = [-1] * len(successors)
+    idom[entry] = entry
+
+    def intersect(lhs: int, rhs: int) -> int:
+        while lhs != rhs:
+            while position[lhs] > position[rhs]:
+                lhs = idom[lhs]
+            while position[rhs] > position[lhs]:
+                rhs = idom[rhs]
+        return lhs
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new_idom = -1
+            for predecessor in predecessors[block]:
+                if idom[predecessor] == -1:
+                    continue
+                if new_idom == -1:
+                    new_idom = predecessor
+                else:
+                    new_idom = intersect(predecessor, new_idom)
+            if idom[block] != new_idom:
+                idom[block] = new_idom
+                changed = True
+    return idom
+
+
+def dominator_tree(idom: Sequence[int]) -> list[list[int]]:
+    children: list[list[int]] = [[] for _ in idom]
+    for block, parent in enumerate(idom):
+        if parent not in (-1, block):
+            children[parent].append(block)
+    return children
+
+
+def dominance_frontiers(
+    predecessors: Sequence[Sequence[int]], idom: Sequence[int]
+) -> list[set[int]]:
+    frontiers: list[set[int]] = [set() for _ in idom]
+    for block, block_predecessors in enumerate(predecessors):
+        if idom[block] == -1 or len(block_predecessors) < 2:
+            continue
+        for predecessor in block_predecessors:
+            if idom[predecessor] == -1:
+                continue
+            runner = predecessor
+            while runner != idom[block]:
+                frontiers[runner].add(block)
+                runner = idom[runner]
+    return frontiers
+
+
+def iterated_dominance_frontier(
+    frontiers: Sequence[set[int]], blocks: Iterable[int]
+) -> set[int]:
+    result: set[int] = set()
+    worklist = list(blocks)
+    while worklist:
+        block = worklist.pop()
+        for frontier in frontiers[block]:
+            if frontier not in result:
+                result.add(frontier)
+                worklist.append(frontier)
+    return result
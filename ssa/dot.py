@@ -0,0 +1,82 @@
+from re import S, compile as regex
+from typing import TextIO
+
+# Quoting rules of `pydot`, so the text is the same as it writes
+KEYWORDS = ("graph", "subgraph", "digraph", "node", "edge", "strict")
+ALPHA_NUMS = regex(r"^[_a-zA-Z][a-zA-Z0-9_,]*$")
+ALPHA_NUMS_WITH_PORTS = regex(r'^[_a-zA-Z][a-zA-Z0-9_,:"]*[a-zA-Z0-9_,"]+$')
+NUM = regex(r"^[0-9,]+$")
+WITH_PORT = regex(r"^([^:]*):([^:]*)$")
+DOUBLE_QUOTED = regex(r'^".*"$', S)
+HTML = regex(r"^<.*>$", S)
+
+
+def needs_quotes(value: str) -> bool:
+    if value in KEYWORDS:
+        return False
+    special = any(ord(char) > 0x7F or ord(char) == 0 for char in value)
+    if special and not DOUBLE_QUOTED.match(value) and not HTML.match(value):
+        return True
+    for pattern in (ALPHA_NUMS, NUM, DOUBLE_QUOTED, HTML, ALPHA_NUMS_WITH_PORTS):
+        if pattern.match(value):
+            return False
+    if match := WITH_PORT.match(value):
+        return needs_quotes(match.group(1)) or needs_quotes(match.group(2))
+    return True
+
+
+def quote(value: str | int) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if value == "":
+        return '""'
+    if needs_quotes(value):
+        value = value.replace('"', r"\"").replace("\n", r"\n").replace("\r", r"\r")
+        return f'"{value}"'
+    return value
+
+
+def attributes(attrs: dict[str, str]) -> str:
+    if not attrs:
+        return ""
+    return " [" + ", ".join(f"{key}={quote(attrs[key])}" for key in sorted(attrs)) + "]"
+
+
+# Writes DOT text straight to the file in the order graph is built.
+# Every subgraph is written at the moment it is opened, which gives
+# the same text as `pydot`, because `GraphBuilder` adds nothing to the
+# parent graph while a cluster is open.
+class DotWriter:
+    def __init__(self, file: TextIO, name: str = "G", **attrs: str) -> None:
+        self.file = file
+        self.graph = None
+        file.write(f"digraph {quote(name)} {{\n")
+        self.__write_attributes(attrs)
+
+    def node(self, name: int, **attrs: str) -> None:
+        self.file.write(f"{quote(name)}{attributes(attrs)};\n")
+
+    def edge(self, source: int, target: int, **attrs: str) -> None:
+        text = attributes(attrs)
+        if text:
+            text = f" {text}"
+        self.file.write(f"{quote(source)} -> {quote(target)}{text};\n")
+
+    def sink(self, name: int, **attrs: str) -> None:
+        # Node in its own subgraph with `rank="sink"`
+        self.file.write("subgraph  {\nrank=sink;\n")
+        self.node(name, **attrs)
+        self.file.write("}\n\n")
+
+    def begin_cluster(self, name: str) -> None:
+        self.file.write(f"subgraph {quote(f'cluster_{name}')} {{\n")
+
+    def end_cluster(self) -> None:
+        self.file.write("}\n\n")
+
+    def close(self) -> None:
+        self.file.write("}\n")
+
+    def __write_attributes(self, attrs: dict[str, str]) -> None:
+        for key in sorted(attrs):
+            self.file.write(f"{key}={quote(attrs[key])};\n")
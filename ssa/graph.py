@@ -1,40 +1,133 @@
-from pydot import Dot, Node, Edge, Subgraph, Cluster
+from array import array
+from typing import TextIO
 
+try:
+    from pydot import Dot, Node, Edge, Subgraph, Cluster
+except ImportError:  # `pydot` is needed only for `GraphBuilder.graph`
+    Dot = None
+
+from . import profiling
 from .builder import NodeType, NodeData, CFGBuilder
-from .statements import (
-    Statement,
-    IfStatement,
-    WhileStatement,
-    BreakStatement,
-    ContinueStatement,
-    FunctionStatement,
-    ReturnStatement,
-)
+from .cfg import ControlFlowGraph, EdgeKind, edge_label
+from .dot import DotWriter, quote
+from .interpreter import Heat
+
+
+class PydotWriter:
+    # Builds `pydot` graph with the same calls as `DotWriter`
+    def __init__(self, **attrs: str) -> None:
+        if Dot is None:
+            raise ImportError("pydot is required to build pydot graph")
+        self.graph = Dot(graph_type="digraph", **attrs)
+        self.graphs = [self.graph]
+
+    def node(self, name: int, **attrs: str) -> None:
+        self.graphs[-1].add_node(Node(name, **attrs))
+
+    def edge(self, source: int, target: int, **attrs: str) -> None:
+        self.graphs[-1].add_edge(Edge(source, target, **attrs))
+
+    def sink(self, name: int, **attrs: str) -> None:
+        subgraph = Subgraph(rank="sink")
+        subgraph.add_node(Node(name, **attrs))
+        self.graphs[-1].add_subgraph(subgraph)
+
+    def begin_cluster(self, name: str) -> None:
+        self.graphs.append(Cluster(name))
+
+    def end_cluster(self) -> None:
+        cluster = self.graphs.pop()
+        self.graphs[-1].add_subgraph(cluster)
+
+    def close(self) -> None:
+        pass
+
+
+class HeatWriter:
+    # Fills nodes with colors of how often they ran and adds
+    # to labels of branch edges how often they were taken
+    def __init__(self, writer: "DotWriter | PydotWriter", heat: Heat) -> None:
+        self.writer = writer
+        self.graph = writer.graph
+        self.heat = heat
+
+    def node(self, name: int, **attrs: str) -> None:
+        self.writer.node(name, **self.__fill(name, attrs))
+
+    def edge(self, source: int, target: int, **attrs: str) -> None:
+        taken = self.heat.branches.get(source)
+        label = attrs.get("label", "")
+        if taken is not None and label[:1] in ("T", "F"):
+            count = taken[0] if label[0] == "T" else taken[1]
+            attrs = {**attrs, "label": f"{label} {count}"}
+            if sum(taken):
+                attrs["penwidth"] = f"{1 + 3 * count / sum(taken):.1f}"
+        self.writer.edge(source, target, **attrs)
+
+    def sink(self, name: int, **attrs: str) -> None:
+        self.writer.sink(name, **self.__fill(name, attrs))
+
+    def begin_cluster(self, name: str) -> None:
+        self.writer.begin_cluster(name)
+
+    def end_cluster(self) -> None:
+        self.writer.end_cluster()
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def __fill(self, name: int, attrs: dict[str, str]) -> dict[str, str]:
+        count = self.heat.nodes.get(name)
+        if not count:
+            return attrs
+        return {
+            **attrs,
+            "style": "filled",
+            "fillcolor": self.heat.color(count),
+            "xlabel": str(count),
+        }
 
 
 class GraphBuilder:
-    def __init__(self, builder: CFGBuilder):
-        self.statements: list[Statement] = builder.statements
-
-        self.graph: Dot = Dot(graph_type="digraph", compound="true")
-        self.current = None
-        self.previous = None
-
-        # Need to handle when we should mark edge as `True`
-        # or which edge we need to mark it as `False`.
-        # If `IF` node already in this list, that means
-        # that we need the edge as `False`, because
-        # at the first round we mark another edge as `True`.
-        # `True` branch is first and `False` is the second.
-        self.if_nodes: list[NodeData] = []
-        self.id2statement = builder.id2statement
-        self.node_after_while = builder.node_after_while
-
-        # This thing need for function definition block
-        self.current_function_cluster = None
+    def __init__(
+        self,
+        builder: CFGBuilder,
+        output: TextIO | None = None,
+        heat: Heat | None = None,
+    ):
+        # Nodes are drawn in order of the graph with edges into them,
+        # so edges inside a function are written inside its cluster
+        self.cfg = ControlFlowGraph.from_builder(builder)
+
+        # DOT text is written straight to `output`, otherwise
+        # `pydot` graph is built and kept in `graph`
+        self.writer: DotWriter | PydotWriter | HeatWriter
+        if output is None:
+            self.writer = PydotWriter(compound="true")
+        else:
+            self.writer = DotWriter(output, compound="true")
+        # Counts of a run of the program, see `interpreter.heat_map`
+        if heat is not None:
+            self.writer = HeatWriter(self.writer, heat)
+        self.graph = self.writer.graph
+
+        # Last node nested in every node, nodes are in pre-order,
+        # so cluster of a function ends after its last nested node
+        self.last = array("i", range(self.cfg.num_nodes))
+        for node in reversed(range(self.cfg.num_nodes)):
+            parent = self.cfg.parents[node]
+            if parent != -1:
+                self.last[parent] = max(self.last[parent], self.last[node])
+        # Functions by their last statement, edges out of the function
+        # are clipped at its cluster
+        self.function_ends: dict[int, int] = {}
+        for i in range(0, len(self.cfg.functions), 2):
+            self.function_ends[self.cfg.functions[i + 1]] = self.cfg.functions[i]
 
         # Build graph
-        self.build()
+        with profiling.phase("graph"):
+            self.build()
+            self.writer.close()
 
     @staticmethod
     def get_color(node_type: NodeType) -> str:
@@ -54,259 +147,80 @@ class GraphBuilder:
             case _:
                 return "box"
 
-    def get_edge_label(self, previous: NodeData) -> str:
-        match previous._type:
-            case NodeType.IF if previous in self.if_nodes:
-                return "F"
+    def add_node(self, node: NodeData) -> None:
+        match node._type:
             case NodeType.IF:
-                self.if_nodes.append(previous)
-                return "T"
-            case _:
-                return ""
-
-    def add_edge(
-        self,
-        previous: NodeData,
-        current: NodeData,
-        *,
-        is_break=False,
-        is_continue=False,
-        ltail="",
-        lhead="",
-        phi=False,
-    ) -> None:
-        # "is_break" and "is_continue"
-        # cannot be assigned "True" both
-        assert not is_break or not is_continue
-
-        label = self.get_edge_label(previous)
-
-        # Label for "break" branch
-        if is_break and label != "":
-            label = f"{label} (B)"
-        elif is_break:
-            label = "B"
-
-        # Label for "continue" branch
-        if is_continue and label != "":
-            label = f"{label} (C)"
-        elif is_continue:
-            label = "C"
-
-        if phi:
-            current_id = current._id - 1
-        else:
-            current_id = current._id
-
-        self.graph.add_edge(
-            Edge(previous._id, current_id, label=label, ltail=ltail, lhead=lhead)
-        )
-
-    def build(self):
-        for statement in self.statements:
-            self.previous, self.current = self.current, [statement.node]
-            if isinstance(statement, WhileStatement):
-                self.graph.add_node(
-                    Node(
-                        self.current[0]._id,
-                        label=self.current[0].label,
-                        shape="diamond",
-                    )
-                )
-
-                if self.previous is not None:
-                    for item in self.previous:
-                        self.add_edge(item, self.current[0])
-
-                current = self.current
-                statements, self.statements = self.statements, statement.body
-                self.build()
-                self.current, body_current = current, self.current
-                self.statements = statements
-
-                if body_current is not None:
-                    for item in body_current:
-                        match item._type:
-                            case NodeType.BREAK | NodeType.CONTINUE | NodeType.RETURN:
-                                current.append(item)
-                            case _:
-                                self.add_edge(item, current[0], phi=True)
-            elif isinstance(statement, IfStatement):
-                self.graph.add_node(
-                    Node(
-                        self.current[0]._id,
-                        label=self.current[0].label,
-                        shape="diamond",
-                    )
-                )
-
-                if self.previous is not None:
-                    for item in self.previous:
-                        match item._type:
-                            case NodeType.BREAK | NodeType.CONTINUE | NodeType.RETURN:
-                                continue
-                            case _:
-                                self.add_edge(item, self.current[0])
-
-                current = self.current
-                statements, self.statements = self.statements, statement.body
-                self.build()
-                self.current, body_current = current, self.current
-                self.statements = statements
-
-                current = self.current
-                statements, self.statements = self.statements, statement.orelse
-                self.build()
-                self.current, orelse_current = current, self.current
-                self.statements = statements
-
-                if body_current is None:
-                    self.current = orelse_current
-                elif orelse_current is None:
-                    self.current = body_current
-                else:
-                    self.current = body_current + orelse_current
-            elif isinstance(statement, BreakStatement):
-                while_statement = statement.while_statement.node._id
-                for item in self.previous:
-                    self.add_edge(
-                        item,
-                        self.id2statement[self.node_after_while[while_statement]].node,
-                        is_break=True,
-                    )
-                return
-            elif isinstance(statement, ContinueStatement):
-                for item in self.previous:
-                    self.add_edge(
-                        item,
-                        statement.while_statement.node,
-                        is_continue=True,
-                    )
-                return
-            elif isinstance(statement, ReturnStatement):
-                node = Node(
-                    self.current[0]._id,
-                    label=self.current[0].label,
+                self.writer.node(node._id, label=node.label, shape="diamond")
+            case NodeType.RETURN:
+                self.writer.node(
+                    node._id,
+                    label=node.label,
                     shape="box",
                     style="filled",
                     fillcolor="grey",
                 )
-                self.graph.add_node(node)
-                for item in self.previous:
-                    match item._type:
-                        case NodeType.BREAK | NodeType.CONTINUE | NodeType.RETURN:
-                            continue
-                        case _:
-                            if self.current_function_cluster is not None:
-                                # This case needs when we have last
-                                # function definition block
-                                self.add_edge(
-                                    item,
-                                    self.current[0],
-                                    ltail=self.current_function_cluster.get_name(),
-                                )
-                            else:
-                                self.add_edge(item, self.current[0])
-                self.add_edge(self.current[0], statement.
-                end_of_function_statement.node)
-                continue
-            elif isinstance(statement, FunctionStatement):
-                self.current_function_cluster = None
-                function_cluster = Cluster(self.current[0].label)
-
-                function_node = Node(
-                    self.current[0]._id,
-                    label=self.current[0].label,
+            case NodeType.FUNCTION_DEF:
+                self.writer.node(
+                    node._id,
+                    label=node.label,
                     shape="egg",
                     style="filled",
                     fillcolor="orange",
                 )
-                self.graph.add_node(function_node)
-
-                for item in self.previous:
-                    self.add_edge(
-                        item,
-                        self.current[0],
-                        ltail=function_cluster.get_name(),
-                        lhead=function_cluster.get_name(),
-                    )
-
-                # Pre
-                current = self.current
-                statements, self.statements = self.statements, statement.body
-                graph, self.graph = self.graph, function_cluster
-
-                # Build body
-                self.build()
-
-                # Post
-                self.current, body_current = current, self.current
-                self.statements = statements
-                self.graph = graph
-                self.graph.add_subgraph(function_cluster)
-                self.current = body_current
-                self.current_function_cluster = function_cluster
-            elif (
-                isinstance(statement, Statement)
-                and statement.node._type is NodeType.FUNCTION_END
-            ):
-                node = Node(
-                    self.current[0]._id,
-                    label=self.current[0].label,
+            case NodeType.FUNCTION_END:
+                self.writer.sink(
+                    node._id,
+                    label=node.label,
                     shape="egg",
                     style="filled",
                     fillcolor="orange",
                 )
-                subgraph = Subgraph(rank="sink")
-                subgraph.add_node(node)
-                self.graph.add_subgraph(subgraph)
-                for item in self.previous:
-                    match item._type:
-                        case NodeType.BREAK | NodeType.CONTINUE | NodeType.RETURN:
-                            continue
-                        case _:
-                            if self.current_function_cluster is not None:
-                                # This case needs when we have last
-                                # function definition block
-                                self.add_edge(
-                                    item,
-                                    self.current[0],
-                                    ltail=self.current_function_cluster.get_name(),
-                                )
-                            else:
-                                self.add_edge(item, self.current[0])
-            elif isinstance(statement, Statement):
-                color = self.get_color(self.current[0]._type)
-                shape = self.get_shape(self.current[0]._type)
-                node = Node(
-                    self.current[0]._id,
-                    label=self.current[0].label,
-                    shape=shape,
+            case _:
+                add_node = self.writer.node
+                if node._type is NodeType.END:
+                    add_node = self.writer.sink
+                add_node(
+                    node._id,
+                    label=node.label,
+                    shape=self.get_shape(node._type),
                     style="filled",
-                    fillcolor=color,
+                    fillcolor=self.get_color(node._type),
                 )
 
-                match self.current[0]._type:
-                    case NodeType.END:
-                        subgraph = Subgraph(rank="sink")
-                        subgraph.add_node(node)
-                        self.graph.add_subgraph(subgraph)
-                    case _:
-                        self.graph.add_node(node)
+    def add_edge(self, source: int, target: int, kind: EdgeKind) -> None:
+        ltail = lhead = ""
+        function = self.function_ends.get(source)
+        if function is not None and not function <= target <= self.last[function]:
+            ltail = self.cluster(function)
+        if self.cfg.node_types[target] == NodeType.FUNCTION_DEF.value:
+            lhead = self.cluster(target)
+
+        if profiling.ACTIVE is not None:
+            profiling.ACTIVE.count("edges")
+        self.writer.edge(
+            self.cfg.node_ids[source],
+            self.cfg.node_ids[target],
+            label=edge_label(kind),
+            ltail=ltail,
+            lhead=lhead,
+        )
+
+    def cluster(self, function: int) -> str:
+        return quote(f"cluster_{self.cfg.statement(function).node.label}")
 
-                if self.previous is not None:
-                    for item in self.previous:
-                        match item._type:
-                            case NodeType.BREAK | NodeType.CONTINUE | NodeType.RETURN:
-                                continue
-                            case _:
-                                if self.current_function_cluster is not None:
-                                    # This case needs when we have last
-                                    # function definition block
-                                    self.add_edge(
-                                        item,
-                                        self.current[0],
-                                        ltail=self.current_function_cluster.get_name(),
-                                    )
-                                else:
-                                    self.add_edge(item, self.current[0])
+    def build(self):
+        # `FUNCTION_DEF` nodes of open clusters
+        functions: list[int] = []
+        for node in range(self.cfg.num_nodes):
+            while functions and self.last[functions[-1]] < node:
+                functions.pop()
+                self.writer.end_cluster()
+            data = self.cfg.statement(node).node
+            self.add_node(data)
+            for source, kind in self.cfg.node_predecessors(node):
+                self.add_edge(source, node, kind)
+            if data._type is NodeType.FUNCTION_DEF:
+                functions.append(node)
+                self.writer.begin_cluster(data.label)
+        for _ in functions:
+            self.writer.end_cluster()
@@ -0,0 +1,188 @@
+from dataclasses import dataclass
+
+from . import profiling
+from .cleanup import is_pure
+from .dominance import dominator_tree, immediate_dominators
+from .lowering import Block, BlockBuilder, Instruction, Literal, Phi, Variable
+from .statements import FunctionStatement
+
+Value = tuple[str, int]
+
+# Operand types are not known, `+` and `*` of strings and lists do not
+# commute, so only comparisons that are symmetric for every type swap
+SYMMETRIC = frozenset(("==", "!=", "is", "is not"))
+
+
+@dataclass
+class GVNReport:
+    # Operations that compute a value computed before, now copies
+    redundant: int = 0
+    # Phis that merge the same values as another phi of the block
+    congruent_phis: int = 0
+    replaced_uses: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.redundant} redundant computations, "
+            f"{self.congruent_phis} congruent phis, "
+            f"{self.replaced_uses} uses replaced"
+        )
+
+
+# Dominator-based value numbering: blocks are visited in preorder of
+# the dominator tree with a scoped table of `(operator, operands)` keys,
+# so a computation is found only in blocks that dominate it. Value
+# number of a variable is the variable that computes it first. Copies
+# share number with their source, phis of a block with the same
+# numbers of operands share a number. Redundant operations become
+# copies of the first one and their uses read the first one, the
+# `copies` and `dce` passes remove them. Functions start with an empty
+# table, they read variables from outside when they are called, so
+# these variables are numbered by themselves and their uses are kept.
+class GlobalValueNumbering:
+    def __init__(self, builder: BlockBuilder) -> None:
+        self.builder = builder
+        self.blocks = builder.blocks
+        self.numbers: dict[Value, Variable] = {}
+        # Redundant operations and phis with their leaders
+        self.replaced: dict[Value, Variable] = {}
+        self.function_of = builder.functions()
+        # Index is changed when the pass is done, so that
+        # removed phis are still found by `is_free`
+        self.defuse = builder.defuse
+        self.changed: list[Phi | Instruction] = []
+        self.removed: list[Phi] = []
+        self.report = GVNReport()
+
+    def number(self, part, function: int) -> object:
+        if isinstance(part, Literal):
+            return ("literal", type(part.value), part.value)
+        if isinstance(part, Variable):
+            if self.is_free(part, function):
+                return part.operand
+            leader = self.numbers.get(part.operand, part)
+            return leader.operand
+        return None
+
+    def is_free(self, variable: Variable, function: int) -> bool:
+        # Defined outside of the function that reads it
+        source = self.defuse.defined_in(variable.operand)
+        return source is not None and self.function_of[source] != function
+
+    def run(self) -> GVNReport:
+        with profiling.phase("gvn"):
+            self.__walk()
+            self.__replace_uses()
+            for site in self.changed:
+                self.defuse.update(site)
+            for phi in self.removed:
+                self.defuse.remove(phi)
+        profiling.count("redundant", self.report.redundant)
+        return self.report
+
+    def __walk(self) -> None:
+        successors = [block.successors for block in self.blocks]
+        predecessors = [block.predecessors for block in self.blocks]
+        children = dominator_tree(immediate_dominators(successors, predecessors))
+
+        table: dict[tuple, Variable] = {}
+        # Keys added by every block on the path from the root, `None`
+        # marks the exit from the block, saved tables of functions
+        added: list[list[tuple]] = []
+        saved: list[dict[tuple, Variable] | None] = []
+        walk: list[int | None] = [0]
+        while walk:
+            block_id = walk.pop()
+            if block_id is None:
+                for key in added.pop():
+                    del table[key]
+                outer = saved.pop()
+                if outer is not None:
+                    table = outer
+                continue
+
+            block = self.blocks[block_id]
+            instructions = block.instructions
+            if instructions and isinstance(
+                instructions[0].statement, FunctionStatement
+            ):
+                saved.append(table)
+                table = {}
+            else:
+                saved.append(None)
+            keys: list[tuple] = []
+            function = self.function_of[block_id]
+            self.__number_phis(block, table, keys)
+            for instruction in instructions:
+                if not is_pure(instruction):
+                    continue
+                target = instruction.defs[0]
+                value = instruction.parts[2:]
+                if len(value) == 1:
+                    source = value[0]
+                    if isinstance(source, Variable) and not self.is_free(
+                        source, function
+                    ):
+                        self.numbers[target.operand] = self.numbers.get(
+                            source.operand, source
+                        )
+                    continue
+                lhs, operator, rhs = value
+                assert isinstance(operator, str)
+                operands = [self.number(lhs, function), self.number(rhs, function)]
+                if operator.strip() in SYMMETRIC:
+                    operands.sort(key=repr)
+                key = (operator.strip(), *operands)
+                leader = table.get(key)
+                if leader is None:
+                    table[key] = target
+                    keys.append(key)
+                    continue
+                self.numbers[target.operand] = leader
+                self.replaced[target.operand] = leader
+                operand = Variable(*leader.operand)
+                instruction.parts = [target, " = ", operand]
+                instruction.uses = [operand]
+                self.changed.append(instruction)
+                self.report.redundant += 1
+            added.append(keys)
+            walk.append(None)
+            walk.extend(reversed(children[block_id]))
+
+    def __number_phis(
+        self, block: Block, table: dict[tuple, Variable], keys: list[tuple]
+    ) -> None:
+        # Operands from back edges are not numbered yet and keep their
+        # own numbers, so phis of loop headers are rarely congruent
+        kept: list[Phi] = []
+        function = self.function_of[block._id]
+        for phi in block.phis:
+            operands = (self.number(operand, function) for operand in phi.operands)
+            key = ("φ", block._id, *operands)
+            leader = table.get(key)
+            if leader is None:
+                table[key] = phi.target
+                keys.append(key)
+                kept.append(phi)
+                continue
+            self.numbers[phi.target.operand] = leader
+            self.replaced[phi.target.operand] = leader
+            self.removed.append(phi)
+            self.report.congruent_phis += 1
+        block.phis = kept
+
+    def __replace_uses(self) -> None:
+        # Uses of redundant operations and phis read their leaders,
+        # uses of copies are left to the `copies` pass
+        def replace(variable: Variable, function: int) -> Variable:
+            leader = self.replaced.get(variable.operand)
+            if leader is None or self.is_free(variable, function):
+                return variable
+            self.report.replaced_uses += 1
+            return Variable(*leader.operand)
+
+        self.changed.extend(self.builder.replace_uses(replace, self.function_of))
+
+
+def global_value_numbering(builder: BlockBuilder) -> GVNReport:
+    return GlobalValueNumbering(builder).run()
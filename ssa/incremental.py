@@ -0,0 +1,104 @@
+from ast import FunctionDef, Module, Name, arg, dump, walk
+from dataclasses import dataclass, field
+from hashlib import sha256
+from typing import Iterator
+
+from .persistent import Versions
+from .statements import NodeData, Statement
+
+
+@dataclass
+class Region:
+    # Key of the region: fingerprint of its source and the state
+    # of the builder its output depends on
+    key: tuple
+    # Ids of the region are `counter + 1` to `end`
+    counter: int
+    end: int
+    statements: list[Statement] = field(default_factory=list)
+    id2statement: dict[int, Statement] = field(default_factory=dict)
+    node_after_while: dict[int, int] = field(default_factory=dict)
+    # Variables changed by the region with their versions
+    # after it, in order of first use
+    versions: list[tuple[str, int]] = field(default_factory=list)
+    # Loop state left by the region, the first pass
+    # over the next loop starts from it
+    finded_keys: list[str] = field(default_factory=list)
+    pruned_keys: set[str] = field(default_factory=set)
+    ssa_before: Versions = field(default_factory=Versions)
+    ssa_after: Versions = field(default_factory=Versions)
+    current: Statement | None = None
+    phis_avoided: int = 0
+    # Loops at the end of the region, they are left
+    # to the first node of the next region
+    loop_exits: list[tuple[int, int]] = field(default_factory=list)
+
+
+def split_regions(tree: Module) -> Iterator[tuple[list, str, set[str]]]:
+    for body in region_bodies(tree):
+        yield body, *fingerprint(body)
+
+
+def region_bodies(tree: Module) -> Iterator[list]:
+    # Every top-level function is a region, statements between
+    # functions are grouped in one region
+    body: list = []
+    for node in tree.body:
+        if isinstance(node, FunctionDef):
+            if body:
+                yield body
+                body = []
+            yield [node]
+        else:
+            body.append(node)
+    if body:
+        yield body
+
+
+def fingerprint(body: list) -> tuple[str, set[str]]:
+    # Positions are not a part of fingerprint, so
+    # moved region is still the same region
+    digest = sha256()
+    names: set[str] = set()
+    for node in body:
+        digest.update(dump(node).encode())
+        for child in walk(node):
+            if isinstance(child, Name):
+                names.add(child.id)
+            elif isinstance(child, arg):
+                names.add(child.arg)
+    return digest.hexdigest(), names
+
+
+def shift_ids(region: Region, shift: int) -> None:
+    # Moves all nodes of the region by `shift` ids in place
+    if shift == 0:
+        return
+    nodes: dict[int, NodeData] = {}
+    stack: list[Statement] = [*region.statements, *region.id2statement.values()]
+    if region.current is not None:
+        stack.append(region.current)
+    while stack:
+        statement = stack.pop()
+        if id(statement.node) in nodes:
+            continue
+        nodes[id(statement.node)] = statement.node
+        for name in ("body", "orelse"):
+            stack.extend(getattr(statement, name, ()))
+        for name in ("while_statement", "end_of_function_statement"):
+            if (item := getattr(statement, name, None)) is not None:
+                stack.append(item)
+    for node in nodes.values():
+        node._id += shift
+
+    region.id2statement = {
+        _id + shift: statement for _id, statement in region.id2statement.items()
+    }
+    region.node_after_while = {
+        _id + shift: target + shift for _id, target in region.node_after_while.items()
+    }
+    region.loop_exits = [
+        (phi_id + shift, last_id + shift) for phi_id, last_id in region.loop_exits
+    ]
+    region.counter += shift
+    region.end += shift
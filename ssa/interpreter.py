@@ -0,0 +1,498 @@
+import builtins
+from dataclasses import dataclass
+from json import dump
+from math import log
+from re import compile as regex
+from sys import maxsize
+from typing import TextIO
+
+from . import profiling
+from .lowering import Block, BlockBuilder, Instruction, Literal, Variable
+from .statements import FunctionStatement, IfStatement, NodeType, ReturnStatement
+
+Value = tuple[str, int]
+
+CALL = regex(r"(\w+)\($")
+DEFINITION = regex(r"def (\w+)\(")
+
+# Colors of `ylorrd9` scheme of Graphviz, from the coldest to the hottest
+HEAT_LEVELS = 9
+
+
+class LimitExceeded(RuntimeError):
+    pass
+
+
+class _Undefined:
+    # Value of phi operand that is not assigned on its edge
+    def __repr__(self) -> str:
+        return "UNDEFINED"
+
+
+UNDEFINED = _Undefined()
+
+
+class Frame:
+    __slots__ = ("registers", "cells", "parent", "result")
+
+    def __init__(self, size: int, parent: "Frame | None") -> None:
+        # Values of the scope by dense ids, names that functions
+        # read from outside and functions by their names
+        self.registers: list = [UNDEFINED] * size
+        self.cells: dict[str, object] = {}
+        # Frame the function is defined in
+        self.parent = parent
+        self.result = None
+
+
+class Function:
+    __slots__ = ("interpreter", "entry", "frame", "name")
+
+    def __init__(self, interpreter: "Interpreter", entry: int, frame: Frame) -> None:
+        self.interpreter = interpreter
+        self.entry = entry
+        self.frame = frame
+        self.name = interpreter.function_names[entry]
+
+    def __call__(self, *arguments):
+        return self.interpreter.call(self, arguments)
+
+    def __repr__(self) -> str:
+        return f"<function {self.name}>"
+
+
+@dataclass
+class Profile:
+    # Executions of every block
+    blocks: list[int]
+    # Times every edge is taken, by block and position of successor
+    edges: list[list[int]]
+    successors: list[list[int]]
+
+    def edge_counts(self) -> dict[tuple[int, int], int]:
+        counts: dict[tuple[int, int], int] = {}
+        for source, taken in enumerate(self.edges):
+            for target, count in zip(self.successors[source], taken):
+                counts[source, target] = counts.get((source, target), 0) + count
+        return counts
+
+    def to_json(self) -> dict:
+        return {
+            "blocks": self.blocks,
+            "edges": [
+                {"source": source, "target": target, "count": count}
+                for (source, target), count in self.edge_counts().items()
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Profile":
+        blocks = data["blocks"]
+        edges: list[list[int]] = [[] for _ in blocks]
+        successors: list[list[int]] = [[] for _ in blocks]
+        for edge in data["edges"]:
+            successors[edge["source"]].append(edge["target"])
+            edges[edge["source"]].append(edge["count"])
+        return cls(blocks, edges, successors)
+
+
+# Runs basic blocks in SSA form. Every block is compiled once into a
+# Python function over the registers of its frame, the function runs
+# the instructions of the block and returns position of the taken
+# successor, or `-1` when the scope ends. Phis of the successor are
+# evaluated when control enters it: the edge assigns all of them at
+# once from the operands of the edge. Functions read names from outside
+# by their names when they are called, so definitions of these names
+# are also stored in cells of the frame, and so are functions.
+class Interpreter:
+    def __init__(self, builder: BlockBuilder, limit: int | None = None) -> None:
+        self.blocks = builder.blocks
+        # Most executions of one block, e.g. to stop infinite loops
+        self.limit = maxsize if limit is None else limit
+        self.function_of = builder.functions()
+        self.successors = [block.successors for block in self.blocks]
+        self.counts = [0] * len(self.blocks)
+        self.taken = [[0] * len(block.successors) for block in self.blocks]
+
+        # Lexical parent of every function, functions defined in every
+        # scope and parameters of every function
+        self.parents: dict[int, int] = {}
+        self.functions: dict[int, set[str]] = {-1: set()}
+        self.function_names: dict[int, str] = {}
+        self.parameters: dict[int, list[Variable]] = {}
+        for block in self.blocks:
+            if _is_entry(block):
+                definition = block.instructions[0]
+                parent = self.function_of[block.predecessors[0]]
+                name = DEFINITION.match(str(definition.parts[0]))
+                assert name is not None
+                self.parents[block._id] = parent
+                self.functions.setdefault(parent, set()).add(name.group(1))
+                self.functions.setdefault(block._id, set())
+                self.function_names[block._id] = name.group(1)
+                self.parameters[block._id] = definition.defs
+
+        # Dense ids of values of every scope
+        self.slots: dict[int, dict[Value, int]] = {-1: {}}
+        self.families: set[tuple[int, str]] = set()
+        for block in self.blocks:
+            scope = self.function_of[block._id]
+            slots = self.slots.setdefault(scope, {})
+            defined = [phi.target for phi in block.phis]
+            for instruction in block.instructions:
+                defined.extend(instruction.defs)
+            for variable in defined:
+                slots.setdefault(variable.operand, len(slots))
+                self.families.add((scope, variable.name))
+
+        self.undefined = self.__maybe_undefined()
+        # Names read by functions from outside, by scopes that hold them
+        self.escaping: set[tuple[int, str]] = set()
+        self.constants: dict[str, object] = {}
+        self.source = ""
+        with profiling.phase("compile"):
+            self.code = self.__compile()
+        # Size of frame of every function, slot of every parameter and
+        # its name when functions inside read it from outside
+        self.signatures: dict[int, tuple[int, list[tuple[int, str | None]]]] = {}
+        for entry, parameters in self.parameters.items():
+            slots = self.slots[entry]
+            self.signatures[entry] = (
+                len(slots),
+                [
+                    (
+                        slots[parameter.operand],
+                        (
+                            parameter.name
+                            if (entry, parameter.name) in self.escaping
+                            else None
+                        ),
+                    )
+                    for parameter in parameters
+                ],
+            )
+
+    def run(self) -> Profile:
+        frame = Frame(len(self.slots[-1]), None)
+        with profiling.phase("interpret"):
+            self.__run(frame, 0)
+        profiling.count("block_executions", sum(self.counts))
+        return self.profile()
+
+    def profile(self) -> Profile:
+        return Profile(
+            list(self.counts),
+            [list(taken) for taken in self.taken],
+            [list(successors) for successors in self.successors],
+        )
+
+    def call(self, function: Function, arguments: tuple):
+        size, parameters = self.signatures[function.entry]
+        if len(arguments) != len(parameters):
+            raise TypeError(
+                f"{function.name}() takes {len(parameters)} positional "
+                f"arguments but {len(arguments)} were given"
+            )
+        frame = Frame(size, function.frame)
+        registers = frame.registers
+        for (slot, cell), argument in zip(parameters, arguments):
+            registers[slot] = argument
+            if cell is not None:
+                frame.cells[cell] = argument
+        return self.__run(frame, function.entry)
+
+    def __run(self, frame: Frame, block: int):
+        code, successors = self.code, self.successors
+        counts, taken, limit = self.counts, self.taken, self.limit
+        registers = frame.registers
+        while True:
+            count = counts[block] + 1
+            counts[block] = count
+            if count > limit:
+                raise LimitExceeded(f"block {block} ran more than {limit} times")
+            edge = code[block](registers, frame)
+            if edge < 0:
+                return frame.result
+            taken[block][edge] += 1
+            block = successors[block][edge]
+
+    def __maybe_undefined(self) -> set[Value]:
+        # Phis with an operand that is not assigned on some path
+        phis = [(block, phi) for block in self.blocks for phi in block.phis]
+        undefined: set[Value] = set()
+        changed = True
+        while changed:
+            changed = False
+            for block, phi in phis:
+                if phi.target.operand in undefined:
+                    continue
+                scope = self.function_of[block._id]
+                if any(
+                    operand.operand in undefined
+                    or operand.operand not in self.slots[scope]
+                    and self.__resolve(operand.name, scope)[0] in ("unbound", "missing")
+                    for operand in phi.operands
+                ):
+                    undefined.add(phi.target.operand)
+                    changed = True
+        return undefined
+
+    def __resolve(self, name: str, scope: int) -> tuple[str, int]:
+        # Where a name that has no value of the scope is read from:
+        # `("unbound", 0)` for locals read before assignment, `("load",
+        # hops)` from cells of the frame `hops` parents up, `("builtin",
+        # 0)` and `("missing", 0)`
+        if (scope, name) in self.families:
+            return "unbound", 0
+        hops = 0
+        while True:
+            if (scope, name) in self.families or name in self.functions[scope]:
+                return "load", hops
+            if scope == -1:
+                break
+            scope = self.parents[scope]
+            hops += 1
+        if hasattr(builtins, name):
+            return "builtin", 0
+        return "missing", 0
+
+    def __scope_of(self, scope: int, hops: int) -> int:
+        for _ in range(hops):
+            scope = self.parents[scope]
+        return scope
+
+    def __constant(self, value: object) -> str:
+        name = f"_k{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def __read(self, variable: Variable, scope: int, phi: bool = False) -> str:
+        slot = self.slots[scope].get(variable.operand)
+        if slot is not None:
+            if variable.operand in self.undefined and not phi:
+                return f"_defined(r[{slot}], {variable.name!r}, {scope == -1})"
+            return f"r[{slot}]"
+        return self.__name(variable.name, scope, phi)
+
+    def __name(self, name: str, scope: int, phi: bool = False) -> str:
+        kind, hops = self.__resolve(name, scope)
+        if kind == "load":
+            self.escaping.add((self.__scope_of(scope, hops), name))
+            return f"_load(f, {hops}, {name!r})"
+        if kind == "builtin":
+            return self.__constant(getattr(builtins, name))
+        if phi:
+            return "_UNDEFINED"
+        return f"_unbound({name!r}, {kind == 'unbound' and scope != -1})"
+
+    def __expression(self, parts, scope: int) -> str:
+        text = []
+        for part in parts:
+            if isinstance(part, Variable):
+                text.append(self.__read(part, scope))
+            elif isinstance(part, Literal):
+                text.append(self.__constant(part.value))
+            elif (call := CALL.search(part)) is not None:
+                # Example: `print(`
+                name = self.__name(call.group(1), scope)
+                text.append(f"{part[: call.start()]}{name}(")
+            else:
+                text.append(part)
+        return "".join(text)
+
+    def __compile(self) -> list:
+        # Reads are resolved before definitions are compiled,
+        # so that stores of names read from outside are known
+        bodies = [self.__block(block) for block in self.blocks]
+        lines = []
+        for block, body in zip(self.blocks, bodies):
+            lines.append(f"def _b{block._id}(r, f):")
+            lines.extend(f"    {line}" for line in body())
+        self.source = "\n".join(lines) + "\n"
+        namespace = {
+            "_load": _load,
+            "_defined": _defined,
+            "_unbound": _unbound,
+            "_UNDEFINED": UNDEFINED,
+            "_Function": Function,
+            "_interpreter": self,
+            **self.constants,
+        }
+        # Blocks are compiled once instead of being interpreted by
+        # instruction. Source is built above from operators of labels,
+        # names are quoted and literals are passed as constants.
+        code = compile(self.source, "<ssa>", "exec")
+        exec(code, namespace)  # pylint: disable=exec-used
+        return [namespace[f"_b{block._id}"] for block in self.blocks]
+
+    def __block(self, block: Block):
+        scope = self.function_of[block._id]
+        slots = self.slots[scope]
+        statements: list[tuple[Instruction, str]] = []
+        condition = None
+        for instruction in block.instructions:
+            statement = instruction.statement
+            match statement.node._type:
+                case NodeType.ASSIGN:
+                    target = instruction.defs[0]
+                    value = self.__expression(instruction.parts[2:], scope)
+                    slot = slots[target.operand]
+                    statements.append((instruction, f"r[{slot}] = {value}"))
+                case NodeType.CALL:
+                    statements.append(
+                        (instruction, self.__expression(instruction.parts, scope))
+                    )
+                case NodeType.RETURN:
+                    assert isinstance(statement, ReturnStatement)
+                    value = self.__expression(instruction.parts[1:], scope)
+                    statements.append((instruction, f"f.result = {value}"))
+                case NodeType.IF if instruction is block.instructions[-1]:
+                    assert isinstance(statement, IfStatement)
+                    condition = self.__expression(instruction.parts, scope)
+        edges = [
+            self.__edge(block, position) for position in range(len(block.successors))
+        ]
+
+        def body() -> list[str]:
+            # Stores are known once every block is resolved
+            lines = []
+            for instruction, line in statements:
+                lines.append(line)
+                for variable in instruction.defs:
+                    if (scope, variable.name) in self.escaping:
+                        slot = slots[variable.operand]
+                        lines.append(f"f.cells[{variable.name!r}] = r[{slot}]")
+            functions = [
+                position
+                for position, successor in enumerate(block.successors)
+                if self.parents.get(successor) is not None
+                and self.blocks[successor].predecessors == [block._id]
+            ]
+            for position in functions:
+                entry = block.successors[position]
+                name = self.function_names[entry]
+                function = f"_Function(_interpreter, {entry}, f)"
+                lines.append(f"f.cells[{name!r}] = {function}")
+            rest = [
+                position
+                for position in range(len(block.successors))
+                if position not in functions
+            ]
+            if condition is not None and len(rest) == 2:
+                lines.append(f"if {condition}:")
+                lines.extend(f"    {line}" for line in edges[rest[0]])
+                lines.append(f"    return {rest[0]}")
+                lines.extend(edges[rest[1]])
+                lines.append(f"return {rest[1]}")
+            elif rest:
+                lines.extend(edges[rest[0]])
+                lines.append(f"return {rest[0]}")
+            else:
+                lines.append("return -1")
+            return lines
+
+        return body
+
+    def __edge(self, block: Block, position: int) -> list[str]:
+        # Phis of the successor read operands of this edge at once
+        successor = self.blocks[block.successors[position]]
+        if not successor.phis:
+            return []
+        # Position of the edge among the edges from the same block
+        repeat = block.successors[:position].count(successor._id)
+        index = [
+            i
+            for i, predecessor in enumerate(successor.predecessors)
+            if predecessor == block._id
+        ][repeat]
+        scope = self.function_of[successor._id]
+        slots = self.slots[scope]
+        targets = ", ".join(f"r[{slots[phi.target.operand]}]" for phi in successor.phis)
+        values = ", ".join(
+            self.__read(phi.operands[index], scope, phi=True) for phi in successor.phis
+        )
+        return [f"{targets}, = {values},"]
+
+
+def _is_entry(block: Block) -> bool:
+    return bool(block.instructions) and isinstance(
+        block.instructions[0].statement, FunctionStatement
+    )
+
+
+def _load(frame: Frame, hops: int, name: str):
+    for _ in range(hops):
+        assert frame.parent is not None
+        frame = frame.parent
+    try:
+        return frame.cells[name]
+    except KeyError:
+        raise NameError(f"name {name!r} is not defined") from None
+
+
+def _defined(value, name: str, module: bool):
+    if value is UNDEFINED:
+        _unbound(name, not module)
+    return value
+
+
+def _unbound(name: str, local: bool):
+    if local:
+        raise UnboundLocalError(
+            f"cannot access local variable {name!r} where it is not associated "
+            "with a value"
+        )
+    raise NameError(f"name {name!r} is not defined")
+
+
+def interpret(builder: BlockBuilder, limit: int | None = None) -> Profile:
+    return Interpreter(builder, limit).run()
+
+
+@dataclass
+class Heat:
+    # Executions of nodes of the graph by their ids
+    nodes: dict[int, int]
+    # Times the true and the false edge of every condition are taken
+    branches: dict[int, tuple[int, int]]
+
+    @property
+    def hottest(self) -> int:
+        return max(self.nodes.values(), default=0)
+
+    def color(self, count: int) -> str:
+        # Logarithmic scale, nodes that ran once are the coldest
+        hottest = self.hottest
+        level = 1
+        if hottest > 1 and count > 1:
+            level += round((HEAT_LEVELS - 1) * log(count) / log(hottest))
+        return f"/ylorrd{HEAT_LEVELS}/{level}"
+
+
+def heat_map(builder: BlockBuilder, profile: Profile) -> Heat:
+    # Start and end keep their colors
+    nodes: dict[int, int] = {}
+    branches: dict[int, tuple[int, int]] = {}
+    for block in builder.blocks:
+        count = profile.blocks[block._id]
+        statements = [instruction.statement for instruction in block.instructions]
+        if block.phi_statement is not None:
+            statements.append(block.phi_statement)
+        statements.extend(block.phi_statements)
+        for statement in statements:
+            if statement.node._type not in (NodeType.START, NodeType.END):
+                nodes[statement.node._id] = count
+        if (
+            block.instructions
+            and isinstance(block.instructions[-1].statement, IfStatement)
+            and len(block.successors) == 2
+        ):
+            node = block.instructions[-1].statement.node
+            true, false = profile.edges[block._id]
+            branches[node._id] = (true, false)
+    return Heat(nodes, branches)
+
+
+def write_profile(profile: Profile, file: TextIO) -> None:
+    dump(profile.to_json(), file)
+    file.write("\n")
@@ -0,0 +1,266 @@
+from array import array
+from mmap import ACCESS_READ, mmap
+from operator import itemgetter
+from pathlib import Path
+from re import compile as regex
+from struct import Struct
+from sys import byteorder
+from typing import BinaryIO, Iterator
+
+from .cfg import CompressedRows, ControlFlowGraph, EdgeKind
+from .statements import NAMES, NodeType
+
+# Changes whenever layout of the file changes
+IR_FORMAT = 1
+MAGIC = b"SSAIR\0"
+SUFFIX = ".ssair"
+
+# Magic, format and counts of strings, bytes of strings, nodes,
+# operands, edges, ids and functions. Sections follow in the order
+# of `IRFile.__init__`, integers are 32-bit little-endian.
+HEADER = Struct("<6sH7I")
+
+# Fields of fixed-width node records
+ID, TYPE, PARENT, TEMPLATE, OPERANDS, COUNT = range(6)
+NODE_FIELDS = 6
+# Fields of function records
+FUNCTION_DEF, FUNCTION_END, FUNCTION_NAME = range(3)
+FUNCTION_FIELDS = 3
+
+DEFINITION = regex(r"def (\w+)\(")
+
+
+class StringTable:
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.offsets = array("i", [0])
+        self.data = bytearray()
+
+    def add(self, text: str) -> int:
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.ids)
+            self.data += text.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return string_id
+
+
+# Drawn nodes of the graph with the same edges as `GraphBuilder` draws,
+# nodes are numbered by their position in the file. Variable names and
+# templates of labels are kept once in the string table.
+def write_ir(builder, file: BinaryIO) -> None:
+    graph = ControlFlowGraph.from_builder(builder)
+
+    index = array("i", [-1] * (max(builder.id2statement, default=-1) + 1))
+    for position, node_id in enumerate(graph.node_ids):
+        index[node_id] = position
+
+    strings = StringTable()
+    nodes = array("i")
+    operands = array("i")
+    for position in range(graph.num_nodes):
+        node = graph.statement(position).node
+        nodes.extend(
+            (
+                node._id,
+                node._type.value,
+                graph.parents[position],
+                strings.add(node.template),
+                len(operands) // 2,
+                len(node.operands) // 2,
+            )
+        )
+        for name_id, version in node.variables():
+            operands.append(strings.add(NAMES[name_id]))
+            operands.append(version)
+
+    edges = [
+        (source, target, kind)
+        for source in range(graph.num_nodes)
+        for target, kind in graph.node_successors(source)
+    ]
+    successors = CompressedRows.from_pairs(graph.num_nodes, edges)
+    predecessors = CompressedRows.from_pairs(
+        graph.num_nodes,
+        sorted(((target, source) for source, target, _ in edges), key=itemgetter(0)),
+    )
+    kinds = bytes(kind for _, _, kind in edges)
+
+    functions = array("i")
+    for position in range(0, len(graph.functions), 2):
+        function = graph.statement(graph.functions[position])
+        match = DEFINITION.match(function.node.template)
+        functions.extend(
+            (
+                graph.functions[position],
+                graph.functions[position + 1],
+                strings.add(match[1] if match else ""),
+            )
+        )
+
+    sections = [
+        strings.offsets,
+        nodes,
+        operands,
+        successors.offsets,
+        successors.targets,
+        predecessors.offsets,
+        predecessors.targets,
+        index,
+        functions,
+    ]
+    file.write(
+        HEADER.pack(
+            MAGIC,
+            IR_FORMAT,
+            len(strings.ids),
+            len(strings.data),
+            len(nodes) // NODE_FIELDS,
+            len(operands) // 2,
+            len(edges),
+            len(index),
+            len(functions) // FUNCTION_FIELDS,
+        )
+    )
+    for section in sections:
+        if byteorder != "little":
+            section.byteswap()
+        file.write(section.tobytes())
+    file.write(kinds)
+    file.write(strings.data)
+
+
+# Reads a file of `write_ir` through `mmap`, queries read records in
+# place and only strings that are asked for are decoded. Nodes are
+# positions in the file, ids of the builder are found with `find`.
+class IRFile:
+    def __init__(self, path: Path | str) -> None:
+        with open(path, "rb") as file:
+            self.__map = mmap(file.fileno(), 0, access=ACCESS_READ)
+        self.__views: list[memoryview] = []
+        try:
+            self.__read_sections()
+        except Exception:
+            self.close()
+            raise
+        self.__strings: dict[int, str] = {}
+
+    def __read_sections(self) -> None:
+        if len(self.__map) < HEADER.size:
+            raise ValueError("not an IR file")
+        magic, version, *counts = HEADER.unpack_from(self.__map)
+        if magic != MAGIC:
+            raise ValueError("not an IR file")
+        if version != IR_FORMAT:
+            raise ValueError(f"unsupported IR format {version}")
+        strings, data, nodes, operands, edges, ids, functions = counts
+        self.__offset = HEADER.size
+        self.string_offsets = self.__ints(strings + 1)
+        self.node_records = self.__ints(nodes * NODE_FIELDS)
+        self.operand_pairs = self.__ints(operands * 2)
+        self.successor_rows = self.__rows(nodes, edges)
+        self.predecessor_rows = self.__rows(nodes, edges)
+        self.index = self.__ints(ids)
+        self.function_records = self.__ints(functions * FUNCTION_FIELDS)
+        self.kinds = self.__bytes(edges)
+        self.data = self.__bytes(data)
+        if self.__offset != len(self.__map):
+            raise ValueError("truncated IR file")
+
+    def __bytes(self, size: int) -> memoryview:
+        if self.__offset + size > len(self.__map):
+            raise ValueError("truncated IR file")
+        view = memoryview(self.__map)[self.__offset : self.__offset + size]
+        self.__views.append(view)
+        self.__offset += size
+        return view
+
+    def __rows(self, rows: int, edges: int) -> CompressedRows:
+        return CompressedRows(self.__ints(rows + 1), self.__ints(edges))
+
+    def __ints(self, count: int):
+        view = self.__bytes(count * 4).cast("i")
+        self.__views.append(view)
+        if byteorder == "little":
+            return view
+        # Copy is made only on big-endian hosts
+        ints = array("i", view)
+        ints.byteswap()
+        return ints
+
+    def close(self) -> None:
+        # Views must be released before the map is closed
+        for view in reversed(self.__views):
+            view.release()
+        self.__views.clear()
+        self.__map.close()
+
+    def __enter__(self) -> "IRFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.node_records) // NODE_FIELDS
+
+    def string(self, string_id: int) -> str:
+        text = self.__strings.get(string_id)
+        if text is None:
+            start = self.string_offsets[string_id]
+            end = self.string_offsets[string_id + 1]
+            text = self.__strings[string_id] = str(self.data[start:end], "utf-8")
+        return text
+
+    def find(self, node_id: int) -> int | None:
+        if not 0 <= node_id < len(self.index) or self.index[node_id] == -1:
+            return None
+        return self.index[node_id]
+
+    def node_id(self, node: int) -> int:
+        return self.node_records[node * NODE_FIELDS + ID]
+
+    def node_type(self, node: int) -> NodeType:
+        return NodeType(self.node_records[node * NODE_FIELDS + TYPE])
+
+    def parent(self, node: int) -> int | None:
+        parent = self.node_records[node * NODE_FIELDS + PARENT]
+        return None if parent == -1 else parent
+
+    def template(self, node: int) -> str:
+        return self.string(self.node_records[node * NODE_FIELDS + TEMPLATE])
+
+    def operands(self, node: int) -> list[tuple[str, int]]:
+        start = self.node_records[node * NODE_FIELDS + OPERANDS] * 2
+        end = start + self.node_records[node * NODE_FIELDS + COUNT] * 2
+        operands = self.operand_pairs
+        return [
+            (self.string(operands[i]), operands[i + 1]) for i in range(start, end, 2)
+        ]
+
+    # Same text as `NodeData.label`
+    def label(self, node: int) -> str:
+        operands = self.operands(node)
+        if not operands:
+            return self.template(node)
+        return self.template(node).format(
+            *(f"{name}.{version}" for name, version in operands)
+        )
+
+    def successors(self, node: int) -> list[tuple[int, EdgeKind]]:
+        return [
+            (self.successor_rows.targets[edge], EdgeKind(self.kinds[edge]))
+            for edge in self.successor_rows.range(node)
+        ]
+
+    def predecessors(self, node: int) -> list[int]:
+        return list(self.predecessor_rows[node])
+
+    # Name of every function with the range of its nodes,
+    # nested functions are inside the range
+    def functions(self) -> Iterator[tuple[str, range]]:
+        functions = self.function_records
+        for i in range(0, len(functions), FUNCTION_FIELDS):
+            yield self.string(functions[i + FUNCTION_NAME]), range(
+                functions[i + FUNCTION_DEF], functions[i + FUNCTION_END] + 1
+            )
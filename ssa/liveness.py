@@ -0,0 +1,172 @@
+from ast import (
+    AugAssign,
+    Break,
+    Call,
+    Continue,
+    For,
+    FunctionDef,
+    If,
+    Load,
+    Name,
+    Return,
+    Store,
+    While,
+    walk,
+)
+from enum import Enum, auto
+
+
+class SSAForm(Enum):
+    # Phi for every variable that differs at a merge point
+    MINIMAL = auto()
+    # Phis only for names that are read in some block before
+    # they are assigned in it, other names never cross blocks
+    SEMI_PRUNED = auto()
+    # Phis only for variables that are live at the merge point
+    PRUNED = auto()
+
+
+def reads(node) -> set[str]:
+    # Names read by expression or simple statement,
+    # names of called functions are not variables
+    called = {id(child.func) for child in walk(node) if isinstance(child, Call)}
+    return {
+        child.id
+        for child in walk(node)
+        if isinstance(child, Name)
+        and isinstance(child.ctx, Load)
+        and id(child) not in called
+    }
+
+
+def target(node) -> set[str]:
+    # Name of a simple target, attributes and items are not variables
+    return {node.id} if isinstance(node, Name) else set()
+
+
+def writes(node) -> set[str]:
+    return {
+        child.id
+        for child in walk(node)
+        if isinstance(child, Name) and isinstance(child.ctx, Store)
+    }
+
+
+# Backward liveness over AST of structured code. Merge point of `if`
+# is right after it, merge point of a loop is its header. Sets live at
+# them are kept by `id` of the AST node, like `AssignedNamesCollector`
+# keeps names of loops.
+class LivenessAnalyzer:
+    def __init__(self) -> None:
+        # Names live right after `if`
+        self.after: dict[int, frozenset[str]] = {}
+        # Names live at the header of `while`/`for`
+        self.header: dict[int, frozenset[str]] = {}
+        # Names live after top-level statement
+        self.out: dict[int, frozenset[str]] = {}
+        # (`break` target, `continue` target) of enclosing loops
+        self.loops: list[tuple[frozenset[str], frozenset[str]]] = []
+
+    def analyze(self, tree) -> "LivenessAnalyzer":
+        live: frozenset[str] = frozenset()
+        for node in reversed(tree.body):
+            self.out[id(node)] = live
+            live = self.statement(node, live)
+        return self
+
+    def body(self, body: list, live: frozenset[str]) -> frozenset[str]:
+        for node in reversed(body):
+            live = self.statement(node, live)
+        return live
+
+    def statement(self, node, live: frozenset[str]) -> frozenset[str]:
+        if isinstance(node, If):
+            self.after[id(node)] = live
+            return (
+                self.body(node.body, live)
+                | self.body(node.orelse, live)
+                | reads(node.test)
+            )
+        if isinstance(node, (While, For)):
+            return self.loop(node, live)
+        if isinstance(node, Break):
+            return self.loops[-1][0]
+        if isinstance(node, Continue):
+            return self.loops[-1][1]
+        if isinstance(node, Return):
+            return frozenset(() if node.value is None else reads(node.value))
+        if isinstance(node, FunctionDef):
+            # Body reads versions known where function is defined
+            loops, self.loops = self.loops, []
+            parameters = {argument.arg for argument in node.args.args}
+            used = self.body(node.body, frozenset()) - parameters
+            self.loops = loops
+            return live | used
+        if isinstance(node, AugAssign):
+            return live | reads(node) | target(node.target)
+        return (live - writes(node)) | reads(node)
+
+    def loop(self, node, live: frozenset[str]) -> frozenset[str]:
+        if isinstance(node, For):
+            # Loop variable is assigned before the loop, read by the
+            # condition and incremented at the end of the body
+            test = end = frozenset(target(node.target))
+        else:
+            test, end = frozenset(reads(node.test)), frozenset()
+        orelse = self.body(node.orelse, live)
+        # Header of the loop is its own fixed point, the set grows
+        # every round, the last result is a good start for the next one
+        header = self.header.get(id(node), frozenset())
+        while True:
+            self.loops.append((live, header))
+            body = self.body(node.body, header | end)
+            self.loops.pop()
+            result = header | test | body | orelse
+            if result == header:
+                break
+            header = result
+        self.header[id(node)] = header
+        if isinstance(node, For):
+            # Bounds of `range` are read before the loop
+            return (header - target(node.target)) | reads(node.iter)
+        return header
+
+
+# Names read in some block before they are assigned in the same block.
+# Blocks end at every compound statement, condition of `if` belongs to
+# the block before it, condition of a loop to the loop header.
+class NonLocalNamesCollector:
+    def __init__(self) -> None:
+        self.names: set[str] = set()
+
+    def collect(self, tree) -> set[str]:
+        self.body(tree.body, set())
+        return self.names
+
+    def body(self, body: list, defined: set[str]) -> None:
+        for node in body:
+            if isinstance(node, If):
+                self.names |= reads(node.test) - defined
+                self.body(node.body, set())
+                self.body(node.orelse, set())
+                defined = set()
+            elif isinstance(node, While):
+                self.names |= reads(node.test)
+                self.body(node.body, set())
+                self.body(node.orelse, set())
+                defined = set()
+            elif isinstance(node, For):
+                self.names |= reads(node.iter) - defined
+                self.names |= target(node.target)
+                self.body(node.body, set())
+                self.body(node.orelse, set())
+                defined = set()
+            elif isinstance(node, FunctionDef):
+                self.body(node.body, {argument.arg for argument in node.args.args})
+                defined = set()
+            else:
+                used = reads(node)
+                if isinstance(node, AugAssign):
+                    used |= target(node.target)
+                self.names |= used - defined
+                defined |= writes(node)
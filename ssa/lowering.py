@@ -0,0 +1,625 @@
+from abc import ABC, abstractmethod
+from ast import NodeVisitor, Constant, Name, BinOp, Call, Compare
+from dataclasses import dataclass, field
+from typing import Callable, Generator, Sequence
+
+from . import profiling
+from .cfg import run_walk
+from .defuse import DefUseIndex
+from .operators import COMPARATORS, OPERATORS
+from .statements import (
+    NodeData,
+    NodeType,
+    Part as NodePart,
+    Statement,
+    IfStatement,
+    WhileStatement,
+    BreakStatement,
+    ContinueStatement,
+    FunctionStatement,
+    ReturnStatement,
+)
+
+
+class Variable:
+    # One occurrence of variable, version is filled in by SSA construction
+    __slots__ = ("name", "version")
+
+    def __init__(self, name: str, version: int = 0) -> None:
+        self.name = name
+        self.version = version
+
+    def __str__(self) -> str:
+        return f"{self.name}.{self.version}"
+
+    def __repr__(self) -> str:
+        return f"Variable({self})"
+
+    @property
+    def operand(self) -> tuple[str, int]:
+        return self.name, self.version
+
+
+class Literal(str):
+    # Constant operand, text of label that keeps its value
+    def __new__(cls, value) -> "Literal":
+        literal = super().__new__(cls, str(value))
+        literal.value = value
+        return literal
+
+    value: object
+
+
+Part = str | Variable
+
+
+@dataclass
+class Instruction:
+    statement: Statement
+    # Label is rendered from parts when versions are known
+    parts: list[Part]
+    uses: list[Variable] = field(default_factory=list)
+    defs: list[Variable] = field(default_factory=list)
+
+    def render(self) -> None:
+        self.statement.node.set_parts(
+            part if isinstance(part, str) else part.operand for part in self.parts
+        )
+
+
+@dataclass
+class Phi:
+    target: Variable
+    # One operand per predecessor of the block
+    operands: list[Variable] = field(default_factory=list)
+
+    # Same as variables of `Instruction`, for def-use chains
+    @property
+    def defs(self) -> list[Variable]:
+        return [self.target]
+
+    @property
+    def uses(self) -> list[Variable]:
+        return self.operands
+
+    @property
+    def parts(self) -> list[NodePart]:
+        parts: list[NodePart] = [self.target.operand, " = φ("]
+        for i, operand in enumerate(self.operands):
+            if i != 0:
+                parts.append(", ")
+            parts.append(operand.operand)
+        parts.append(")")
+        return parts
+
+
+@dataclass
+class Block:
+    _id: int
+    instructions: list[Instruction] = field(default_factory=list)
+    phis: list[Phi] = field(default_factory=list)
+    successors: list[int] = field(default_factory=list)
+    predecessors: list[int] = field(default_factory=list)
+    # Loop header keeps all its phis in one statement before condition
+    phi_statement: Statement | None = None
+    # Merge blocks emit phis at this position of the statements list
+    phi_slot: tuple[list[Statement], int] | None = None
+    phi_statements: list[Statement] = field(default_factory=list)
+    # All predecessors of the block are known
+    sealed: bool = False
+
+    @property
+    def can_hold_phis(self) -> bool:
+        return self.phi_statement is not None or self.phi_slot is not None
+
+
+@dataclass
+class Loop:
+    phi_statement: Statement
+    header: Block
+    # Exit block is created after the body, so that blocks are
+    # numbered in source order, until then `break` blocks wait here
+    breaks: list[Block] = field(default_factory=list)
+    exit: Block | None = None
+    # Increment of `for` loop, `continue` runs it before the next test
+    increment: Callable[[], None] | None = None
+
+
+# Lowers AST into basic blocks and builds the same statements tree as
+# `CFGBuilder`, but with unversioned labels. Subclasses assign versions
+# in `build_ssa`, after that labels are rendered and nodes are numbered.
+class BlockBuilder(NodeVisitor, ABC):
+    def __init__(
+        self, tree, passes: Sequence[Callable[["BlockBuilder"], object]] = ()
+    ) -> None:
+        self.blocks: list[Block] = []
+        self.instructions: list[Instruction] = []
+        self.loops: list[Loop] = []
+        self.exits: list[Loop] = []
+        self.returns: list[tuple[Block, ReturnStatement]] = []
+        # Edge taken when control falls off the end of body or `else`
+        # of `if` and loop by `id` of the list, `if` without `else`
+        # falls from its head to the merge
+        self.fallthrough: dict[int, tuple[Block, Block]] = {}
+        # Uses that are read but not yet attached to an instruction
+        self.uses: list[Variable] = []
+
+        self.statements: list[Statement] = []
+        self.id2statement: dict[int, Statement] = {}
+        self.node_after_while: dict[int, int] = {}
+        self.counter = 0
+
+        with profiling.phase("lower"):
+            self.block: Block | None = self.new_block()
+            self.seal_block(self.block)
+            self.emit(self.__node(NodeType.START, Statement), ["Start"])
+            self.visit_body(tree.body)
+            if self.block is not None:
+                self.emit(self.__node(NodeType.END, Statement), ["End"])
+
+        with profiling.phase("phi"):
+            self.build_ssa()
+        profiling.count("phis", sum(len(block.phis) for block in self.blocks))
+        # Def-use chains of blocks, passes keep them up to date
+        self.defuse = DefUseIndex(self.blocks)
+        # Passes change blocks in SSA form before labels are rendered,
+        # every pass returns its report
+        self.reports = [run_pass(self) for run_pass in passes]
+        self.finalize()
+
+    @abstractmethod
+    def build_ssa(self) -> None:
+        pass
+
+    @staticmethod
+    def __node(node_type: NodeType, statement_type, **kwargs):
+        return statement_type(NodeData(_id=-1, _type=node_type, label=""), **kwargs)
+
+    def new_block(self) -> Block:
+        block = Block(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    @staticmethod
+    def add_edge(source: Block, target: Block) -> None:
+        source.successors.append(target._id)
+        target.predecessors.append(source._id)
+
+    def seal_block(self, block: Block) -> None:
+        block.sealed = True
+
+    def read(self, name: str) -> Variable:
+        variable = Variable(name)
+        self.uses.append(variable)
+        return variable
+
+    def write(self, name: str) -> Variable:
+        return Variable(name)
+
+    def emit(
+        self,
+        statement: Statement,
+        parts: list[Part],
+        defs: list[Variable] | None = None,
+    ) -> Instruction:
+        assert self.block is not None
+        instruction = Instruction(statement, parts, self.uses, defs or [])
+        self.uses = []
+        self.statements.append(statement)
+        self.block.instructions.append(instruction)
+        self.instructions.append(instruction)
+        return instruction
+
+    def visit_body(self, body) -> None:
+        for node in body:
+            # Rest of the body is unreachable
+            if self.block is None:
+                break
+            self.visit(node)
+
+    def operand(self, node) -> list[Part]:
+        if isinstance(node, Constant):
+            return [Literal(node.value)]
+        if isinstance(node, Name):
+            return [self.read(node.id)]
+        return [str(None)]
+
+    def call(self, node) -> list[Part]:
+        parts: list[Part] = [f"{node.func.id}("]
+        arguments = [
+            argument
+            for argument in node.args
+            if isinstance(argument, (Constant, Name, Call))
+        ]
+        for i, argument in enumerate(arguments):
+            if isinstance(argument, Call):
+                parts.extend(self.call(argument))
+            else:
+                parts.extend(self.operand(argument))
+            if i != len(arguments) - 1:
+                parts.append(", ")
+        parts.append(")")
+        return parts
+
+    def expression(self, node) -> list[Part]:
+        if isinstance(node, BinOp):
+            operator = OPERATORS[node.op.__class__]
+            lhs = self.operand(node.left)
+            return [*lhs, f" {operator} ", *self.operand(node.right)]
+        if isinstance(node, Call):
+            return self.call(node)
+        return self.operand(node)
+
+    def condition(self, node) -> list[Part]:
+        if isinstance(node, Compare):
+            comparator = COMPARATORS[node.ops[0].__class__]
+            lhs = self.operand(node.left)
+            return [*lhs, f" {comparator} ", *self.operand(node.comparators[0])]
+        return self.expression(node)
+
+    def assign(self, variable: str, value: list[Part]) -> None:
+        target = self.write(variable)
+        statement = self.__node(NodeType.ASSIGN, Statement)
+        self.emit(statement, [target, " = ", *value], [target])
+
+    def visit_Assign(self, node):
+        self.assign(node.targets[0].id, self.expression(node.value))
+
+    def visit_AugAssign(self, node):
+        variable = node.target.id
+        operator = OPERATORS[node.op.__class__]
+        value = [self.read(variable), f" {operator} ", *self.operand(node.value)]
+        self.assign(variable, value)
+
+    def visit_Call(self, node):
+        self.emit(self.__node(NodeType.CALL, Statement), self.call(node))
+
+    def visit_If(self, node):
+        condition = self.__node(NodeType.IF, IfStatement)
+        self.emit(condition, self.condition(node.test))
+        head = self.block
+        assert head is not None
+        statements = self.statements
+
+        then_block = self.new_block()
+        self.add_edge(head, then_block)
+        self.seal_block(then_block)
+        self.statements, self.block = condition.body, then_block
+        self.visit_body(node.body)
+        ends = [self.block]
+
+        if node.orelse:
+            else_block = self.new_block()
+            self.add_edge(head, else_block)
+            self.seal_block(else_block)
+            self.statements, self.block = condition.orelse, else_block
+            self.visit_body(node.orelse)
+            ends.append(self.block)
+        else:
+            ends.append(head)
+
+        self.statements, self.block = statements, None
+        if any(end is not None for end in ends):
+            merge = self.new_block()
+            for end in ends:
+                if end is not None:
+                    self.add_edge(end, merge)
+            self.seal_block(merge)
+            merge.phi_slot = (self.statements, len(self.statements))
+            self.block = merge
+            for branch, end in zip((condition.body, condition.orelse), ends):
+                if end is not None:
+                    self.fallthrough[id(branch)] = (end, merge)
+
+    def lower_loop(self, test, body, orelse, increment=None) -> None:
+        # `test` and `increment` are callbacks, so that variables
+        # are read in the header and in the end of the body
+        assert self.block is not None
+        phi_statement = self.__node(NodeType.ASSIGN, Statement)
+        self.statements.append(phi_statement)
+        header = self.new_block()
+        header.phi_statement = phi_statement
+        self.add_edge(self.block, header)
+        self.block = header
+
+        condition = self.__node(NodeType.IF, WhileStatement)
+        self.emit(condition, test())
+        body_block = self.new_block()
+        self.add_edge(header, body_block)
+        self.seal_block(body_block)
+        loop = Loop(phi_statement, header, increment=increment)
+        statements = self.statements
+
+        self.loops.append(loop)
+        self.statements, self.block = condition.body, body_block
+        self.visit_body(body)
+        if self.block is not None and increment is not None:
+            increment()
+        if self.block is not None:
+            self.add_edge(self.block, header)
+            self.fallthrough[id(condition.body)] = (self.block, header)
+        self.loops.pop()
+        self.seal_block(header)
+
+        end: Block | None = header
+        if orelse:
+            else_block = self.new_block()
+            self.add_edge(header, else_block)
+            self.seal_block(else_block)
+            self.statements, self.block = condition.orelse, else_block
+            self.visit_body(orelse)
+            end = self.block
+
+        loop.exit = self.new_block()
+        for block in [end, *loop.breaks]:
+            if block is not None:
+                self.add_edge(block, loop.exit)
+        self.seal_block(loop.exit)
+        if end is not None:
+            self.fallthrough[id(condition.orelse)] = (end, loop.exit)
+
+        self.statements = statements
+        self.block = loop.exit if loop.exit.predecessors else None
+        loop.exit.phi_slot = (self.statements, len(self.statements))
+        self.exits.append(loop)
+
+    def visit_While(self, node):
+        self.lower_loop(lambda: self.condition(node.test), node.body, node.orelse)
+
+    def visit_For(self, node):
+        variable = node.target.id
+        match node.iter.args:
+            case [start, stop, step]:  # Example: `for i in range(1, 10, 1)`
+                start, stop, step = map(self.operand, (start, stop, step))
+            case [start, stop]:  # Example: `for i in range(1, 10)`
+                start, stop = self.operand(start), self.operand(stop)
+                step = [Literal(1)]
+            case [stop]:  # Example: `for i in range(10)`
+                start, stop, step = [Literal(0)], self.operand(stop), [Literal(1)]
+        # Bounds of `range` are evaluated once before the loop, the test
+        # and the increment read them with versions from before the loop
+        self.assign(variable, start)
+
+        def increment():
+            value = [self.read(variable), " + ", *step]
+            self.uses.extend(part for part in step if isinstance(part, Variable))
+            self.assign(variable, value)
+
+        def test():
+            parts = [self.read(variable), " < ", *stop]
+            self.uses.extend(part for part in stop if isinstance(part, Variable))
+            return parts
+
+        self.lower_loop(test, node.body, node.orelse, increment)
+
+    def visit_Break(self, node):  # pylint: disable=unused-argument
+        loop = self.loops[-1]
+        statement = self.__node(
+            NodeType.BREAK, BreakStatement, while_statement=loop.phi_statement
+        )
+        self.emit(statement, ["break"])
+        loop.breaks.append(self.block)
+        self.block = None
+
+    def visit_Continue(self, node):  # pylint: disable=unused-argument
+        loop = self.loops[-1]
+        if loop.increment is not None:
+            loop.increment()
+        statement = self.__node(
+            NodeType.CONTINUE, ContinueStatement, while_statement=loop.phi_statement
+        )
+        self.emit(statement, ["continue"])
+        self.add_edge(self.block, loop.header)
+        self.block = None
+
+    def visit_Return(self, node):
+        statement = self.__node(NodeType.RETURN, ReturnStatement)
+        self.emit(statement, ["return ", *self.operand(node.value)])
+        self.returns.append((self.block, statement))
+        self.block = None
+
+    def visit_FunctionDef(self, node):
+        # Function body branches off at the point of definition,
+        # so it sees definitions before it, but not the ones after
+        head = self.block
+        assert head is not None
+        entry = self.new_block()
+        self.add_edge(head, entry)
+        self.seal_block(entry)
+        self.block = entry
+
+        function = self.__node(NodeType.FUNCTION_DEF, FunctionStatement)
+        parts: list[Part] = [f"def {node.name}("]
+        arguments = [self.write(argument.arg) for argument in node.args.args]
+        for i, argument in enumerate(arguments):
+            parts.append(argument)
+            if i != len(arguments) - 1:
+                parts.append(", ")
+        parts.append(")")
+        self.emit(function, parts, arguments)
+
+        statements, self.statements = self.statements, function.body
+        returns, self.returns = self.returns, []
+        self.visit_body(node.body)
+
+        end = self.new_block()
+        for block, _ in self.returns:
+            self.add_edge(block, end)
+        if self.block is not None:
+            self.add_edge(self.block, end)
+        self.seal_block(end)
+        self.block = end
+        function_end = self.__node(NodeType.FUNCTION_END, Statement)
+        self.emit(function_end, [f"End of function `{node.name}`"])
+        for _, statement in self.returns:
+            statement.end_of_function_statement = function_end
+
+        self.statements, self.returns = statements, returns
+        self.block = self.new_block()
+        self.add_edge(head, self.block)
+        self.seal_block(self.block)
+
+    def functions(self) -> list[int]:
+        # Entry block of the innermost function of every block, `-1` for
+        # module. Functions run when they are called, so variables from
+        # outside are read at call time, not at the definition.
+        function_of = [-1] * len(self.blocks)
+        for block in self.blocks:
+            if not block.instructions or not isinstance(
+                block.instructions[0].statement, FunctionStatement
+            ):
+                continue
+            # Nested functions come later and overwrite outer ones
+            stack = [block._id]
+            seen = {block._id}
+            while stack:
+                current = stack.pop()
+                function_of[current] = block._id
+                for successor in self.blocks[current].successors:
+                    if successor not in seen:
+                        seen.add(successor)
+                        stack.append(successor)
+        return function_of
+
+    def replace_uses(
+        self, replace: Callable[[Variable, int], Variable], function_of: list[int]
+    ) -> list[Phi | Instruction]:
+        # Every read variable is passed to `replace` with the function
+        # of its block, sites that may have changed are returned so
+        # that passes update `defuse` with them
+        changed: list[Phi | Instruction] = []
+        for block in self.blocks:
+            function = function_of[block._id]
+            for phi in block.phis:
+                operands = [replace(operand, function) for operand in phi.operands]
+                if any(new is not old for new, old in zip(operands, phi.operands)):
+                    changed.append(phi)
+                phi.operands = operands
+            for instruction in block.instructions:
+                if not instruction.uses:
+                    continue
+                used = {id(variable) for variable in instruction.uses}
+                instruction.parts = [
+                    (
+                        replace(part, function)
+                        if isinstance(part, Variable) and id(part) in used
+                        else part
+                    )
+                    for part in instruction.parts
+                ]
+                defined = {id(variable) for variable in instruction.defs}
+                instruction.uses = [
+                    part
+                    for part in instruction.parts
+                    if isinstance(part, Variable) and id(part) not in defined
+                ]
+                # Uses are built again from parts, reads of
+                # `range` bounds by `for` loops are dropped
+                changed.append(instruction)
+        return changed
+
+    def replace_statements(self, replacements: dict[int, list[Statement]]) -> None:
+        # Statements with `id` in `replacements` are replaced in place with
+        # the given statements. Merge blocks insert phis at positions in
+        # lists of statements, these positions move with statements.
+        slots: dict[int, list[Block]] = {}
+        for block in self.blocks:
+            if block.phi_slot is not None:
+                slots.setdefault(id(block.phi_slot[0]), []).append(block)
+        run_walk(_replace(self.statements, replacements, slots))
+
+    def first_statement(self, block: Block | None) -> Statement | None:
+        # First statement executed when control reaches the block
+        while block is not None:
+            if block.phi_statement is not None:
+                return block.phi_statement
+            if block.phi_statements:
+                return block.phi_statements[0]
+            if block.instructions:
+                return block.instructions[0].statement
+            block = self.blocks[block.successors[0]] if block.successors else None
+        return None
+
+    def finalize(self) -> None:
+        # Emit phis, render labels and number nodes in tree order
+        slots = []
+        for block in self.blocks:
+            if block.phi_statement is not None:
+                parts: list[NodePart] = []
+                for phi in block.phis:
+                    if parts:
+                        parts.append("\n")
+                    parts.extend(phi.parts)
+                block.phi_statement.node.set_parts(parts)
+            elif block.phi_slot is not None and block.phis:
+                block.phi_statements = [
+                    Statement(NodeData.from_parts(-1, NodeType.ASSIGN, phi.parts))
+                    for phi in block.phis
+                ]
+                statements, position = block.phi_slot
+                slots.append((position, statements, block))
+
+        # Later positions first, so earlier positions stay valid
+        slots.sort(key=lambda slot: slot[0], reverse=True)
+        for position, statements, block in slots:
+            statements[position:position] = block.phi_statements
+
+        for instruction in self.instructions:
+            instruction.render()
+
+        stack = [iter(self.statements)]
+        while stack:
+            statement = next(stack[-1], None)
+            if statement is None:
+                stack.pop()
+                continue
+            statement.node._id = self.counter
+            self.id2statement[self.counter] = statement
+            self.counter += 1
+            if isinstance(statement, IfStatement):
+                stack.append(iter(statement.orelse))
+                stack.append(iter(statement.body))
+            elif isinstance(statement, FunctionStatement):
+                stack.append(iter(statement.body))
+        self.counter -= 1
+
+        for loop in self.exits:
+            statement = self.first_statement(loop.exit)
+            if statement is not None:
+                self.node_after_while[loop.phi_statement.node._id] = statement.node._id
+
+
+def _replace(
+    statements: list[Statement],
+    replacements: dict[int, list[Statement]],
+    slots: dict[int, list[Block]],
+) -> Generator:
+    old = list(statements)
+    statements.clear()
+    # New position of every old position, phis at position of replaced
+    # statement stay before its replacement
+    positions = []
+    moved = []
+    for statement in old:
+        positions.append(len(statements))
+        replacement = replacements.get(id(statement))
+        if replacement is None:
+            statements.append(statement)
+            for attribute in ("body", "orelse"):
+                nested = getattr(statement, attribute, None)
+                if nested is not None:
+                    yield _replace(nested, replacements, slots)
+            continue
+        yield _replace(replacement, replacements, slots)
+        start = len(statements)
+        statements.extend(replacement)
+        for block in slots.pop(id(replacement), []):
+            assert block.phi_slot is not None
+            block.phi_slot = (statements, start + block.phi_slot[1])
+            moved.append(block)
+    positions.append(len(statements))
+    own = slots.pop(id(statements), [])
+    for block in own:
+        assert block.phi_slot is not None
+        block.phi_slot = (statements, positions[block.phi_slot[1]])
+    slots[id(statements)] = own + moved
@@ -1,12 +1,18 @@
+from io import StringIO
 from pprint import pprint
-from sys import exit
+from sys import argv, exit
 from pathlib import Path
 
+from .batch import main as batch_main, write_output
 from .builder import CFGBuilder
 from .graph import GraphBuilder
 
 
 def main():
+    # Files, directories or globs are processed in batch
+    if len(argv) > 1:
+        exit(batch_main(argv[1:]))
+
     # Example of Python code
     # See `../tests/example.py` for details
     python_file = Path("./tests/test_phi_simple.py")
@@ -23,6 +29,6 @@ def main():
     print("STATEMENTS:")
     pprint(builder.statements)
 
-    graph_builder = GraphBuilder(builder)
-    graph = graph_builder.graph
-    graph.write_png("cfg.png")  # pylint: disable=no-member
+    dot = StringIO()
+    GraphBuilder(builder, dot)
+    write_output(dot.getvalue(), Path("cfg.png"), "png")
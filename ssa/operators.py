@@ -0,0 +1,99 @@
+from operator import (
+    add,
+    and_,
+    contains,
+    eq,
+    floordiv,
+    ge,
+    gt,
+    is_,
+    is_not,
+    le,
+    lshift,
+    lt,
+    matmul,
+    mod,
+    mul,
+    ne,
+    or_,
+    pow,  # pylint: disable=redefined-builtin
+    rshift,
+    sub,
+    truediv,
+    xor,
+)
+from typing import Any, Callable
+from ast import Eq, NotEq, Lt, LtE, Gt, GtE, Is, IsNot, In, NotIn
+from ast import (
+    Add,
+    Sub,
+    Mult,
+    MatMult,
+    Div,
+    Mod,
+    Pow,
+    BitOr,
+    BitAnd,
+    BitXor,
+    FloorDiv,
+    LShift,
+    RShift,
+)
+
+
+COMPARATORS = {
+    Eq: "==",
+    NotEq: "!=",
+    Lt: "<",
+    LtE: "<=",
+    Gt: ">",
+    GtE: ">=",
+    Is: "is",
+    IsNot: "is not",
+    In: "in",
+    NotIn: "not in",
+}
+
+OPERATORS = {
+    Add: "+",
+    Sub: "-",
+    Mult: "*",
+    MatMult: "@",
+    Div: "/",
+    Mod: "%",
+    Pow: "**",
+    LShift: "<<",
+    RShift: ">>",
+    BitOr: "|",
+    BitXor: "^",
+    BitAnd: "&",
+    FloorDiv: "//",
+}
+
+# Functions of operators and comparators by their symbols,
+# constant folding evaluates labels with them
+FUNCTIONS: dict[str, Callable[[Any, Any], Any]] = {
+    "+": add,
+    "-": sub,
+    "*": mul,
+    "@": matmul,
+    "/": truediv,
+    "%": mod,
+    "**": pow,
+    "<<": lshift,
+    ">>": rshift,
+    "|": or_,
+    "^": xor,
+    "&": and_,
+    "//": floordiv,
+    "==": eq,
+    "!=": ne,
+    "<": lt,
+    "<=": le,
+    ">": gt,
+    ">=": ge,
+    "is": is_,
+    "is not": is_not,
+    "in": lambda lhs, rhs: contains(rhs, lhs),
+    "not in": lambda lhs, rhs: not contains(rhs, lhs),
+}
@@ -0,0 +1,447 @@
+from ast import BinOp, Call, Compare, FunctionDef, Name, NodeVisitor, parse
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, replace
+
+from . import profiling
+from .incremental import Region, region_bodies
+from .persistent import Versions
+from .regions import region_builder, visit_region
+from .statements import (
+    NAMES,
+    BreakStatement,
+    ContinueStatement,
+    FunctionStatement,
+    IfStatement,
+    NodeData,
+    NodeType,
+    Part,
+    ReturnStatement,
+    Statement,
+    WhileStatement,
+)
+
+# Known name that is not a name of the region, the search for
+# phis of `if` stops at it like at the name it stands for
+OUTSIDE = "<outside>"
+# First name of loop state a worker starts from, see `Seed.finded_keys`
+LOOP = "<loop>"
+
+KINDS = (
+    Statement,
+    IfStatement,
+    WhileStatement,
+    BreakStatement,
+    ContinueStatement,
+    FunctionStatement,
+    ReturnStatement,
+)
+KIND_INDEX = {kind: i for i, kind in enumerate(KINDS)}
+TYPES = tuple(NodeType)
+TYPE_INDEX = {_type: i for i, _type in enumerate(TYPES)}
+
+# Builder and regions of the module in a worker process
+WORKER: tuple | None = None
+
+
+@dataclass(frozen=True)
+class Seed:
+    # State of the builder that output of a region depends on. Versions
+    # are not a part of it: the region adds to versions it reads, so it
+    # is built from versions `0` and its versions are moved by versions
+    # of the builder when it is spliced.
+    # Names of the region known before it in order of first use
+    known: tuple[str, ...]
+    # Known names from the most recent one that are names of the
+    # region, and whether a known name of other regions follows them
+    recent: int
+    outside: bool
+    # Loop state left before the region is not empty, it is seen by
+    # the first pass over the first loops of the region
+    loop: bool
+
+    def versions(self) -> Versions:
+        split = len(self.known) - self.recent
+        ssa = Versions()
+        if self.loop:
+            # The oldest name is never reached by the search for phis
+            ssa = ssa.set(LOOP, 0)
+        for name in self.known[:split]:
+            ssa = ssa.set(name, 0)
+        if self.outside:
+            ssa = ssa.set(OUTSIDE, 0)
+        for name in self.known[split:]:
+            ssa = ssa.set(name, 0)
+        return ssa
+
+    def finded_keys(self) -> list[str]:
+        # Names changed by the previous loop are known names. Phis of the
+        # first pass are built for all of them after `LOOP`, so versions
+        # of names before the loop are known when the region is spliced
+        # and phis of names that were changed are built again.
+        if not self.loop:
+            return []
+        return [LOOP, *self.known]
+
+
+class FirstUseCollector(NodeVisitor):
+    # Names in the order `CFGBuilder` reads or writes them first, and
+    # whether the last loop it visits changes names known before it,
+    # so that the loop leaves loop state for the next region
+    def __init__(self) -> None:
+        self.ranks: dict[str, int] = {}
+        self.names: list[str] = []
+        self.changed = False
+        self.loops = 0
+        # Names assigned by every loop the collector is inside of
+        self.assigned: list[set[str]] = []
+
+    def seed(self, names: set[str], loop: bool) -> Seed:
+        known = sorted(
+            (name for name in names if name in self.ranks), key=self.ranks.__getitem__
+        )
+        recent = 0
+        for name in reversed(self.names):
+            if name not in names:
+                break
+            recent += 1
+        outside = recent < len(self.names)
+        return Seed(tuple(known), recent, outside, loop and self.changed)
+
+    def __use(self, name: str) -> None:
+        if name not in self.ranks:
+            self.ranks[name] = len(self.names)
+            self.names.append(name)
+
+    def __write(self, name: str) -> None:
+        self.__use(name)
+        for names in self.assigned:
+            names.add(name)
+
+    def __argument(self, node) -> None:
+        # Names that `CFGBuilder` reads in parts of an argument
+        if isinstance(node, Name):
+            self.__use(node.id)
+        elif isinstance(node, Call):
+            for item in node.args:
+                self.__argument(item)
+
+    def __test(self, node) -> None:
+        if isinstance(node.test, Compare):
+            self.__argument(node.test.left)
+            self.__argument(node.test.comparators[0])
+
+    def __body(self, node) -> None:
+        for item in (*node.body, *node.orelse):
+            self.visit(item)
+
+    def __loop(self, node, target: str | None = None) -> None:
+        self.loops += 1
+        loop, start = self.loops, len(self.names)
+        self.assigned.append(set() if target is None else {target})
+        if target is None:
+            self.__test(node)
+        self.__body(node)
+        assigned = self.assigned.pop()
+        # Nested loops are visited after the loop has changed names
+        if loop == self.loops:
+            self.changed = any(self.ranks[name] < start for name in assigned)
+
+    def visit_Assign(self, node):
+        if isinstance(node.targets[0], Name):
+            self.__write(node.targets[0].id)
+        if isinstance(node.value, BinOp):
+            self.__argument(node.value.left)
+            self.__argument(node.value.right)
+        else:
+            self.__argument(node.value)
+
+    def visit_AugAssign(self, node):
+        if isinstance(node.target, Name):
+            self.__write(node.target.id)
+        self.__argument(node.value)
+
+    def visit_If(self, node):
+        self.__test(node)
+        self.__body(node)
+
+    def visit_While(self, node):
+        self.__loop(node)
+
+    def visit_For(self, node):
+        # Bounds of `range` are read before the loop variable,
+        # the upper one first
+        arguments = node.iter.args if isinstance(node.iter, Call) else []
+        for item in (*arguments[1:2], *arguments[:1], *arguments[2:3]):
+            self.__argument(item)
+        self.__write(node.target.id)
+        self.__loop(node, node.target.id)
+
+    def visit_FunctionDef(self, node):
+        for item in node.args.args:
+            self.__write(item.arg)
+        for item in node.body:
+            self.visit(item)
+
+    def visit_Return(self, node):
+        self.__argument(node.value)
+
+    def visit_Call(self, node):
+        self.__argument(node)
+
+
+# Top-level functions of the module are built by worker processes from
+# the state the builder is predicted to have before them. The builder
+# takes a function only when its state matches the prediction, and
+# builds the function itself otherwise, so the result is the same as
+# the result of building the module in one process.
+class RegionPool:
+    def __init__(
+        self,
+        builder_class,
+        source: str,
+        regions: list[tuple[list, str, set[str]]],
+        loop_mode,
+        form,
+        workers: int,
+    ) -> None:
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_start_worker,
+            initargs=(builder_class, source, loop_mode, form),
+        )
+        # Regions with loops see loop state of the previous region
+        self.loops: set[int] = set()
+        self.futures: dict[int, tuple[Seed, Future]] = {}
+        # Loop state is left only by loops that are visited twice
+        revisit = loop_mode.name == "REVISIT"
+        collector = FirstUseCollector()
+        for position, (body, _, names) in enumerate(regions):
+            seed = collector.seed(names, revisit)
+            loops = collector.loops
+            for node in body:
+                collector.visit(node)
+            if not isinstance(body[0], FunctionDef):
+                continue
+            if collector.loops > loops:
+                self.loops.add(position)
+            else:
+                seed = replace(seed, loop=False)
+            future = self.executor.submit(_build_region, position, seed)
+            self.futures[position] = seed, future
+
+    def take(
+        self, position: int, key: tuple, builder, known: list[str], recent: int
+    ) -> Region | None:
+        # Region built by a worker when it is built from the state of `builder`
+        entry = self.futures.pop(position, None)
+        if entry is None:
+            return None
+        seed, future = entry
+        actual = Seed(
+            tuple(known),
+            recent,
+            recent < len(builder.ssa),
+            bool(builder.finded_keys) and position in self.loops,
+        )
+        if actual != seed:
+            future.cancel()
+            return None
+        result = future.result()
+        if result is None:
+            return None
+        return decode(result, key, builder)
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+def _start_worker(builder_class, source: str, loop_mode, form) -> None:
+    global WORKER
+    profiling.reset()
+    tree = parse(source)
+    builder = region_builder(builder_class, tree, loop_mode, form)
+    WORKER = builder, list(region_bodies(tree))
+
+
+def _build_region(position: int, seed: Seed) -> tuple | None:
+    assert WORKER is not None
+    builder, bodies = WORKER
+    ssa, finded_keys = seed.versions(), seed.finded_keys()
+    # Statement of the previous region, the region is built
+    # by the builder itself when it reads this statement
+    current = Statement(NodeData(-1, NodeType.NULL))
+    visit_region(builder, bodies[position], ssa, finded_keys, current)
+    return encode(builder, ssa, finded_keys)
+
+
+def encode(builder, ssa: Versions, finded_keys: list[str]) -> tuple | None:
+    # Region as flat tuples of strings and ints. Statements and nodes
+    # are numbered once, so shared ones stay shared and copies made by
+    # loops stay copies, operands refer to names of the region.
+    current = builder.current if builder.current.node._id >= 0 else None
+    numbers: dict[int, int] = {}
+    statements: list[Statement] = []
+    stack = [*builder.statements, *builder.id2statement.values()]
+    if current is not None:
+        stack.append(current)
+    while stack:
+        statement = stack.pop()
+        if id(statement) in numbers:
+            continue
+        if statement.node._id < 0:
+            return None
+        numbers[id(statement)] = len(statements)
+        statements.append(statement)
+        stack.extend(getattr(statement, "body", ()))
+        stack.extend(getattr(statement, "orelse", ()))
+        for name in ("while_statement", "end_of_function_statement"):
+            if (item := getattr(statement, name, None)) is not None:
+                stack.append(item)
+
+    names: dict[int, int] = {}
+    nodes: dict[int, int] = {}
+    node_data: list[tuple] = []
+    encoded: list[tuple] = []
+    for statement in statements:
+        node = statement.node
+        if id(node) not in nodes:
+            nodes[id(node)] = len(node_data)
+            operands = list(node.operands)
+            for i in range(0, len(operands), 2):
+                operands[i] = names.setdefault(operands[i], len(names))
+            node_data.append(
+                (node._id, TYPE_INDEX[node._type], node.template, tuple(operands))
+            )
+        link = getattr(statement, "while_statement", None) or getattr(
+            statement, "end_of_function_statement", None
+        )
+        encoded.append(
+            (
+                KIND_INDEX[type(statement)],
+                nodes[id(node)],
+                tuple(numbers[id(item)] for item in getattr(statement, "body", ())),
+                tuple(numbers[id(item)] for item in getattr(statement, "orelse", ())),
+                -1 if link is None else numbers[id(link)],
+            )
+        )
+
+    loop = None
+    if builder.finded_keys is not finded_keys:
+        loop = (
+            tuple(
+                (name, builder.ssa_before[name], builder.ssa_after[name])
+                for name in builder.finded_keys
+            ),
+            tuple(builder.pruned_keys),
+        )
+    versions = sorted(
+        ((name, new) for name, _, new in ssa.versions.diff(builder.ssa.versions)),
+        key=lambda item: builder.ssa.rank(item[0]),
+    )
+    return (
+        tuple(NAMES[name_id] for name_id in names),
+        tuple(node_data),
+        tuple(encoded),
+        tuple(numbers[id(statement)] for statement in builder.statements),
+        tuple((_id, numbers[id(item)]) for _id, item in builder.id2statement.items()),
+        tuple(builder.node_after_while.items()),
+        -1 if current is None else numbers[id(current)],
+        tuple(versions),
+        loop,
+        builder.phis_avoided,
+        builder.counter,
+    )
+
+
+def decode(result: tuple, key: tuple, builder) -> Region:
+    # Ids of the region follow ids of `builder`
+    (
+        names,
+        node_data,
+        encoded,
+        top,
+        id2statement,
+        node_after_while,
+        current,
+        versions,
+        loop,
+        avoided,
+        end,
+    ) = result
+    ssa, shift = builder.ssa, builder.counter
+    offsets = [ssa.get(name, 0) for name in names]
+    name_ids = [NAMES.intern(name) for name in names]
+    loop_id = NAMES.intern(LOOP)
+    nodes = []
+    for _id, _type, template, operands in node_data:
+        node = NodeData(_id + shift, TYPES[_type], template)
+        if operands:
+            moved = list(operands)
+            for i in range(0, len(moved), 2):
+                moved[i + 1] += offsets[moved[i]]
+                moved[i] = name_ids[moved[i]]
+            node.operands = tuple(moved)
+            if moved[0] == loop_id:
+                node.set_parts(_loop_phi_parts(moved, builder))
+        nodes.append(node)
+
+    statements: list = []
+    for kind, node, *_ in encoded:
+        statement = KINDS[kind].__new__(KINDS[kind])
+        statement.node = nodes[node]
+        statements.append(statement)
+    for statement, (_, _, body, orelse, link) in zip(statements, encoded):
+        if isinstance(statement, (IfStatement, FunctionStatement)):
+            statement.body = [statements[i] for i in body]
+        if isinstance(statement, IfStatement):
+            statement.orelse = [statements[i] for i in orelse]
+        if isinstance(statement, (BreakStatement, ContinueStatement)):
+            statement.while_statement = statements[link]
+        elif isinstance(statement, ReturnStatement):
+            statement.end_of_function_statement = None if link < 0 else statements[link]
+
+    region = Region(
+        key,
+        shift,
+        end + shift,
+        [statements[i] for i in top],
+        {_id + shift: statements[i] for _id, i in id2statement},
+        {_id + shift: target + shift for _id, target in node_after_while},
+        versions=[(name, version + ssa.get(name, 0)) for name, version in versions],
+        finded_keys=list(builder.finded_keys),
+        pruned_keys=set(builder.pruned_keys),
+        ssa_before=builder.ssa_before,
+        ssa_after=builder.ssa_after,
+        current=None if current < 0 else statements[current],
+        phis_avoided=avoided,
+    )
+    if loop is not None:
+        # Only versions of changed names are read from loop state
+        changed, pruned = loop
+        region.finded_keys = [name for name, _, _ in changed]
+        region.pruned_keys = set(pruned)
+        region.ssa_before = region.ssa_after = ssa
+        for name, before, after in changed:
+            offset = ssa.get(name, 0)
+            region.ssa_before = region.ssa_before.set(name, before + offset)
+            region.ssa_after = region.ssa_after.set(name, after + offset)
+    return region
+
+
+def _loop_phi_parts(operands: list[int], builder) -> list[Part]:
+    # Phis of the first pass over a loop for names changed by the loop
+    # before the region, operands are phis of the worker for all known
+    # names with versions of these names before the loop
+    versions = {operands[i]: operands[i + 3] for i in range(0, len(operands), 6)}
+    parts: list[Part] = []
+    for key in builder.finded_keys:
+        if key in builder.pruned_keys:
+            continue
+        version = versions.get(NAMES.ids[key], builder.ssa[key])
+        if parts:
+            parts.append("\n")
+        after = builder.ssa_after.get(key, 0) + 1
+        parts.extend(
+            [(key, version + 1), " = φ(", (key, version), ", ", (key, after), ")"]
+        )
+    return parts
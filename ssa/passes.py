@@ -0,0 +1,18 @@
+from typing import Callable
+
+from .cleanup import copy_propagation, dead_code_elimination
+from .gvn import global_value_numbering
+from .lowering import BlockBuilder
+from .sccp import sccp
+
+# Passes over basic blocks in SSA form by their names on the command
+# line, they run in the given order and return reports with `summary`
+PASSES: dict[str, Callable[[BlockBuilder], object]] = {
+    "sccp": sccp,
+    "gvn": global_value_numbering,
+    "copies": copy_propagation,
+    "dce": dead_code_elimination,
+}
+
+# Passes of `--optimize`
+OPTIMIZE = ("sccp", "gvn", "copies", "dce")
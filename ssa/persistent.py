@@ -0,0 +1,248 @@
+from sys import hash_info
+from typing import Any, Hashable, Iterator
+
+BITS = 5
+MASK = (1 << BITS) - 1
+
+
+class _Node:
+    # Children are `(key, value)` pairs or nested nodes,
+    # `bitmap` tells which of 32 slots are occupied
+    __slots__ = ("bitmap", "children")
+
+    def __init__(self, bitmap: int, children: tuple) -> None:
+        self.bitmap = bitmap
+        self.children = children
+
+
+class _Collision:
+    # Keys with equal full hashes
+    __slots__ = ("children",)
+
+    def __init__(self, children: tuple) -> None:
+        self.children = children
+
+
+EMPTY = _Node(0, ())
+
+
+def _pair(shift: int, first: tuple, second: tuple) -> _Node | _Collision:
+    if shift >= hash_info.width:
+        return _Collision((first, second))
+    first_index = (hash(first[0]) >> shift) & MASK
+    second_index = (hash(second[0]) >> shift) & MASK
+    if first_index == second_index:
+        return _Node(1 << first_index, (_pair(shift + BITS, first, second),))
+    if first_index > second_index:
+        first, second = second, first
+    return _Node((1 << first_index) | (1 << second_index), (first, second))
+
+
+def _set(node, shift: int, key: Hashable, value: Any) -> tuple[Any, bool]:
+    # Copies only the path to the key, returns the same node
+    # when nothing is changed, so unchanged subtrees stay shared
+    if isinstance(node, _Collision):
+        for i, child in enumerate(node.children):
+            if child[0] == key:
+                if child[1] == value:
+                    return node, False
+                children = node.children[:i] + ((key, value),) + node.children[i + 1 :]
+                return _Collision(children), False
+        return _Collision(node.children + ((key, value),)), True
+
+    bit = 1 << ((hash(key) >> shift) & MASK)
+    index = (node.bitmap & (bit - 1)).bit_count()
+    if not node.bitmap & bit:
+        children = node.children[:index] + ((key, value),) + node.children[index:]
+        return _Node(node.bitmap | bit, children), True
+
+    child = node.children[index]
+    new: tuple | _Node | _Collision
+    added = False
+    if isinstance(child, tuple):
+        if child[0] == key:
+            if child[1] == value:
+                return node, False
+            new = (key, value)
+        else:
+            new, added = _pair(shift + BITS, child, (key, value)), True
+    else:
+        new, added = _set(child, shift + BITS, key, value)
+        if new is child:
+            return node, False
+    children = node.children[:index] + (new,) + node.children[index + 1 :]
+    return _Node(node.bitmap, children), added
+
+
+def _items(node) -> Iterator[tuple]:
+    for child in node.children:
+        if isinstance(child, tuple):
+            yield child
+        else:
+            yield from _items(child)
+
+
+def _diff(lhs, rhs, shift: int) -> Iterator[tuple]:
+    if lhs is rhs:
+        return
+    if isinstance(lhs, _Node) and isinstance(rhs, _Node):
+        for index in range(1 << BITS):
+            bit = 1 << index
+            if not (lhs.bitmap | rhs.bitmap) & bit:
+                continue
+            left = right = None
+            if lhs.bitmap & bit:
+                left = lhs.children[(lhs.bitmap & (bit - 1)).bit_count()]
+            if rhs.bitmap & bit:
+                right = rhs.children[(rhs.bitmap & (bit - 1)).bit_count()]
+            if left is right:
+                continue
+            if isinstance(left, _Node) and isinstance(right, _Node):
+                yield from _diff(left, right, shift + BITS)
+            else:
+                yield from _diff_items(left, right)
+        return
+    yield from _diff_items(lhs, rhs)
+
+
+def _diff_items(lhs, rhs) -> Iterator[tuple]:
+    # Small subtrees of different shape are compared by items
+    left = dict(_subtree_items(lhs))
+    right = dict(_subtree_items(rhs))
+    for key, value in left.items():
+        other = right.get(key)
+        if other != value:
+            yield key, value, other
+    for key, value in right.items():
+        if key not in left:
+            yield key, None, value
+
+
+def _subtree_items(node) -> Iterator[tuple]:
+    if node is None:
+        return
+    if isinstance(node, tuple):
+        yield node
+    else:
+        yield from _items(node)
+
+
+# Immutable hash array mapped trie. `set` returns a new map that shares
+# all untouched nodes with the old one, so a snapshot is just a reference
+# and comparison of two snapshots skips their shared subtrees.
+class PersistentMap:
+    __slots__ = ("root", "size")
+
+    def __init__(self, root=EMPTY, size: int = 0) -> None:
+        self.root = root
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        node = self.root
+        key_hash = hash(key)
+        shift = 0
+        while True:
+            if isinstance(node, _Collision):
+                for child in node.children:
+                    if child[0] == key:
+                        return child[1]
+                return default
+            bit = 1 << ((key_hash >> shift) & MASK)
+            if not node.bitmap & bit:
+                return default
+            node = node.children[(node.bitmap & (bit - 1)).bit_count()]
+            if isinstance(node, tuple):
+                return node[1] if node[0] == key else default
+            shift += BITS
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key: Hashable, value: Any) -> "PersistentMap":
+        root, added = _set(self.root, 0, key, value)
+        if root is self.root:
+            return self
+        return PersistentMap(root, self.size + added)
+
+    def items(self) -> Iterator[tuple]:
+        return _items(self.root)
+
+    def __iter__(self) -> Iterator:
+        return (key for key, _ in self.items())
+
+    def diff(self, other: "PersistentMap") -> Iterator[tuple]:
+        # `(key, value here, value in other)` for every key whose
+        # value differs, `None` stands for missing key
+        return _diff(self.root, other.root, 0)
+
+
+_MISSING = object()
+
+
+# Versions of variables that remember the order in which variables
+# were first used. Rank of variable is its position in that order,
+# the most recent variables are kept in a linked list of pairs,
+# so both are restored together with the versions by a reference.
+class Versions:
+    __slots__ = ("versions", "ranks", "recent")
+
+    def __init__(
+        self,
+        versions: PersistentMap = PersistentMap(),
+        ranks: PersistentMap = PersistentMap(),
+        recent: tuple | None = None,
+    ) -> None:
+        self.versions = versions
+        self.ranks = ranks
+        self.recent = recent
+
+    def __len__(self) -> int:
+        return len(self.versions)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.versions.get(key, default)
+
+    def __getitem__(self, key: Hashable) -> int:
+        return self.versions[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.versions
+
+    def rank(self, key: Hashable) -> int:
+        return self.ranks[key]
+
+    def set(self, key: Hashable, version: int) -> "Versions":
+        if key in self.versions:
+            return Versions(self.versions.set(key, version), self.ranks, self.recent)
+        return Versions(
+            self.versions.set(key, version),
+            self.ranks.set(key, len(self.versions)),
+            (key, self.recent),
+        )
+
+    def __iter__(self) -> Iterator:
+        # From the most recent variable to the first one
+        node = self.recent
+        while node is not None:
+            yield node[0]
+            node = node[1]
+
+    def changed(self, other: "Versions") -> list[tuple]:
+        # `(key, version here, version in other)` for variables
+        # known in both with different versions, in order of first use
+        changed = [
+            (key, value, other_value)
+            for key, value, other_value in self.versions.diff(other.versions)
+            if value is not None and other_value is not None
+        ]
+        changed.sort(key=lambda item: self.ranks[item[0]])
+        return changed
@@ -0,0 +1,139 @@
+from ast import stmt
+from collections import Counter
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from json import dump
+from os import getpid
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Any, Callable, Iterator
+
+# Profiler of the running pipeline, `None` when profiling is off.
+# Instrumented code checks it once per event, so profiling that is
+# off costs one attribute lookup.
+ACTIVE: "Profiler | None" = None
+
+NO_PHASE = nullcontext()
+
+
+# Times of phases, counters of events and, when `trace` is on,
+# spans in Chrome trace event format. Phases nest, time of a phase
+# includes time of phases inside it.
+class Profiler:
+    def __init__(self, *, trace: bool = False) -> None:
+        self.trace = trace
+        self.phases: dict[str, float] = {}
+        self.counters: Counter[str] = Counter()
+        self.events: list[dict[str, Any]] = []
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    @contextmanager
+    def phase(self, name: str, *, tid: int = 0, **args: Any) -> Iterator[None]:
+        # Phases that run at the same time need different `tid`
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = perf_counter_ns()
+            self.phases[name] = self.phases.get(name, 0.0) + (end - start) / 1e9
+            if self.trace:
+                self.span(name, "phase", start, end, tid, **args)
+
+    def span(
+        self, name: str, category: str, start: int, end: int, tid: int = 0, **args: Any
+    ) -> None:
+        # Complete event, times are in microseconds
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start / 1e3,
+                "dur": (end - start) / 1e3,
+                "pid": getpid(),
+                "tid": tid,
+                "args": args,
+            }
+        )
+
+    def visit(self, node, visitor: Callable) -> Any:
+        # Visit of AST node, every statement gets its own span
+        self.counters["nodes_visited"] += 1
+        if not self.trace or not isinstance(node, stmt):
+            return visitor(node)
+        start = perf_counter_ns()
+        try:
+            return visitor(node)
+        finally:
+            self.span(
+                type(node).__name__,
+                "visit",
+                start,
+                perf_counter_ns(),
+                line=getattr(node, "lineno", None),
+            )
+
+    def merge(self, other: "Profiler") -> None:
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.counters.update(other.counters)
+        self.events.extend(other.events)
+
+    def trace_events(self) -> dict[str, Any]:
+        # Counters are added as one counter event after the last span
+        end = max((event["ts"] + event["dur"] for event in self.events), default=0)
+        counters = {
+            "name": "counters",
+            "ph": "C",
+            "ts": end,
+            "pid": getpid(),
+            "args": dict(self.counters),
+        }
+        return {"traceEvents": [*self.events, counters], "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as file:
+            dump(self.trace_events(), file)
+
+    def report(self) -> str:
+        lines = [f"{'phase':<16}{'seconds':>12}"]
+        for name, seconds in sorted(self.phases.items(), key=lambda item: -item[1]):
+            lines.append(f"{name:<16}{seconds:>12.4f}")
+        lines.append(f"{'counter':<16}{'value':>12}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<16}{value:>12}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiling(
+    profiler: Profiler | None = None, *, trace: bool = False
+) -> Iterator[Profiler]:
+    # Everything run inside is recorded by the profiler
+    global ACTIVE  # pylint: disable=global-statement
+    previous = ACTIVE
+    ACTIVE = Profiler(trace=trace) if profiler is None else profiler
+    try:
+        yield ACTIVE
+    finally:
+        ACTIVE = previous
+
+
+def reset() -> None:
+    # Initializer of worker processes, forked workers must not
+    # record into the copy of the profiler of their parent
+    global ACTIVE  # pylint: disable=global-statement
+    ACTIVE = None
+
+
+def phase(name: str, **args: Any) -> AbstractContextManager:
+    # Times the block when profiling is on
+    if ACTIVE is None:
+        return NO_PHASE
+    return ACTIVE.phase(name, **args)
+
+
+def count(name: str, value: int = 1) -> None:
+    if ACTIVE is not None:
+        ACTIVE.counters[name] += value
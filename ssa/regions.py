@@ -0,0 +1,166 @@
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .incremental import Region, shift_ids
+from .persistent import Versions
+from .statements import Statement
+
+
+# Top-level regions of a module are built one by one by the builder.
+# Regions of the previous build and regions built by worker processes
+# of `RegionPool` are spliced in when the builder has the same state.
+# Built regions are kept in `builder.regions` when `record` is set.
+def visit_regions(
+    builder,
+    regions: Iterable[tuple[list, str, set[str]]],
+    previous: list[Region],
+    pool=None,
+    record: bool = True,
+) -> Iterator[list[Statement]]:
+    # Regions of previous build are moved to this build,
+    # so previous build must not be used after that
+    reusable: dict[tuple, list[Region]] = {}
+    for region in reversed(previous):
+        reusable.setdefault(region.key, []).append(region)
+
+    # Module node itself takes an id in `visit`
+    builder.counter += 1
+    yield builder.statements[:]
+    bounds = []
+    for position, (body, fingerprint, names) in enumerate(regions):
+        known = sorted(
+            (name for name in names if name in builder.ssa),
+            key=builder.ssa.rank,
+        )
+        # Phis of `if` depend on the most recent variables
+        recent = 0
+        for name in builder.ssa:
+            if name not in names:
+                break
+            recent += 1
+        # Loop state left by previous region is seen by the first
+        # pass over a loop, so it is a part of the key too
+        key = (
+            fingerprint,
+            builder.loop_mode,
+            builder.form,
+            region_phi_names(builder, body, names),
+            recent,
+            tuple(
+                (name, builder.ssa_before.get(name), builder.ssa_after.get(name))
+                for name in builder.finded_keys
+            ),
+            tuple((name, builder.ssa[name]) for name in known),
+        )
+        index, counter, ssa = len(builder.statements), builder.counter, builder.ssa
+        avoided = builder.phis_avoided
+        if candidates := reusable.get(key):
+            splice(builder, candidates.pop())
+            builder.reused_regions += 1
+        elif pool is not None and (
+            built := pool.take(position, key, builder, known, recent)
+        ):
+            splice(builder, built)
+            builder.parallel_regions += 1
+        else:
+            builder.visit(body)
+        if not record:
+            yield builder.statements[index:]
+            continue
+        current = builder.current if builder.current.node._id > counter else None
+        bounds.append(
+            (
+                Region(
+                    key,
+                    counter,
+                    builder.counter,
+                    versions=sorted(
+                        (
+                            (name, new)
+                            for name, _, new in ssa.versions.diff(builder.ssa.versions)
+                        ),
+                        key=lambda item: builder.ssa.rank(item[0]),
+                    ),
+                    finded_keys=list(builder.finded_keys),
+                    pruned_keys=set(builder.pruned_keys),
+                    ssa_before=builder.ssa_before,
+                    ssa_after=builder.ssa_after,
+                    current=current,
+                    phis_avoided=builder.phis_avoided - avoided,
+                    loop_exits=[
+                        item for item in builder.loop_exits if item[0] > counter
+                    ],
+                ),
+                index,
+                len(builder.statements),
+            )
+        )
+        yield builder.statements[index:]
+    if pool is not None:
+        pool.close()
+    builder.append_end()
+    yield builder.statements[-1:]
+
+    # Statements are collected at the end, because loops replace
+    # statements built before them with their copies
+    for region, start, end in bounds:
+        region.statements = builder.statements[start:end]
+        for _id in range(region.counter + 1, region.end + 1):
+            if _id in builder.id2statement:
+                region.id2statement[_id] = builder.id2statement[_id]
+            # Exits to the next region are left by `loop_exits`
+            target = builder.node_after_while.get(_id, region.end + 1)
+            if target <= region.end:
+                region.node_after_while[_id] = target
+        builder.regions.append(region)
+
+
+def region_phi_names(builder, body: list, names: set[str]) -> frozenset[str] | None:
+    # Phis of the region depend on names live after it
+    if builder.liveness is not None:
+        return builder.liveness.out[id(body[-1])] & names
+    if builder.non_local is not None:
+        return frozenset(builder.non_local & names)
+    return None
+
+
+def splice(builder, region: Region) -> None:
+    shift_ids(region, builder.counter - region.counter)
+    builder.statements.extend(region.statements)
+    builder.id2statement.update(region.id2statement)
+    builder.node_after_while.update(region.node_after_while)
+    for name, version in region.versions:
+        builder.ssa = builder.ssa.set(name, version)
+    builder.finded_keys = list(region.finded_keys)
+    builder.pruned_keys = set(region.pruned_keys)
+    builder.phis_avoided += region.phis_avoided
+    builder.ssa_before = region.ssa_before
+    builder.ssa_after = region.ssa_after
+    builder.counter = region.end
+    if region.current is not None:
+        builder.current = region.current
+    builder.loop_exits = builder.exit_loops(builder.loop_exits) + region.loop_exits
+
+
+def region_builder(builder_class, tree, loop_mode, form):
+    # Builder of single regions of `tree`, see `visit_region`. Lazy
+    # build visits nothing until its regions are asked for.
+    return builder_class(Path(), loop_mode=loop_mode, form=form, lazy=True, tree=tree)
+
+
+def visit_region(
+    builder, body: list, ssa: Versions, finded_keys: list[str], current: Statement
+) -> None:
+    # Region is visited alone from the given state, ids of
+    # its nodes start at 1 and it has its own statements
+    builder.counter = 0
+    builder.current = current
+    builder.statements = []
+    builder.id2statement = {}
+    builder.node_after_while = {}
+    builder.loop_exits = []
+    builder.ssa = builder.ssa_before = builder.ssa_after = ssa
+    builder.finded_keys = finded_keys
+    builder.pruned_keys = set()
+    builder.phis_avoided = 0
+    builder.visit(body)
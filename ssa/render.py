@@ -0,0 +1,133 @@
+from asyncio import Queue, create_subprocess_exec, create_task, gather, run, wait_for
+from asyncio.subprocess import DEVNULL, PIPE
+from dataclasses import dataclass
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable
+
+from . import profiling
+
+# Formats that are written without Graphviz
+TEXT_FORMATS = ("raw", "jsonl", "py", "counts", "ir")
+
+
+@dataclass(frozen=True)
+class RenderJob:
+    dot: str
+    output: Path
+    output_format: str
+    # Input file the graph is built from
+    source: Path | None = None
+
+
+@dataclass
+class RenderResult:
+    job: RenderJob
+    elapsed: float
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# Renders DOT text with at most `workers` processes of `dot` at once.
+# Graphs longer than `large_bytes` have their own lane of workers, so
+# a huge graph holds up only other huge graphs. `submit` waits while
+# the lane of the job is full, so DOT text does not pile up in memory.
+class RenderPool:
+    def __init__(
+        self,
+        workers: int | None = None,
+        *,
+        timeout: float | None = None,
+        queue_size: int | None = None,
+        large_bytes: int = 1 << 20,
+    ) -> None:
+        self.workers = max(1, workers or cpu_count() or 1)
+        self.timeout = timeout
+        self.large_bytes = large_bytes
+        self.results: list[RenderResult] = []
+
+        size = queue_size or 2 * self.workers
+        large = max(1, self.workers // 4) if self.workers > 1 else 0
+        self.__lanes: list[tuple[Queue, int]] = [(Queue(size), self.workers - large)]
+        if large:
+            self.__lanes.append((Queue(size), large))
+        self.__tasks: list = []
+
+    async def __aenter__(self) -> "RenderPool":
+        queues = [queue for queue, count in self.__lanes for _ in range(count)]
+        self.__tasks = [
+            create_task(self.__work(queue, index)) for index, queue in enumerate(queues)
+        ]
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is not None:
+            for task in self.__tasks:
+                task.cancel()
+            await gather(*self.__tasks, return_exceptions=True)
+            return
+        for queue, count in self.__lanes:
+            for _ in range(count):
+                await queue.put(None)
+        await gather(*self.__tasks)
+
+    async def submit(self, job: RenderJob) -> None:
+        lane = -1 if len(job.dot) > self.large_bytes else 0
+        await self.__lanes[lane][0].put(job)
+
+    async def __work(self, queue: Queue, index: int) -> None:
+        while (job := await queue.get()) is not None:
+            with profiling.phase("graphviz", tid=index + 1, output=str(job.output)):
+                self.results.append(await self.__render(job))
+
+    async def __render(self, job: RenderJob) -> RenderResult:
+        start = perf_counter()
+        job.output.parent.mkdir(parents=True, exist_ok=True)
+        command = ["dot", f"-T{job.output_format}", "-o", str(job.output)]
+        try:
+            process = await create_subprocess_exec(
+                *command, stdin=PIPE, stdout=DEVNULL, stderr=PIPE
+            )
+        except OSError as exc:
+            return RenderResult(
+                job, perf_counter() - start, f"{type(exc).__name__}: {exc}"
+            )
+
+        try:
+            _, stderr = await wait_for(
+                process.communicate(job.dot.encode("utf-8")), self.timeout
+            )
+        except TimeoutError:
+            # Partial output is not left behind
+            job.output.unlink(missing_ok=True)
+            return RenderResult(
+                job, perf_counter() - start, f"timed out after {self.timeout}s"
+            )
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        if process.returncode != 0:
+            message = stderr.decode("utf-8", errors="replace").strip()
+            return RenderResult(
+                job,
+                perf_counter() - start,
+                f"dot exited with {process.returncode}: {message}",
+            )
+        return RenderResult(job, perf_counter() - start)
+
+
+def render(
+    jobs: Iterable[RenderJob], workers: int | None = None, **options
+) -> list[RenderResult]:
+    async def render_all() -> list[RenderResult]:
+        async with RenderPool(workers, **options) as pool:
+            for job in jobs:
+                await pool.submit(job)
+        return pool.results
+
+    return run(render_all())
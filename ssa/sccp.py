@@ -0,0 +1,421 @@
+from dataclasses import dataclass, field
+
+from . import profiling
+from .lowering import Block, BlockBuilder, Instruction, Literal, Phi, Variable
+from .operators import FUNCTIONS
+from .statements import IfStatement, Statement, WhileStatement
+
+
+class Lattice:
+    # Value is not known yet, optimistic start of every variable
+    TOP = object()
+    # Value differs between executions
+    BOTTOM = object()
+
+
+# Results of operators that are not folded, so that `9 ** 9 ** 9`
+# is not evaluated at build time
+MAX_EXPONENT = 256
+MAX_BITS = 4096
+
+
+def meet(lhs, rhs):
+    if lhs is Lattice.TOP:
+        return rhs
+    if rhs is Lattice.TOP or lhs is Lattice.BOTTOM:
+        return lhs
+    if rhs is Lattice.BOTTOM or type(lhs) is not type(rhs) or lhs != rhs:
+        return Lattice.BOTTOM
+    return lhs
+
+
+def too_large(operator: str, lhs, rhs) -> bool:
+    # Results that are not worth computing at build time
+    if operator in ("**", "<<"):
+        return not isinstance(rhs, (int, float)) or abs(rhs) > MAX_EXPONENT
+    if operator == "*":
+        for value, count in ((lhs, rhs), (rhs, lhs)):
+            if isinstance(value, (str, bytes)) and isinstance(count, int):
+                return len(value) * count > MAX_BITS
+    return False
+
+
+def evaluate(operator: str, lhs, rhs):
+    if lhs is Lattice.BOTTOM or rhs is Lattice.BOTTOM:
+        return Lattice.BOTTOM
+    if lhs is Lattice.TOP or rhs is Lattice.TOP:
+        return Lattice.TOP
+    function = FUNCTIONS.get(operator)
+    if function is None:
+        return Lattice.BOTTOM
+    if too_large(operator, lhs, rhs):
+        return Lattice.BOTTOM
+    try:
+        value = function(lhs, rhs)
+    except Exception:  # pylint: disable=broad-except
+        # Operation raises at run time, so it is not folded
+        return Lattice.BOTTOM
+    if isinstance(value, int) and value.bit_length() > MAX_BITS:
+        return Lattice.BOTTOM
+    if not isinstance(value, (int, float, complex, str, bytes, bool)):
+        return Lattice.BOTTOM
+    return value
+
+
+@dataclass
+class FoldedBranch:
+    # Condition of `if` with versions of variables
+    condition: str
+    taken: bool
+    # Statements of the branch that is never taken
+    removed: int
+
+
+@dataclass
+class SCCPReport:
+    # Variables with constant value
+    constants: int = 0
+    # Uses replaced with constants
+    replaced_uses: int = 0
+    folded: list[FoldedBranch] = field(default_factory=list)
+    unreachable_blocks: int = 0
+    removed_phis: int = 0
+
+    @property
+    def removed_statements(self) -> int:
+        return sum(branch.removed + 1 for branch in self.folded)
+
+    def summary(self) -> str:
+        lines = [
+            f"{self.constants} constants, {self.replaced_uses} uses replaced, "
+            f"{len(self.folded)} branches folded, "
+            f"{self.removed_statements} statements removed"
+        ]
+        for branch in self.folded:
+            lines.append(
+                f"  if {branch.condition}: always {branch.taken}, "
+                f"{branch.removed} statements removed"
+            )
+        return "\n".join(lines)
+
+
+# Wegman, Zadeck: "Constant Propagation with Conditional Branches".
+# Values of variables start at `TOP` and only go down the lattice, CFG
+# edges become executable as their branch conditions allow. Work is
+# driven by two worklists: new executable edges and SSA edges from
+# variables whose value changed to their uses. Constant conditions
+# of `if` are folded, the branch that is never taken is removed from
+# blocks and from statements. Loops are kept as they are.
+class SCCP:
+    def __init__(self, builder: BlockBuilder) -> None:
+        self.builder = builder
+        self.blocks = builder.blocks
+        self.values: dict[tuple[str, int], object] = {}
+        self.executable: set[tuple[int, int]] = set()
+        self.reached: set[int] = set()
+        self.function_of = builder.functions()
+        # Index is changed when folding is done, so that
+        # folding sees the program as it was propagated
+        self.defuse = builder.defuse
+        self.changed: list[Phi | Instruction] = []
+        self.removed: list[Phi | Instruction] = []
+
+    def value(self, part, block: int):
+        if isinstance(part, Literal):
+            return part.value
+        if not isinstance(part, Variable):
+            # Text in place of an expression that is not supported
+            return Lattice.BOTTOM
+        key = part.operand
+        source = self.defuse.defined_in(key)
+        if part.version == 0 or source is None:
+            return Lattice.BOTTOM
+        if self.function_of[source] != self.function_of[block]:
+            return Lattice.BOTTOM
+        return self.values.get(key, Lattice.TOP)
+
+    def expression(self, parts: list, block: int):
+        match parts:
+            case [operand]:
+                return self.value(operand, block)
+            case [lhs, str(operator), rhs] if not isinstance(operator, Literal):
+                return evaluate(
+                    operator.strip(), self.value(lhs, block), self.value(rhs, block)
+                )
+        return Lattice.BOTTOM
+
+    def run(self) -> SCCPReport:
+        with profiling.phase("sccp"):
+            self.__propagate()
+            report = self.__fold()
+            for site in self.changed:
+                self.defuse.update(site)
+            for site in self.removed:
+                self.defuse.remove(site)
+        profiling.count("constants", report.constants)
+        profiling.count("folded_branches", len(report.folded))
+        return report
+
+    def __propagate(self) -> None:
+        flow: list[tuple[int, int]] = [(-1, 0)]
+        ssa: list[tuple[str, int]] = []
+        while flow or ssa:
+            while flow:
+                edge = flow.pop()
+                if edge in self.executable:
+                    continue
+                self.executable.add(edge)
+                block = self.blocks[edge[1]]
+                for phi in block.phis:
+                    self.__visit_phi(block, phi, ssa)
+                if block._id in self.reached:
+                    continue
+                self.reached.add(block._id)
+                for instruction in block.instructions:
+                    self.__visit_instruction(block, instruction, ssa, flow)
+                if not self.__is_branch(block):
+                    flow.extend((block._id, target) for target in block.successors)
+
+            while ssa and not flow:
+                for block_id, user in self.defuse.users(ssa.pop()):
+                    if block_id not in self.reached:
+                        continue
+                    block = self.blocks[block_id]
+                    if isinstance(user, Phi):
+                        self.__visit_phi(block, user, ssa)
+                    else:
+                        self.__visit_instruction(block, user, ssa, flow)
+
+    def __set(self, variable: Variable, value, ssa: list) -> None:
+        key = variable.operand
+        if self.values.get(key, Lattice.TOP) is not value:
+            self.values[key] = value
+            ssa.append(key)
+
+    def __visit_phi(self, block: Block, phi: Phi, ssa: list) -> None:
+        value = Lattice.TOP
+        for predecessor, operand in zip(block.predecessors, phi.operands):
+            if (predecessor, block._id) in self.executable:
+                value = meet(value, self.value(operand, block._id))
+        self.__set(phi.target, value, ssa)
+
+    def __visit_instruction(
+        self, block: Block, instruction: Instruction, ssa: list, flow: list
+    ) -> None:
+        if instruction.defs:
+            assigned = instruction.parts[2:] if len(instruction.defs) == 1 else []
+            for variable in instruction.defs:
+                if assigned:
+                    value = self.expression(assigned, block._id)
+                else:
+                    # Parameters of function
+                    value = Lattice.BOTTOM
+                self.__set(variable, value, ssa)
+        elif instruction is block.instructions[-1] and self.__is_branch(block):
+            value = self.expression(instruction.parts, block._id)
+            if value is Lattice.TOP:
+                return
+            successors = block.successors
+            if value is Lattice.BOTTOM:
+                targets = successors
+            else:
+                targets = [successors[0] if value else successors[1]]
+            flow.extend((block._id, target) for target in targets)
+
+    @staticmethod
+    def __is_branch(block: Block) -> bool:
+        return (
+            bool(block.instructions)
+            and isinstance(block.instructions[-1].statement, IfStatement)
+            and len(block.successors) == 2
+        )
+
+    def __fold(self) -> SCCPReport:
+        report = SCCPReport()
+        report.constants = sum(
+            value is not Lattice.TOP and value is not Lattice.BOTTOM
+            for value in self.values.values()
+        )
+        report.unreachable_blocks = len(self.blocks) - len(self.reached)
+
+        # Taken branch of every folded `if` by `id` of its statement
+        folded: dict[int, list[Statement]] = {}
+        removed_lists: set[int] = set()
+        heads: set[int] = set()
+        for block in self.blocks:
+            value = self.__folded_condition(block)
+            if value is Lattice.BOTTOM:
+                continue
+            instruction = block.instructions.pop()
+            self.removed.append(instruction)
+            statement = instruction.statement
+            assert isinstance(statement, IfStatement)
+            taken, removed = statement.body, statement.orelse
+            if not value:
+                taken, removed = removed, taken
+            folded[id(statement)] = taken
+            removed_lists.update(statement_lists(removed))
+            removed_lists.add(id(statement))
+            heads.add(block._id)
+            report.folded.append(
+                FoldedBranch(
+                    "".join(str(part) for part in instruction.parts),
+                    bool(value),
+                    count_statements(removed),
+                )
+            )
+        if folded:
+            self.builder.replace_statements(folded)
+
+        # Blocks of removed branches, with empty blocks
+        # that only lead to them
+        removed_blocks = {
+            block._id
+            for block in self.blocks
+            if self.__in_lists(block, removed_lists)
+            or (
+                block._id not in self.reached
+                and not block.instructions
+                and block.phi_slot is None
+                and block.phi_statement is None
+            )
+        }
+
+        for block in self.blocks:
+            if block._id in removed_blocks:
+                report.removed_phis += len(block.phis)
+                self.removed.extend(block.phis)
+                self.removed.extend(block.instructions)
+                block.phis, block.instructions = [], []
+                block.successors, block.predecessors = [], []
+                block.phi_slot = None
+                continue
+            keep = [
+                predecessor not in removed_blocks
+                and (
+                    predecessor not in heads
+                    or (predecessor, block._id) in self.executable
+                )
+                for predecessor in block.predecessors
+            ]
+            block.predecessors = [
+                predecessor
+                for predecessor, kept in zip(block.predecessors, keep)
+                if kept
+            ]
+            if not all(keep):
+                for phi in block.phis:
+                    phi.operands = [
+                        operand for operand, kept in zip(phi.operands, keep) if kept
+                    ]
+                self.changed.extend(block.phis)
+            if block._id in self.reached:
+                self.__replace_uses(block, report)
+                report.removed_phis += self.__remove_constant_phis(block)
+        for block in self.blocks:
+            block.successors = [
+                successor
+                for successor in block.successors
+                if block._id in self.blocks[successor].predecessors
+            ]
+
+        kept = {
+            id(instruction)
+            for block in self.blocks
+            for instruction in block.instructions
+        }
+        self.builder.instructions = [
+            instruction
+            for instruction in self.builder.instructions
+            if id(instruction) in kept
+        ]
+        return report
+
+    def __folded_condition(self, block: Block):
+        # Value of `if` condition that is always the same
+        if block._id not in self.reached or not self.__is_branch(block):
+            return Lattice.BOTTOM
+        instruction = block.instructions[-1]
+        if isinstance(instruction.statement, WhileStatement):
+            return Lattice.BOTTOM
+        value = self.expression(instruction.parts, block._id)
+        return Lattice.BOTTOM if value is Lattice.TOP else value
+
+    @staticmethod
+    def __in_lists(block: Block, lists: set[int]) -> bool:
+        if block.phi_slot is not None and id(block.phi_slot[0]) in lists:
+            return True
+        if block.phi_statement is not None and id(block.phi_statement) in lists:
+            return True
+        return any(
+            id(instruction.statement) in lists for instruction in block.instructions
+        )
+
+    def __replace_uses(self, block: Block, report: SCCPReport) -> None:
+        for instruction in block.instructions:
+            defined = {id(variable) for variable in instruction.defs}
+            used = {id(variable) for variable in instruction.uses}
+            parts: list = []
+            for part in instruction.parts:
+                if id(part) in used and id(part) not in defined:
+                    value = self.value(part, block._id)
+                    if value is not Lattice.TOP and value is not Lattice.BOTTOM:
+                        part = Literal(value)
+                        report.replaced_uses += 1
+                parts.append(part)
+            # Constant right side of assignment is folded to its value
+            if len(instruction.defs) == 1 and len(parts) > 3:
+                value = self.values.get(instruction.defs[0].operand, Lattice.TOP)
+                if value is not Lattice.TOP and value is not Lattice.BOTTOM:
+                    parts = [parts[0], " = ", Literal(value)]
+            kept = {id(part) for part in parts}
+            instruction.parts = parts
+            uses = [variable for variable in instruction.uses if id(variable) in kept]
+            if len(uses) != len(instruction.uses):
+                instruction.uses = uses
+                self.changed.append(instruction)
+
+    def __remove_constant_phis(self, block: Block) -> int:
+        # Uses of constant phi are constants now, so the phi is
+        # dropped unless another phi reads it
+        phis = [
+            phi
+            for phi in block.phis
+            if self.values.get(phi.target.operand, Lattice.TOP)
+            in (Lattice.TOP, Lattice.BOTTOM)
+            or any(
+                isinstance(user, Phi)
+                for _, user in self.defuse.users(phi.target.operand)
+            )
+        ]
+        removed = len(block.phis) - len(phis)
+        kept = {id(phi) for phi in phis}
+        self.removed.extend(phi for phi in block.phis if id(phi) not in kept)
+        block.phis = phis
+        return removed
+
+
+def count_statements(statements: list[Statement]) -> int:
+    return sum(1 for _ in statement_lists(statements, nodes=True))
+
+
+def statement_lists(statements: list[Statement], nodes: bool = False):
+    # `id` of every nested list of statements, or every statement
+    stack = [statements]
+    while stack:
+        current = stack.pop()
+        if not nodes:
+            yield id(current)
+        for statement in current:
+            if nodes:
+                yield statement
+            else:
+                yield id(statement)
+            for attribute in ("body", "orelse"):
+                nested = getattr(statement, attribute, None)
+                if nested is not None:
+                    stack.append(nested)
+
+
+def sccp(builder: BlockBuilder) -> SCCPReport:
+    return SCCP(builder).run()
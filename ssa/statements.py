@@ -1,5 +1,6 @@
 from dataclasses import dataclass, field
-from typing import TypeVar
+from sys import intern
+from typing import Iterable, Iterator, TypeVar
 from enum import Enum, auto
 
 
@@ -17,43 +18,159 @@ class NodeType(Enum):
     END = auto()
 
 
-@dataclass
+class NameTable:
+    # Interns variable names as dense integer ids
+    __slots__ = ("names", "ids")
+
+    def __init__(self) -> None:
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, name: str) -> int:
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(intern(name))
+        return name_id
+
+    def __getitem__(self, name_id: int) -> str:
+        return self.names[name_id]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+NAMES = NameTable()
+
+# Piece of label: text or variable `(name, version)`
+Part = str | tuple[str, int]
+
+
+@dataclass(slots=True, init=False, repr=False)
 class NodeData:
     _id: int
     _type: NodeType
-    label: str
-
-
-@dataclass
+    # Label with `{}` in place of every operand
+    template: str
+    # Flat `(interned variable id, version)` pairs
+    operands: tuple[int, ...]
+
+    def __init__(self, _id: int, _type: NodeType, label: str = "") -> None:
+        self._id = _id
+        self._type = _type
+        self.template = label
+        self.operands = ()
+
+    @classmethod
+    def from_parts(cls, _id: int, _type: NodeType, parts: Iterable[Part]):
+        node = cls(_id, _type)
+        node.set_parts(parts)
+        return node
+
+    def set_parts(self, parts: Iterable[Part]) -> None:
+        ids = NAMES.ids
+        # `None` marks place of operand
+        pieces: list[str | None] = []
+        operands: list[int] = []
+        escape = False
+        for part in parts:
+            if isinstance(part, str):
+                pieces.append(part)
+                escape = escape or "{" in part or "}" in part
+            else:
+                pieces.append(None)
+                name_id = ids.get(part[0])
+                if name_id is None:
+                    name_id = NAMES.intern(part[0])
+                operands.append(name_id)
+                operands.append(part[1])
+        if not operands:
+            self.label = "".join(piece for piece in pieces if piece is not None)
+            return
+
+        template = []
+        for piece in pieces:
+            if piece is None:
+                template.append("{}")
+            elif escape:
+                template.append(piece.replace("{", "{{").replace("}", "}}"))
+            else:
+                template.append(piece)
+        # Same templates are shared between nodes
+        self.template = intern("".join(template))
+        self.operands = tuple(operands)
+
+    def variables(self) -> Iterator[tuple[int, int]]:
+        operands = self.operands
+        for i in range(0, len(operands), 2):
+            yield operands[i], operands[i + 1]
+
+    # Label is rendered only when it is needed
+    @property
+    def label(self) -> str:
+        if not self.operands:
+            return self.template
+        return self.template.format(
+            *(f"{NAMES[name_id]}.{version}" for name_id, version in self.variables())
+        )
+
+    @label.setter
+    def label(self, value: str) -> None:
+        self.template = value
+        self.operands = ()
+
+    def __repr__(self) -> str:
+        return f"NodeData(_id={self._id!r}, _type={self._type!r}, label={self.label!r})"
+
+    def __deepcopy__(self, memo) -> "NodeData":
+        # Template and operands are immutable
+        node = NodeData(self._id, self._type, self.template)
+        node.operands = self.operands
+        return node
+
+    # Interned ids are local to the process, so names are pickled instead
+    def __getstate__(self):
+        names = tuple(NAMES[name_id] for name_id, _ in self.variables())
+        return self._id, self._type, self.template, self.operands, names
+
+    def __setstate__(self, state) -> None:
+        self._id, self._type, self.template, operands, names = state
+        self.operands = tuple(
+            NAMES.intern(names[i // 2]) if i % 2 == 0 else value
+            for i, value in enumerate(operands)
+        )
+
+
+@dataclass(slots=True)
 class Statement:
     node: NodeData
 
 
-@dataclass
+@dataclass(slots=True)
 class IfStatement(Statement):
     body: list[Statement] = field(default_factory=list)
     orelse: list[Statement] = field(default_factory=list)
 
 
 class WhileStatement(IfStatement):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True)
 class BreakStatement(Statement):
     while_statement: Statement
 
 
-@dataclass
+@dataclass(slots=True)
 class ContinueStatement(Statement):
     while_statement: Statement
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionStatement(Statement):
     body: list[Statement] = field(default_factory=list)
 
-@dataclass
+@dataclass(slots=True)
 class ReturnStatement(Statement):
     end_of_function_statement: Statement | None = None
 
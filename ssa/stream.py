@@ -0,0 +1,99 @@
+from itertools import chain
+from json import dumps
+from pathlib import Path
+from typing import Any, Generator, Iterator, TextIO
+
+from .builder import CFGBuilder
+from .cfg import ControlFlowGraph, EdgeCollector, EdgeKind, edge_label
+from .statements import NAMES, Statement
+
+Record = dict[str, Any]
+
+
+def record(
+    statement: Statement,
+    parent: int | None,
+    successors: list[tuple[int, EdgeKind]],
+    labels: bool = True,
+) -> Record:
+    node = statement.node
+    data: Record = {"id": node._id, "type": node._type.name, "parent": parent}
+    if labels:
+        data["label"] = node.label
+    else:
+        data["template"] = node.template
+        data["operands"] = [
+            [NAMES[name_id], version] for name_id, version in node.variables()
+        ]
+    data["successors"] = [target for target, _ in successors]
+    data["edges"] = [edge_label(kind) for _, kind in successors]
+    return data
+
+
+def iter_records(builder: CFGBuilder, *, labels: bool = True) -> Iterator[Record]:
+    # Edges leave a region only to the next one, and loops at the end
+    # of a region are left to the first node of the next one, so
+    # a region is walked once the next region is built and its records
+    # are ready once the next region is walked. Builder made with
+    # `lazy=True` builds regions while records are consumed and drops
+    # statements of regions whose records are written, so it keeps
+    # about two regions of statements. AST of the module is parsed at
+    # once, so peak memory still grows with it. Lazy builder can be
+    # streamed only once.
+    collector = EdgeCollector(builder.node_after_while)
+    frontier: list[Statement] = []
+    waiting: list[tuple[Statement, int | None]] = []
+    # Edges from nodes of regions whose records are not written
+    edges: list[tuple[int, int, EdgeKind]] = []
+    built: list[Statement] = []
+    for statements in chain(builder.build_regions(), [[]]):
+        # Loops of the builder restore the map from its copy
+        collector.node_after_while = builder.node_after_while
+        frontier = collector.walk(built, frontier)
+        built = statements
+        ready, waiting = waiting, collector.nodes
+        collector.nodes = []
+        collector.functions.clear()
+        edges.extend(collector.edges)
+        collector.edges.clear()
+        edges = yield from _records(ready, waiting, edges, labels)
+        if builder.lazy and waiting:
+            builder.forget(min(statement.node._id for statement, _ in waiting))
+    yield from _records(waiting, [], edges, labels)
+
+
+def _records(
+    ready: list[tuple[Statement, int | None]],
+    waiting: list[tuple[Statement, int | None]],
+    edges: list[tuple[int, int, EdgeKind]],
+    labels: bool,
+) -> Generator[Record, None, list[tuple[int, int, EdgeKind]]]:
+    # Records of ready nodes from the graph of ready and waiting nodes,
+    # edges of waiting nodes are returned for the next region
+    ready_ids = {statement.node._id for statement, _ in ready}
+    graph = ControlFlowGraph(
+        ready + waiting,
+        [edge for edge in edges if edge[0] in ready_ids],
+    )
+    for node in range(len(ready)):
+        parent = graph.parents[node]
+        yield record(
+            graph.statement(node),
+            None if parent == -1 else graph.node_ids[parent],
+            [
+                (graph.node_ids[target], kind)
+                for target, kind in graph.node_successors(node)
+            ],
+            labels,
+        )
+    return [edge for edge in edges if edge[0] not in ready_ids]
+
+
+def stream(input_code: Path, *, labels: bool = True, **options) -> Iterator[Record]:
+    return iter_records(CFGBuilder(input_code, lazy=True, **options), labels=labels)
+
+
+def write_jsonl(records: Iterator[Record], file: TextIO) -> None:
+    for item in records:
+        file.write(dumps(item, ensure_ascii=False))
+        file.write("\n")
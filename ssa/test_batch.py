@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from ssa import batch
+from ssa.batch import BatchOptions, main, run_batch
+
+EXAMPLES = Path(__file__).parent.parent / "tests"
+
+
+def test_missing_input_with_cache(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    missing = tmp_path / "missing.py"
+    code = main(
+        [
+            str(EXAMPLES / "fib.py"),
+            str(missing),
+            "-f",
+            "raw",
+            "-j",
+            "1",
+            "-o",
+            str(tmp_path / "out"),
+            "--cache-dir",
+            str(tmp_path / "cache"),
+        ]
+    )
+    assert code == 1
+    printed = capsys.readouterr().out
+    assert f"FAILED {missing}: FileNotFoundError" in printed
+    assert "2 files: 1 succeeded, 1 failed" in printed
+
+
+def test_crash_fails_only_its_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Workers are forked, so they see the patched `process_file`
+    process_file = batch.process_file
+
+    def crash(path: Path, options: BatchOptions) -> batch.BatchResult:
+        if path.name == "crash.py":
+            os._exit(1)
+        return process_file(path, options)
+
+    monkeypatch.setattr(batch, "process_file", crash)
+    source = (EXAMPLES / "fib.py").read_text(encoding="utf-8")
+    paths = []
+    for name in ("a", "b", "crash", "c", "d", "e"):
+        paths.append(tmp_path / f"{name}.py")
+        paths[-1].write_text(source, encoding="utf-8")
+
+    options = BatchOptions(output_formats=("raw",), output_dir=tmp_path / "out")
+    results = run_batch(paths, options, workers=3)
+    assert [result.path for result in results] == paths
+    for result in results:
+        if result.path.name == "crash.py":
+            assert result.error is not None
+            assert result.error.startswith("worker crashed")
+        else:
+            assert result.ok, result.error
+            assert result.outputs[0].read_text(encoding="utf-8")
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import pytest
+
+from ssa.builder import CFGBuilder, SSABackend
+from ssa.cfg import ControlFlowGraph, EdgeCollector
+from ssa.passes import OPTIMIZE
+
+PROGRAMS = sorted((Path(__file__).parent.parent / "tests").glob("*.py"))
+
+
+@pytest.mark.parametrize("path", PROGRAMS, ids=lambda path: path.name)
+@pytest.mark.parametrize(
+    "backend", [SSABackend.DOMINANCE_FRONTIER, SSABackend.ON_THE_FLY]
+)
+@pytest.mark.parametrize("passes", [(), OPTIMIZE], ids=["none", "optimize"])
+def test_rows_of_blocks(
+    path: Path, backend: SSABackend, passes: tuple[str, ...]
+) -> None:
+    builder = CFGBuilder(path, backend=backend, passes=list(passes))
+    assert builder.lowered is not None
+    blocks = builder.lowered.blocks
+    graph = ControlFlowGraph.from_blocks(blocks)
+
+    assert graph.num_blocks == len(blocks)
+    for block in blocks:
+        assert list(graph.successors[block._id]) == block.successors
+        assert list(graph.predecessors[block._id]) == block.predecessors
+        assert [graph.statement(node) for node in graph.instructions(block._id)] == [
+            instruction.statement for instruction in block.instructions
+        ]
+
+
+@pytest.mark.parametrize("path", PROGRAMS, ids=lambda path: path.name)
+@pytest.mark.parametrize("backend", list(SSABackend), ids=lambda backend: backend.name)
+def test_edges_of_nodes(path: Path, backend: SSABackend) -> None:
+    builder = CFGBuilder(path, backend=backend)
+    graph = ControlFlowGraph.from_builder(builder)
+    collector = EdgeCollector(builder.node_after_while)
+    collector.walk(builder.statements, [])
+
+    assert graph.statements == [statement for statement, _ in collector.nodes]
+    drawn = {statement.node._id for statement, _ in collector.nodes}
+    edges = sorted(edge for edge in collector.edges if edge[1] in drawn)
+    assert edges == sorted(
+        (graph.node_ids[node], graph.node_ids[target], kind)
+        for node in range(graph.num_nodes)
+        for target, kind in graph.node_successors(node)
+    )
+    assert edges == sorted(
+        (graph.node_ids[source], graph.node_ids[node], kind)
+        for node in range(graph.num_nodes)
+        for source, kind in graph.node_predecessors(node)
+    )
+
+    # Blocks are straight runs, only their last node branches
+    for block in range(graph.num_blocks):
+        for node in graph.instructions(block)[:-1]:
+            assert list(graph.node_successors(node)) == [(node + 1, 0)]
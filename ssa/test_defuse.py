@@ -0,0 +1,81 @@
+from collections import Counter
+from pathlib import Path
+from re import compile as regex
+
+import pytest
+
+from ssa.builder import CFGBuilder, LoopMode, SSABackend
+from ssa.cfg import ControlFlowGraph
+from ssa.lowering import Instruction, Phi
+from ssa.statements import NodeType
+
+PROGRAMS = sorted((Path(__file__).parent.parent / "tests").glob("*.py"))
+
+VALUE = regex(r"\b([A-Za-z_]\w*)\.(\d+)\b")
+TARGET = regex(r"^([A-Za-z_]\w*)\.(\d+) = ")
+
+
+def scan(graph: ControlFlowGraph) -> tuple[dict, Counter]:
+    # Definitions and uses of values found in labels
+    definitions = {}
+    uses: Counter = Counter()
+    for statement in graph.statements:
+        node = statement.node
+        if not node.operands:
+            continue
+        for line in node.label.split("\n"):
+            values = [(name, int(version)) for name, version in VALUE.findall(line)]
+            if node._type is NodeType.FUNCTION_DEF:
+                targets = values
+            elif node._type is NodeType.ASSIGN and TARGET.match(line):
+                targets = values[:1]
+            else:
+                targets = []
+            for value in targets:
+                definitions[value] = statement
+            for value in values[len(targets) :]:
+                uses[value, node._id] += 1
+    return definitions, uses
+
+
+@pytest.mark.parametrize("path", PROGRAMS, ids=lambda path: path.name)
+@pytest.mark.parametrize("loop_mode", list(LoopMode), ids=lambda mode: mode.name)
+def test_structured_labels(path: Path, loop_mode: LoopMode) -> None:
+    builder = CFGBuilder(path, loop_mode=loop_mode)
+    definitions, uses = scan(ControlFlowGraph.from_builder(builder))
+
+    index = builder.defuse
+    assert builder.defuse is index
+    for value, statement in definitions.items():
+        assert index.definition(value) is statement
+    for (value, node_id), count in uses.items():
+        found = [site.node._id for _, site in index.users(value)]
+        assert found.count(node_id) == count
+    names = {name for name, _ in (*definitions, *(value for value, _ in uses))}
+    for name in names:
+        assert index.versions(name) == sorted(
+            {version for value_name, version in definitions if value_name == name}
+            | {version for (value_name, version), _ in uses if value_name == name}
+        )
+
+
+@pytest.mark.parametrize("path", PROGRAMS, ids=lambda path: path.name)
+@pytest.mark.parametrize(
+    "backend", [SSABackend.DOMINANCE_FRONTIER, SSABackend.ON_THE_FLY]
+)
+def test_block_sites(path: Path, backend: SSABackend) -> None:
+    builder = CFGBuilder(path, backend=backend)
+    assert builder.lowered is not None
+    assert builder.defuse is builder.lowered.defuse
+    for block in builder.lowered.blocks:
+        sites: list[Phi | Instruction] = [*block.phis, *block.instructions]
+        for site in sites:
+            for variable in site.defs:
+                assert builder.defuse.definition(variable.operand) is site
+                assert builder.defuse.defined_in(variable.operand) == block._id
+            for variable in site.uses:
+                assert any(
+                    user is site
+                    for user_block, user in builder.defuse.users(variable.operand)
+                    if user_block == block._id
+                )
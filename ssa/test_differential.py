@@ -0,0 +1,58 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+from ssa.builder import CFGBuilder, SSABackend
+from ssa.codegen import python_source
+from ssa.interpreter import interpret
+from ssa.liveness import SSAForm
+from ssa.passes import OPTIMIZE
+
+# Example programs, `test_inner_if.py` waits for input
+PROGRAMS = sorted(
+    path
+    for path in (Path(__file__).parent.parent / "tests").glob("*.py")
+    if path.name != "test_inner_if.py"
+)
+
+# Both block backends with every form they build and with and without passes
+CONFIGS = [
+    (backend, form, passes)
+    for backend, forms in (
+        (SSABackend.DOMINANCE_FRONTIER, list(SSAForm)),
+        (SSABackend.ON_THE_FLY, [SSAForm.MINIMAL]),
+    )
+    for form in forms
+    for passes in ((), OPTIMIZE)
+]
+
+
+def printed(source: str, path: str) -> str:
+    code = compile(source, path, "exec")
+    output = StringIO()
+    with redirect_stdout(output):
+        exec(code, {"__name__": "__main__"})  # pylint: disable=exec-used
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("path", PROGRAMS, ids=lambda path: path.name)
+@pytest.mark.parametrize(
+    "backend, form, passes",
+    CONFIGS,
+    ids=lambda config: getattr(config, "name", None) or ",".join(config) or "none",
+)
+def test_same_output_as_python(
+    path: Path, backend: SSABackend, form: SSAForm, passes: tuple[str, ...]
+) -> None:
+    expected = printed(path.read_text(encoding="utf-8"), str(path))
+    builder = CFGBuilder(path, backend=backend, form=form, passes=list(passes))
+    assert builder.lowered is not None
+
+    output = StringIO()
+    with redirect_stdout(output):
+        interpret(builder.lowered)
+    assert output.getvalue() == expected
+
+    assert printed(python_source(builder.lowered), "<ssa>") == expected
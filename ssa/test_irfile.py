@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+
+from ssa.builder import CFGBuilder, SSABackend
+from ssa.cfg import EdgeCollector
+from ssa.irfile import SUFFIX, IRFile, write_ir
+from ssa.statements import NAMES
+
+PROGRAMS = sorted((Path(__file__).parent.parent / "tests").glob("*.py"))
+
+
+@pytest.mark.parametrize("path", PROGRAMS, ids=lambda path: path.name)
+@pytest.mark.parametrize("backend", list(SSABackend), ids=lambda backend: backend.name)
+def test_round_trip(path: Path, backend: SSABackend, tmp_path: Path) -> None:
+    builder = CFGBuilder(path, backend=backend)
+    ir_path = tmp_path / path.with_suffix(SUFFIX).name
+    with open(ir_path, "wb") as file:
+        write_ir(builder, file)
+
+    collector = EdgeCollector(builder.node_after_while)
+    collector.walk(builder.statements, [])
+    index = {
+        statement.node._id: node for node, (statement, _) in enumerate(collector.nodes)
+    }
+    with IRFile(ir_path) as loaded:
+        assert len(loaded) == len(collector.nodes)
+        for node, (statement, parent) in enumerate(collector.nodes):
+            assert loaded.find(statement.node._id) == node
+            assert loaded.node_id(node) == statement.node._id
+            assert loaded.node_type(node) is statement.node._type
+            assert loaded.label(node) == statement.node.label
+            assert loaded.operands(node) == [
+                (NAMES[name_id], version)
+                for name_id, version in statement.node.variables()
+            ]
+            assert loaded.parent(node) == (None if parent is None else index[parent])
+
+        # Edges to nodes that are not drawn are dropped
+        edges = sorted(
+            (index[source], index[target], kind)
+            for source, target, kind in collector.edges
+            if target in index
+        )
+        assert edges == sorted(
+            (node, target, kind)
+            for node in range(len(loaded))
+            for target, kind in loaded.successors(node)
+        )
+        for source, target, _ in edges:
+            assert source in loaded.predecessors(target)
+        assert [name for name, _ in loaded.functions()] == [
+            function.node.label.split("(")[0].removeprefix("def ")
+            for function, _ in collector.functions
+        ]
@@ -0,0 +1,16 @@
+v0 = 1
+v1 = 3
+v2 = 2
+v3 = 1
+v4 = 1
+while v0 < v1:
+    for i0 in range(5):
+        while v2 < v3:
+            v0 = v1 * v1
+        if v3 < v2:
+            break
+    if v3 <= v0:
+        break
+    v3 = v3 + v4
+print(v0)
+print(v3)